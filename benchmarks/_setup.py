@@ -0,0 +1,45 @@
+"""Shared setup for the benchmark scripts.
+
+Imports the app on a throwaway SQLite file (or on BENCH_DATABASE_URL,
+e.g. a scratch PostgreSQL database) and upgrades its schema. Import it
+before anything from src.
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+os.environ.setdefault('EVENTS_BACKEND', 'local')
+os.environ.setdefault('METRICS_ENABLED', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app, upgrade_database  # noqa: E402
+from src.database import db  # noqa: E402
+
+with app.app_context():
+    upgrade_database()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def summarize(label, seconds):
+    """One result line: count, p50 / p95 / max in milliseconds"""
+    print(f'{label}: n={len(seconds)} p50={percentile(seconds, 0.5) * 1000:.1f}ms '
+          f'p95={percentile(seconds, 0.95) * 1000:.1f}ms max={max(seconds, default=0) * 1000:.1f}ms')
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def login_as(client, user_id, role='admin'):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['role'] = role
@@ -0,0 +1,104 @@
+"""Latency of opening a patient chart (GET /api/patients/<id>/timeline).
+
+    python benchmarks/chart_open.py --patients 20000 --encounters 2000
+
+Seeds --patients patients with a few encounters each, plus one patient
+with --encounters visits, admissions, surgeries and emergency cases.
+It times the first page of a typical and of the heavy chart, and paging
+through the whole heavy chart with ?before=, and reports the SQL
+statements per request.
+"""
+import argparse
+import random
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import event, insert
+from _setup import app, db, login_as, summarize, timed
+from src.models.patient import ClinicVisit, EmergencyCase, Patient, Surgery, WardAdmission
+
+BATCH = 20000
+FIRST_DAY = date(2015, 1, 1)
+
+
+def encounters(patient_id, count):
+    """Rows of every kind for one patient, on random days of the last ten years"""
+    def day():
+        return FIRST_DAY + timedelta(days=random.randrange(3650))
+    visits, admissions, surgeries, cases = [], [], [], []
+    for _ in range(count):
+        visits.append({'patient_id': patient_id, 'visit_date': day(), 'visit_time': time(random.randrange(8, 18)),
+                       'status': 'مكتمل', 'complaint': 'متابعة'})
+        admissions.append({'patient_id': patient_id, 'admission_date': datetime.combine(day(), time(10)),
+                           'status': 'خرج', 'diagnosis': 'ملاحظة'})
+        surgeries.append({'patient_id': patient_id, 'surgery_type': 'منظار', 'surgery_date': day(),
+                          'surgery_time': time(random.randrange(7, 15)), 'operating_room': 'OR1',
+                          'duration': '1 ساعة', 'status': 'مكتملة'})
+        cases.append({'patient_id': patient_id, 'arrival_time': datetime.combine(day(), time(random.randrange(24))),
+                      'complaint': 'ألم', 'priority': 'عادي', 'severity': 4, 'status': 'خرج'})
+    return visits, admissions, surgeries, cases
+
+
+def seed(patients, heavy):
+    random.seed(1)
+    with db.engine.begin() as conn:
+        for start in range(0, patients, BATCH):
+            conn.execute(insert(Patient), [
+                {'name': f'مريض {i}', 'age': 40, 'national_id': f'C{i}', 'search_text': f'مريض {i}'}
+                for i in range(start, min(start + BATCH, patients))
+            ])
+        tables = ([], [], [], [])
+        for patient_id in range(2, patients + 1):
+            for rows, new in zip(tables, encounters(patient_id, 3)):
+                rows.extend(new)
+        for rows, new in zip(tables, encounters(1, heavy)):
+            rows.extend(new)
+        for model, rows in zip((ClinicVisit, WardAdmission, Surgery, EmergencyCase), tables):
+            for start in range(0, len(rows), BATCH):
+                conn.execute(insert(model), rows[start:start + BATCH])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--encounters', type=int, default=2000, help='Encounters of each kind for the heavy chart')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    with app.app_context():
+        _, seconds = timed(seed, args.patients, args.encounters)
+        print(f'seeded {args.patients} patients in {seconds:.1f}s')
+        client = app.test_client()
+        login_as(client, 1)
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *_: statements.append(1))
+
+        for label, patient_id in (('typical chart, first page', args.patients // 2), ('heavy chart, first page', 1)):
+            seconds = []
+            statements.clear()
+            for _ in range(args.repeat):
+                response, elapsed = timed(client.get, f'/api/patients/{patient_id}/timeline')
+                assert response.status_code == 200, response.get_data()
+                seconds.append(elapsed)
+            summarize(label, seconds)
+            print(f'  {len(statements) / args.repeat:.0f} statements per request')
+
+        seconds = []
+        statements.clear()
+        items = 0
+        cursor = None
+        while True:
+            url = '/api/patients/1/timeline?limit=100' + (f'&before={cursor}' if cursor else '')
+            response, elapsed = timed(client.get, url)
+            page = response.get_json()
+            seconds.append(elapsed)
+            items += len(page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        summarize(f'heavy chart, all {items} items in pages of 100', seconds)
+        print(f'  {len(statements) / len(seconds):.0f} statements per page')
+
+
+if __name__ == '__main__':
+    main()
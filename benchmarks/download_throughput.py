@@ -0,0 +1,99 @@
+"""Download throughput of /api/files/<id>/download.
+
+    python benchmarks/download_throughput.py --size-mb 20 --threads 4 --requests 40
+
+Uploads one file of --size-mb random bytes, then times, with --threads
+concurrent clients: full downloads streamed by the worker
+(FILE_SEND_MODE=python), 64 KB Range requests from the middle of the
+file, conditional requests answered with 304, and the same download
+handed off to nginx (x-accel, where the worker only sends headers).
+The file is deleted again at the end.
+"""
+import argparse
+import io
+import os
+import threading
+
+from sqlalchemy import insert
+from _setup import app, db, login_as, summarize, timed
+from src.models.patient import Patient
+from src.routes import medical_files
+
+RANGE_SIZE = 64 * 1024
+
+
+def run(threads, requests, fetch):
+    """Call fetch(client) ``requests`` times spread over ``threads`` clients; returns (seconds, bytes, wall time)"""
+    seconds = []
+    received = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        login_as(client, 1)
+        for _ in range(count):
+            size, elapsed = timed(fetch, client)
+            with lock:
+                seconds.append(elapsed)
+                received.append(size)
+
+    share = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(count,)) for count in share]
+    _, wall = timed(lambda: ([t.start() for t in pool], [t.join() for t in pool]))
+    return seconds, sum(received), wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent downloads (gunicorn --threads)')
+    parser.add_argument('--requests', type=int, default=40)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    with app.app_context():
+        patient_id = db.session.execute(insert(Patient).values(name='مريض', age=40)).inserted_primary_key[0]
+        db.session.commit()
+
+    client = app.test_client()
+    login_as(client, 1)
+    response = client.post(f'/api/patients/{patient_id}/files/upload', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(os.urandom(size)), 'scan.pdf'), 'category': 'radiology'})
+    assert response.status_code == 201, response.get_data()
+    file_id = response.get_json()['file']['id']
+    url = f'/api/files/{file_id}/download'
+    etag = client.get(url).headers['ETag']
+
+    def full(client):
+        response = client.get(url)
+        assert response.status_code == 200
+        return len(response.get_data())
+
+    def ranged(client):
+        start = size // 2
+        response = client.get(url, headers={'Range': f'bytes={start}-{start + RANGE_SIZE - 1}'})
+        assert response.status_code == 206
+        return len(response.get_data())
+
+    def conditional(client):
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        return 0
+
+    try:
+        for label, fetch in (('full download (python)', full), ('64 KB range', ranged), ('304 revalidation', conditional)):
+            seconds, received, wall = run(args.threads, args.requests, fetch)
+            summarize(label, seconds)
+            if fetch is full:
+                print(f'  {received / wall / (1024 * 1024):.0f} MB/s with {args.threads} threads')
+
+        medical_files.FILE_SEND_MODE = 'x-accel'
+        seconds, _, _ = run(args.threads, args.requests, full)
+        summarize('full download (x-accel handoff, headers only)', seconds)
+    finally:
+        medical_files.FILE_SEND_MODE = 'python'
+        client.delete(f'/api/files/{file_id}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Login throughput and the latency other requests see during a login burst.
+
+    python benchmarks/login_throughput.py --threads 8 --seconds 10
+    PASSWORD_HASH_WORKERS=8 python benchmarks/login_throughput.py
+
+Every thread logs in repeatedly with its own test client, the way
+gunicorn's gthread workers would serve concurrent logins, while one
+probe thread times a cheap authenticated GET.
+"""
+import argparse
+import threading
+import time
+
+from _setup import app, db, summarize, timed
+from src.models.auth import User
+from src.services.passwords import PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, hash_password
+
+PASSWORD = 'benchmark-password'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent logins (gunicorn --threads)')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        password_hash = hash_password(PASSWORD)
+        for i in range(args.threads):
+            db.session.add(User(username=f'bench{i}', email=f'bench{i}@example.com', full_name='bench',
+                                password_hash=password_hash))
+        db.session.commit()
+
+    deadline = time.monotonic() + args.seconds
+    logins = []
+    probes = []
+
+    def log_in(i):
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            response, seconds = timed(client.post, '/api/auth/login',
+                                      json={'username': f'bench{i}', 'password': PASSWORD})
+            assert response.status_code == 200, response.get_data()
+            logins.append(seconds)
+
+    def probe():
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            _, seconds = timed(client.get, '/api/auth/check-session')
+            probes.append(seconds)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=log_in, args=(i,)) for i in range(args.threads)]
+    threads.append(threading.Thread(target=probe))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f'method={PASSWORD_HASH_METHOD} pool={PASSWORD_HASH_WORKERS} threads={args.threads}')
+    print(f'logins/s: {len(logins) / args.seconds:.1f}')
+    summarize('login', logins)
+    summarize('other requests during the burst', probes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""List and statistics latency on a large table: keyset pages, OFFSET, and the indexes.
+
+    python benchmarks/pagination.py --rows 1000000
+
+Fills clinic_visits with --rows visits over three years (ids follow
+the visit dates, give or take a week, as they do in real use),
+rows / 100 patients and rows / 10 each of ward admissions, surgeries
+and emergency cases, and times, through the test client:
+
+- the first page and a page deep in the table with ?after= (keyset),
+- the same deep page fetched with OFFSET, for comparison,
+- a one-week ?from=/?to= page with ix_clinic_visits_visit_date, and
+  again after dropping that index,
+- /api/statistics with its cache cleared before each request, with the
+  indexes its counters use and again after dropping them, plus a cached
+  request.
+"""
+import argparse
+import random
+from datetime import date, time, timedelta
+
+from sqlalchemy import insert, text
+from _setup import app, db, login_as, summarize, timed
+from src.models.patient import ClinicVisit, EmergencyCase, Patient, Surgery, WardAdmission
+from src.routes.patient import invalidate_statistics
+
+BATCH = 20000
+STATUSES = ('قيد الانتظار', 'مؤكد', 'ملغي', 'مكتمل')
+FIRST_DAY = date(2023, 1, 1)
+# The indexes behind the /api/statistics counters
+STATISTICS_INDEXES = (
+    'ix_clinic_visits_visit_date', 'ix_ward_admissions_status', 'ix_surgeries_surgery_date_status',
+    'ix_emergency_cases_status_arrival_time', 'ix_emergency_cases_status_severity_arrival'
+)
+
+
+def seed(rows):
+    random.seed(1)
+    patients = max(1, rows // 100)
+    with db.engine.begin() as conn:
+        for start in range(0, patients, BATCH):
+            conn.execute(insert(Patient), [
+                {'name': f'مريض {i}', 'age': 20 + i % 60, 'phone': f'05{i:08d}', 'national_id': f'B{i}',
+                 'search_text': f'مريض {i}'}
+                for i in range(start, min(start + BATCH, patients))
+            ])
+        for start in range(0, rows, BATCH):
+            conn.execute(insert(ClinicVisit), [
+                {'patient_id': random.randint(1, patients),
+                 'visit_date': FIRST_DAY + timedelta(days=max(0, i * 3 * 365 // rows + random.randint(-7, 7))),
+                 'visit_time': time(8 + random.randrange(10), random.randrange(60)),
+                 'status': random.choice(STATUSES), 'complaint': 'متابعة'}
+                for i in range(start, min(start + BATCH, rows))
+            ])
+        seed_statistics(conn, rows // 10, patients)
+    return patients
+
+
+def seed_statistics(conn, rows, patients):
+    """Admissions, surgeries and emergency cases, nearly all of them finished"""
+    days = (date.today() - FIRST_DAY).days
+    for start in range(0, rows, BATCH):
+        batch = range(start, min(start + BATCH, rows))
+        conn.execute(insert(WardAdmission), [
+            # Admitted patients need a bed of their own
+            {'patient_id': random.randint(1, patients), 'room_number': f'R{i}', 'bed_number': '1',
+             'status': 'منوم' if i % 50 == 0 else 'خرج'}
+            for i in batch
+        ])
+        conn.execute(insert(Surgery), [
+            {'patient_id': random.randint(1, patients), 'surgery_type': 'استئصال',
+             'surgery_date': FIRST_DAY + timedelta(days=random.randint(0, days + 30)), 'surgery_time': time(9),
+             'status': random.choice(('مكتملة', 'مكتملة', 'ملغاة', 'مجدولة'))}
+            for i in batch
+        ])
+        conn.execute(insert(EmergencyCase), [
+            {'patient_id': random.randint(1, patients), 'complaint': 'ألم', 'priority': 'متوسط', 'severity': 3,
+             'status': 'في الانتظار' if i % 100 == 0 else 'تم الخروج'}
+            for i in batch
+        ])
+
+
+def measure_statistics(client, label, repeat):
+    """Time /api/statistics computing its counters, not answering from the cache"""
+    def uncached():
+        invalidate_statistics()
+        return client.get('/api/statistics')
+
+    seconds = []
+    for _ in range(repeat):
+        response, elapsed = timed(uncached)
+        assert response.status_code == 200, response.get_data()
+        seconds.append(elapsed)
+    summarize(label, seconds)
+
+
+def measure(client, label, url, repeat):
+    seconds = []
+    for _ in range(repeat):
+        response, elapsed = timed(client.get, url)
+        assert response.status_code == 200, response.get_data()
+        seconds.append(elapsed)
+    summarize(label, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        (_, seed_seconds) = timed(seed, args.rows)
+        print(f'seeded {args.rows} visits in {seed_seconds:.1f}s')
+        client = app.test_client()
+        login_as(client, 1)
+        depth = args.rows * 9 // 10
+        after = args.rows - depth
+
+        measure(client, 'first page (limit=50)', '/api/clinic-visits?limit=50', args.repeat)
+        measure(client, f'keyset page at depth {depth} (after={after})',
+                f'/api/clinic-visits?limit=50&after={after}', args.repeat)
+
+        offset_seconds = []
+        for _ in range(args.repeat):
+            _, elapsed = timed(lambda: ClinicVisit.query.order_by(ClinicVisit.id.desc()).offset(depth).limit(50).all())
+            offset_seconds.append(elapsed)
+        db.session.rollback()
+        summarize(f'OFFSET {depth} page (query only)', offset_seconds)
+
+        week = '/api/clinic-visits?limit=50&from=2024-06-01&to=2024-06-07'
+        measure(client, 'one-week date filter, indexed', week, args.repeat)
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP INDEX ix_clinic_visits_visit_date'))
+        measure(client, 'one-week date filter, no date index', week, args.repeat)
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE INDEX ix_clinic_visits_visit_date ON clinic_visits (visit_date)'))
+
+        indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+        measure_statistics(client, 'statistics, uncached, indexed', args.repeat)
+        measure(client, 'statistics, cached', '/api/statistics', args.repeat)
+        with db.engine.begin() as conn:
+            for name in STATISTICS_INDEXES:
+                indexes[name].drop(conn)
+        measure_statistics(client, 'statistics, uncached, no statistics indexes', args.repeat)
+        with db.engine.begin() as conn:
+            for name in STATISTICS_INDEXES:
+                indexes[name].create(conn)
+
+
+if __name__ == '__main__':
+    main()
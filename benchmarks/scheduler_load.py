@@ -0,0 +1,86 @@
+"""Concurrent operating-room bookings: throughput, latency and double bookings.
+
+    python benchmarks/scheduler_load.py --threads 8 --requests 2000 --rooms 4
+    python benchmarks/scheduler_load.py --no-lock   # what happens without the room lock
+
+Each thread posts surgeries at random times over one week into a few
+rooms, so many requests race for the same slots. Afterwards every room
+is checked for active surgeries that overlap.
+"""
+import argparse
+import random
+import threading
+import time
+
+from _setup import app, db, login_as, summarize, timed
+from src.models.patient import Patient, Surgery
+from src.services import scheduler
+from src.services.scheduler import INACTIVE_STATUSES, RoomSchedule, surgery_interval
+
+
+def double_bookings():
+    schedules = {}
+    for surgery in Surgery.query.filter(Surgery.status.notin_(INACTIVE_STATUSES)):
+        start, end = surgery_interval(surgery.surgery_date, surgery.surgery_time, surgery.duration)
+        schedule = schedules.setdefault(surgery.operating_room, RoomSchedule())
+        schedule.add(start, end, surgery.id)
+    return sum(
+        len(schedule.overlapping(start, end, surgery_id))
+        for schedule in schedules.values()
+        for start, end, surgery_id in zip(schedule.starts, schedule.ends, schedule.ids)
+    ) // 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help='Bookings attempted in total')
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--no-lock', action='store_true', help='Disable the room lock to show the race')
+    args = parser.parse_args()
+
+    if args.no_lock:
+        scheduler.lock_room_days = lambda room, start, end: None
+
+    with app.app_context():
+        db.session.add(Patient(name='مريض', age=40))
+        db.session.commit()
+
+    results = {201: [], 409: []}
+    lock = threading.Lock()
+
+    def worker(count, seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        login_as(client, 1)
+        for _ in range(count):
+            response, seconds = timed(client.post, '/api/surgeries', json={
+                'patient_id': 1, 'surgery_type': 'منظار',
+                'surgery_date': f'2025-03-{rng.randint(1, 7):02d}',
+                'surgery_time': f'{rng.randrange(24):02d}:{rng.choice([0, 15, 30, 45]):02d}',
+                'duration': rng.choice(['30 دقيقة', 'ساعة', 'ساعتين', '3 ساعات']),
+                'operating_room': f'OR{rng.randrange(args.rooms)}'
+            })
+            assert response.status_code in results, response.get_data()
+            with lock:
+                results[response.status_code].append(seconds)
+
+    per_thread = args.requests // args.threads
+    threads = [threading.Thread(target=worker, args=(per_thread, seed)) for seed in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = len(results[201]) + len(results[409])
+    print(f'{"no lock" if args.no_lock else "room lock"}: threads={args.threads} rooms={args.rooms}')
+    print(f'bookings/s: {total / elapsed:.1f} ({len(results[201])} booked, {len(results[409])} refused with 409)')
+    summarize('all requests', results[201] + results[409])
+    with app.app_context():
+        print(f'overlapping active surgeries: {double_bookings()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Patient search latency on a large table.
+
+    python benchmarks/search.py --patients 1000000
+
+Fills patients with --patients generated Arabic names (first, father's
+and family name, with the usual spelling variants: أ/ا, ة/ه, ى/ي and
+some with harakat), phones and national IDs, then times
+/api/patients/search through the test client for a full name, a name
+typed with the other spelling, a fragment inside a word, a phone and a
+national ID fragment, and a two-letter query that cannot use the
+trigram index.
+"""
+import argparse
+import random
+
+from sqlalchemy import insert
+from _setup import app, db, login_as, summarize, timed
+from src.models.patient import Patient
+from src.utils.arabic import patient_search_text
+
+BATCH = 20000
+FIRST_NAMES = ('أحمد', 'محمد', 'فاطمة', 'عائشة', 'مصطفى', 'إبراهيم', 'يحيى', 'آمنة', 'خديجة', 'علي',
+               'حسن', 'سارة', 'يوسف', 'مريم', 'عبدالله', 'نورة', 'خالد', 'هدى', 'عمر', 'زينب')
+FAMILY_NAMES = ('الزهراني', 'القحطاني', 'العتيبي', 'الشمري', 'الحربي', 'المطيري', 'الدوسري', 'الغامدي',
+                'السبيعي', 'العنزي', 'البلوي', 'الشهري', 'الأحمدي', 'المالكي', 'الجهني', 'الرشيدي')
+VARIANTS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ة': 'ه', 'ى': 'ي'})
+
+
+def random_name():
+    name = f'{random.choice(FIRST_NAMES)} {random.choice(FIRST_NAMES)} {random.choice(FAMILY_NAMES)}'
+    if random.random() < 0.3:
+        name = name.translate(VARIANTS)
+    if random.random() < 0.05:
+        name = name.replace('م', 'مُ', 1)
+    return name
+
+
+def seed(patients):
+    random.seed(1)
+    with db.engine.begin() as conn:
+        for start in range(0, patients, BATCH):
+            rows = []
+            for i in range(start, min(start + BATCH, patients)):
+                name, phone, national_id = random_name(), f'05{random.randrange(10 ** 8):08d}', f'1{i:09d}'
+                rows.append({'name': name, 'age': 20 + i % 60, 'phone': phone, 'national_id': national_id,
+                             'search_text': patient_search_text(name, phone, national_id)})
+            conn.execute(insert(Patient), rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        _, seconds = timed(seed, args.patients)
+        print(f'seeded {args.patients} patients in {seconds:.0f}s')
+        sample = db.session.get(Patient, args.patients // 2)
+        phone, national_id = sample.phone, sample.national_id
+
+    client = app.test_client()
+    login_as(client, 1)
+    queries = (
+        ('full name', 'فاطمة خديجة الزهراني'),
+        ('other spelling', 'فاطمه خديجه الزهراني'),
+        ('inside a word', 'حطان'),
+        ('phone fragment', phone[-6:]),
+        ('national id', national_id),
+        ('two letters', 'مر'),
+    )
+    for label, query in queries:
+        seconds = []
+        found = 0
+        for _ in range(args.repeat):
+            response, elapsed = timed(client.get, '/api/patients/search', query_string={'q': query, 'limit': args.limit})
+            assert response.status_code == 200, response.get_data()
+            found = len(response.get_json())
+            seconds.append(elapsed)
+        summarize(f'{label} ({found} results)', seconds)
+
+
+if __name__ == '__main__':
+    main()
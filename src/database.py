@@ -1,5 +1,127 @@
+import os
+import threading
+import time
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import QueuePool
 
 # Create a single database instance
 db = SQLAlchemy()
 
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long requests wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+
+    def stats(self):
+        """Snapshot of the pool counters for the internal metrics endpoint"""
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                # overflow() is negative while the pool has not been filled yet
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'wait_count': self.wait_count,
+                'wait_time_total_seconds': round(self.wait_time_total, 6),
+                'wait_time_max_seconds': round(self.wait_time_max, 6),
+                'timeouts': self.timeouts
+            }
+
+
+def engine_options(database_uri):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from DB_* environment variables"""
+    if database_uri.startswith('sqlite') and ':memory:' in database_uri:
+        # In-memory SQLite must keep Flask-SQLAlchemy's single shared connection
+        return {}
+
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+
+    if database_uri.startswith('postgresql'):
+        statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+        options['connect_args'] = {
+            'connect_timeout': _env_int('DB_CONNECT_TIMEOUT', 10),
+            # Applied to every statement on the connection, i.e. per request
+            'options': f'-c statement_timeout={statement_timeout}'
+        }
+
+    return options
+
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Use WAL and a busy timeout so concurrent dev requests don't fail with 'database is locked'"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.close()
+
+
+def configure_engine(engine):
+    """Connection settings for the app's engine (other engines, e.g. in scripts, are left alone)"""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', configure_sqlite_connection):
+        event.listen(engine, 'connect', configure_sqlite_connection)
+
+
+def lock_sqlite_writes(session):
+    """Take SQLite's write lock now instead of at the first write.
+
+    pysqlite only opens a transaction at the first INSERT/UPDATE, so the
+    reads of a check-then-write would run outside any lock. BEGIN
+    IMMEDIATE makes other writers (threads or workers) wait, up to the
+    busy timeout, until this transaction ends. Does nothing on other
+    databases or when a write transaction is already open. ``session``
+    may also be a Core connection, e.g. from ``engine.begin()``.
+    """
+    bind = session if isinstance(session, Connection) else session.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    connection = session if isinstance(session, Connection) else session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def pool_stats(engine):
+    """Return pool metrics for an engine, or None when its pool is not instrumented"""
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return None
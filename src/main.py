@@ -3,11 +3,30 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+import click
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-from src.database import db
+from sqlalchemy import inspect
+from src.database import configure_engine, db, engine_options
+from src.migrations import ensure_columns, ensure_indexes, migration_lock
+from src.services.search import search_backend, setup_search
+from src.services.triage import backfill_severity
+from src.services.passwords import current_method
+from src.services.events import broker
+from src.services.clinical import backfill_clinical_data
+from src.services.resumable_uploads import cleanup_stale_uploads
+from src.services.storage_stats import ensure_storage_counters, rebuild_storage_counters
+from src.services.file_storage import migrate_storage, relativize_storage_paths
+from src.services.storage_backends import create_storage
+from src.services.compression import TIERING_WORKERS, tier_cold_files, tiering_report
+from src.services.integrity import COUNTERS, FINDINGS, SCAN_WORKERS, scan_uploads
 from src.routes.auth import auth_bp
 from src.routes.patient import patient_bp
+from src.routes.medical_files import medical_files_bp
+from src.routes.internal import internal_bp
+from src.routes.ward import ward_bp
+from src.routes.clinical import clinical_bp
+from src.utils.metrics import init_metrics
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'surgery-app-secret-key-change-in-production'
@@ -17,9 +36,16 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 # Enable CORS for development
 CORS(app, supports_credentials=True)
 
+# Per-endpoint latency, SQL and response metrics (/internal/metrics), optional slow-request profiles
+init_metrics(app)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(patient_bp, url_prefix='/api')
+app.register_blueprint(medical_files_bp, url_prefix='/api')
+app.register_blueprint(ward_bp, url_prefix='/api')
+app.register_blueprint(clinical_bp, url_prefix='/api')
+app.register_blueprint(internal_bp, url_prefix='/internal')
 
 # Database configuration
 # Use PostgreSQL if DATABASE_URL is set (production), otherwise use SQLite (development)
@@ -33,35 +59,161 @@ else:
     # Development: use SQLite
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool size, overflow, recycle, pre-ping and statement timeout come from DB_* env vars
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 
 # Initialize database
 db.init_app(app)
 
 with app.app_context():
+    # WAL and a busy timeout on SQLite, set before the first connection is opened
+    configure_engine(db.engine)
+    
     # Import all models to ensure they're registered
     from src.models.auth import User, InviteToken
     from src.models.patient import Patient, ClinicVisit, WardAdmission, Surgery, EmergencyCase
+    from src.models.medical_files import FileBlob, MedicalFile, UploadSession
+    from src.models.ward import Bed
+    from src.models.clinical import VitalSign, MedicationOrder
     
-    # Create all tables
-    db.create_all()
-    
-    # Create default admin if no users exist
-    if User.query.count() == 0:
-        admin = User(
-            username='admin',
-            email='admin@surgery.app',
-            full_name='المسؤول الرئيسي',
-            role='admin',
-            specialization='جراحة عامة'
-        )
-        admin.set_password('admin123')  # Change this password!
-        db.session.add(admin)
-        db.session.commit()
-        print("✓ تم إنشاء حساب المسؤول الافتراضي")
-        print("  اسم المستخدم: admin")
-        print("  كلمة المرور: admin123")
-        print("  ⚠️  يرجى تغيير كلمة المرور فوراً!")
+    # The in-memory search index (no FTS5 / pg_trgm) lives in each worker;
+    # the bed map and triage queue load themselves on first use
+    if search_backend(db.engine) == 'memory' and inspect(db.engine).has_table('patients'):
+        setup_search(db.engine)
+
+# Resolve the password work factor (one timing hash) before serving the first login
+current_method()
+
+# Receive other workers' events (triage queue, emergency stream) from the start
+broker.start()
+
+
+def upgrade_database():
+    """Bring the schema and existing rows up to date.
+
+    Runs once per deploy (`flask db-upgrade`, before gunicorn starts) rather
+    than in every worker at import, and under an advisory lock so
+    instances deploying at the same time don't run it twice.
+    """
+    with migration_lock(db.engine):
+        # Create all tables
+        db.create_all()
+        
+        # Add columns and indexes declared after the database was created
+        for column_name in ensure_columns(db.engine):
+            print(f"✓ تمت إضافة العمود {column_name}")
+        for index_name in ensure_indexes(db.engine, concurrently=True):
+            print(f"✓ تم إنشاء الفهرس {index_name}")
+        
+        # Patient search index (SQLite FTS5 / PostgreSQL pg_trgm)
+        setup_search(db.engine)
+        
+        # Severity for emergency cases from before the column existed
+        backfill_severity(db.engine)
+        
+        # Copy vitals / medications stored as JSON text into their own tables
+        migrated_cases, migrated_admissions = backfill_clinical_data()
+        if migrated_cases or migrated_admissions:
+            print(f"✓ تم نقل العلامات الحيوية لـ {migrated_cases} حالة والأدوية لـ {migrated_admissions} تنويم")
+        
+        # Storage keys instead of absolute paths for files stored before storage backends
+        relativize_storage_paths(db.engine)
+        
+        # File storage counters (built once for databases that already had files)
+        ensure_storage_counters(db.engine)
+        
+        # Create default admin if no users exist
+        if User.query.count() == 0:
+            admin = User(
+                username='admin',
+                email='admin@surgery.app',
+                full_name='المسؤول الرئيسي',
+                role='admin',
+                specialization='جراحة عامة'
+            )
+            admin.set_password('admin123')  # Change this password!
+            db.session.add(admin)
+            db.session.commit()
+            print("✓ تم إنشاء حساب المسؤول الافتراضي")
+            print("  اسم المستخدم: admin")
+            print("  كلمة المرور: admin123")
+            print("  ⚠️  يرجى تغيير كلمة المرور فوراً!")
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables, columns and indexes and migrate existing rows"""
+    upgrade_database()
+    click.echo("Database is up to date")
+
+@app.cli.command('create-indexes')
+@click.option('--concurrently', is_flag=True, help='Build indexes without locking writes (PostgreSQL)')
+def create_indexes_command(concurrently):
+    """Create any declared indexes missing from the database"""
+    created = ensure_indexes(db.engine, concurrently=concurrently)
+    click.echo(f"Created {len(created)} index(es): {', '.join(created) or '-'}")
+
+@app.cli.command('rebuild-storage-counters')
+def rebuild_storage_counters_command():
+    """Recompute the storage report counters from the files table"""
+    rebuild_storage_counters(db.engine)
+    click.echo("Storage counters rebuilt")
+
+@app.cli.command('cleanup-uploads')
+def cleanup_uploads_command():
+    """Delete resumable uploads that were abandoned"""
+    removed = cleanup_stale_uploads()
+    click.echo(f"Removed {removed} stale upload(s)")
+
+@app.cli.command('scan-uploads')
+@click.option('--quarantine', is_flag=True, help='Move orphaned files to uploads/quarantine/')
+@click.option('--full', is_flag=True, help='Rescan directories unchanged since the last run')
+@click.option('--no-verify', is_flag=True, help='Check sizes only, do not re-hash blobs')
+@click.option('--workers', default=SCAN_WORKERS, show_default=True, help='Directories scanned in parallel')
+def scan_uploads_command(quarantine, full, no_verify, workers):
+    """Reconcile the uploads folder with the database"""
+    report = scan_uploads(db.engine, quarantine=quarantine, full=full, verify_hashes=not no_verify, workers=workers)
+    for kind in FINDINGS:
+        for finding in report['findings'][kind]:
+            click.echo(f"{kind}: {finding}")
+    for name in COUNTERS + FINDINGS:
+        click.echo(f"{name}: {report[name]}")
+    if any(report[kind] for kind in FINDINGS if kind != 'orphans' or not quarantine):
+        sys.exit(1)
+
+@app.cli.command('migrate-storage')
+@click.option('--from', 'source', default='local', show_default=True, help='Backend to copy from (local, object, s3)')
+@click.option('--to', 'target', required=True, help='Backend to copy to (local, object, s3)')
+@click.option('--workers', default=8, show_default=True, help='Files copied in parallel')
+def migrate_storage_command(source, target, workers):
+    """Copy every stored medical file to another storage backend"""
+    report = migrate_storage(db.engine, create_storage(source), create_storage(target), workers=workers)
+    for error in report['errors']:
+        click.echo(f"failed: {error['key']}: {error['error']}")
+    click.echo(f"Copied {report['copied']} file(s) ({report['bytes']} bytes), "
+               f"skipped {report['skipped']} already there, {report['failed']} failed")
+    if report['failed']:
+        sys.exit(1)
+    click.echo(f"Set STORAGE_BACKEND={target} to switch")
+
+@app.cli.command('tier-files')
+@click.option('--limit', type=int, help='Compress at most this many blobs')
+@click.option('--workers', default=TIERING_WORKERS, show_default=True, help='Blobs compressed in parallel')
+@click.option('--report', 'report_only', is_flag=True, help='Only show space saved and decompression cost')
+def tier_files_command(limit, workers, report_only):
+    """Compress medical files nobody has uploaded for TIERING_AGE_DAYS"""
+    if not report_only:
+        result = tier_cold_files(db.engine, limit=limit, workers=workers)
+        for error in result['errors']:
+            click.echo(f"failed: {error['sha256']}: {error['error']}")
+        click.echo(f"Compressed {result['compressed']} blob(s), saved {result['bytes_saved']} bytes; "
+                   f"kept {result['kept']} as they were, skipped {result['skipped']}, "
+                   f"{result['corrupt']} with a wrong hash, {result['failed']} failed")
+    report = tiering_report(db.engine)
+    for codec, entry in report['codecs'].items():
+        click.echo(f"{codec}: {entry}")
+    click.echo(f"Saved {report['bytes_saved']} of {report['original_bytes']} bytes; "
+               f"{report['untiered_blobs']} blob(s) not tiered yet")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -81,5 +233,8 @@ def serve(path):
 
 
 if __name__ == '__main__':
+    # The development server upgrades the database itself
+    with app.app_context():
+        upgrade_database()
     app.run(host='0.0.0.0', port=5000, debug=True)
 
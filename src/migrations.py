@@ -0,0 +1,138 @@
+import logging
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from src.database import db
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key shared by every `flask db-upgrade` run
+MIGRATION_LOCK_KEY = 0x5347_0001
+
+
+@contextmanager
+def migration_lock(engine):
+    """Make concurrent upgrade runs (several instances deploying at once) wait for each other.
+
+    A session-level PostgreSQL advisory lock, held on its own connection
+    so the statements of the upgrade can commit in between. SQLite only
+    runs on a single host and needs no lock.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def ensure_columns(engine):
+    """Add columns declared on the models that existing tables are missing.
+
+    Only covers the additive case (nullable columns or columns with a
+    server default), which is how new columns are introduced here.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} ' \
+                  f'{column.type.compile(dialect=engine.dialect)}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                if isinstance(default, str):
+                    default = "'" + default.replace("'", "''") + "'"
+                else:
+                    default = default.text
+                ddl += f' DEFAULT {default}'
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f'{table.name}.{column.name}')
+
+    return added
+
+
+def missing_indexes(engine):
+    """List the declared indexes that do not exist in the database yet"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+
+    return missing + invalid_indexes(engine)
+
+
+def invalid_indexes(engine):
+    """Declared indexes left INVALID by an interrupted CREATE INDEX CONCURRENTLY (PostgreSQL)"""
+    if engine.dialect.name != 'postgresql':
+        return []
+    with engine.connect() as conn:
+        names = set(conn.execute(text(
+            'SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE NOT i.indisvalid'
+        )).scalars())
+    return [index for table in db.metadata.sorted_tables for index in table.indexes if index.name in names]
+
+
+def ensure_indexes(engine, concurrently=False):
+    """Create declared indexes that are missing on an existing database.
+
+    db.create_all() only creates indexes together with new tables, so
+    databases created before an index was declared need this step. With
+    ``concurrently=True`` PostgreSQL builds the indexes without locking
+    the table against writes (each one runs outside a transaction).
+    A unique index that existing rows violate is reported and skipped, so
+    the deploy goes on; it is retried on the next run once the duplicates
+    are fixed.
+    """
+    created = []
+    use_concurrently = concurrently and engine.dialect.name == 'postgresql'
+    invalid = {index.name for index in invalid_indexes(engine)}
+
+    for index in missing_indexes(engine):
+        try:
+            _create_index(engine, index, use_concurrently, index.name in invalid)
+        except IntegrityError as e:
+            if not index.unique:
+                raise
+            logger.warning('Index %s not created, existing rows violate it: %s', index.name, e.orig)
+            continue
+        created.append(index.name)
+
+    return created
+
+
+def _create_index(engine, index, concurrently, invalid):
+    quote = engine.dialect.identifier_preparer.quote
+    if concurrently:
+        index.dialect_kwargs['postgresql_concurrently'] = True
+        try:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                if invalid:
+                    # IF NOT EXISTS would keep the broken index
+                    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {quote(index.name)}'))
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        finally:
+            index.dialect_kwargs['postgresql_concurrently'] = False
+    else:
+        with engine.begin() as conn:
+            if invalid:
+                conn.execute(text(f'DROP INDEX IF EXISTS {quote(index.name)}'))
+            conn.execute(CreateIndex(index, if_not_exists=True))
@@ -1,5 +1,5 @@
 from src.database import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.passwords import hash_password, verify_password, needs_rehash
 from datetime import datetime
 import secrets
 
@@ -20,11 +20,15 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check if password matches"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the stored hash uses an outdated method or work factor"""
+        return needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
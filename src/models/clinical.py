@@ -0,0 +1,76 @@
+from src.database import db
+from datetime import datetime
+
+class VitalSign(db.Model):
+    """One measurement of one vital sign (long format: a row per metric per reading)"""
+    __tablename__ = 'vital_signs'
+    __table_args__ = (
+        # Threshold queries: metric = ? AND recorded_at >= ? AND value < ?
+        db.Index('ix_vital_signs_metric_recorded_at', 'metric', 'recorded_at'),
+        db.Index('ix_vital_signs_patient_metric_recorded_at', 'patient_id', 'metric', 'recorded_at'),
+        db.Index('ix_vital_signs_emergency_case_recorded_at', 'emergency_case_id', 'recorded_at'),
+        db.Index('ix_vital_signs_ward_admission_recorded_at', 'ward_admission_id', 'recorded_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    emergency_case_id = db.Column(db.Integer, db.ForeignKey('emergency_cases.id'))
+    ward_admission_id = db.Column(db.Integer, db.ForeignKey('ward_admissions.id'))
+    metric = db.Column(db.String(30), nullable=False)  # heart_rate, systolic_bp, spo2, ...
+    value = db.Column(db.Float, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    recorded_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    source = db.Column(db.String(20), default='api')  # api، legacy (من حقل vital_signs)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'emergency_case_id': self.emergency_case_id,
+            'ward_admission_id': self.ward_admission_id,
+            'metric': self.metric,
+            'value': self.value,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
+            'recorded_by': self.recorded_by,
+            'source': self.source
+        }
+
+
+class MedicationOrder(db.Model):
+    """A medication given during a ward admission, from when it was started until stopped"""
+    __tablename__ = 'medication_orders'
+    __table_args__ = (
+        db.Index('ix_medication_orders_admission_started_at', 'ward_admission_id', 'started_at'),
+        db.Index('ix_medication_orders_patient_started_at', 'patient_id', 'started_at'),
+        db.Index('ix_medication_orders_name_stopped_at', 'name', 'stopped_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    ward_admission_id = db.Column(db.Integer, db.ForeignKey('ward_admissions.id'), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    dose = db.Column(db.String(100))
+    route = db.Column(db.String(50))  # فموي، وريدي، عضلي...
+    frequency = db.Column(db.String(100))
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    stopped_at = db.Column(db.DateTime)  # NULL = still active
+    ordered_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    source = db.Column(db.String(20), default='api')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'ward_admission_id': self.ward_admission_id,
+            'name': self.name,
+            'dose': self.dose,
+            'route': self.route,
+            'frequency': self.frequency,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'stopped_at': self.stopped_at.isoformat() if self.stopped_at else None,
+            'active': self.stopped_at is None,
+            'ordered_by': self.ordered_by,
+            'source': self.source
+        }
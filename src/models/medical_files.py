@@ -1,12 +1,44 @@
 from src.database import db
 from datetime import datetime
 
+class FileBlob(db.Model):
+    """Stored file content, addressed by its SHA-256 and shared by every upload of it"""
+    __tablename__ = 'file_blobs'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    storage_path = db.Column(db.String(500), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=1)  # medical_files rows using this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Cold storage tier: codec is gzip / zstd when the stored object is compressed, NULL when stored as-is
+    codec = db.Column(db.String(10))
+    stored_size = db.Column(db.BigInteger)  # bytes in storage after compression
+    tiered_at = db.Column(db.DateTime)  # when the tiering job last processed the blob
+    decompress_seconds = db.Column(db.Float)  # measured by the tiering job on the compressed object
+    
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'codec': self.codec,
+            'stored_size': self.stored_size if self.codec else self.size,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class MedicalFile(db.Model):
     __tablename__ = 'medical_files'
+    __table_args__ = (
+        # Covers the per-patient listing (optionally by category) ordered by upload time
+        db.Index('ix_medical_files_patient_category_uploaded', 'patient_id', 'category', 'uploaded_at'),
+        db.Index('ix_medical_files_patient_uploaded', 'patient_id', 'uploaded_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
-    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     
     # File information
     file_name = db.Column(db.String(255), nullable=False)
@@ -14,6 +46,7 @@ class MedicalFile(db.Model):
     file_type = db.Column(db.String(50), nullable=False)  # image, pdf, document
     file_size = db.Column(db.Integer)  # in bytes
     mime_type = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), db.ForeignKey('file_blobs.sha256'), index=True)  # NULL for files uploaded before blobs
     
     # Medical classification
     category = db.Column(db.String(50), nullable=False)  # lab_results, ct_scan, xray, surgical_image, report, other
@@ -26,6 +59,7 @@ class MedicalFile(db.Model):
     # Relationships
     patient = db.relationship('Patient', backref='medical_files')
     uploader = db.relationship('User', backref='uploaded_files')
+    blob = db.relationship('FileBlob')
     
     def to_dict(self):
         return {
@@ -39,6 +73,7 @@ class MedicalFile(db.Model):
             'file_type': self.file_type,
             'file_size': self.file_size,
             'mime_type': self.mime_type,
+            'content_hash': self.content_hash,
             'category': self.category,
             'category_ar': self.get_category_arabic(),
             'description': self.description,
@@ -57,3 +92,43 @@ class MedicalFile(db.Model):
         }
         return categories.get(self.category, self.category)
 
+
+
+class UploadSession(db.Model):
+    """A resumable upload in progress: chunks are written into a preallocated file"""
+    __tablename__ = 'upload_sessions'
+    __table_args__ = (
+        db.Index('ix_upload_sessions_updated_at', 'updated_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(50), nullable=False)
+    mime_type = db.Column(db.String(100))
+    category = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text)
+    date_taken = db.Column(db.Date)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_ranges = db.Column(db.Text, default='[]')  # JSON [[start, end), ...], merged and sorted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class StorageCounter(db.Model):
+    """Running file count and byte total per patient, category, uploader, upload day and overall.
+
+    Kept up to date in the same transaction as every MedicalFile insert,
+    delete and category change (see services/storage_stats.py), so the
+    storage report never scans medical_files.
+    """
+    __tablename__ = 'storage_counters'
+    __table_args__ = (
+        db.Index('ix_storage_counters_dimension_bytes', 'dimension', 'total_bytes'),
+    )
+    
+    dimension = db.Column(db.String(20), primary_key=True)  # total, patient, category, uploader, day, blobs
+    key = db.Column(db.String(100), primary_key=True)
+    file_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
@@ -1,4 +1,7 @@
 from src.database import db
+from src.utils.arabic import patient_search_text
+from src.utils.triage import severity_for
+from sqlalchemy import event
 from datetime import datetime
 
 class Patient(db.Model):
@@ -15,6 +18,8 @@ class Patient(db.Model):
     chronic_diseases = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Normalized name, phone digits and national ID, maintained for patient search
+    search_text = db.Column(db.Text)
     
     # Relationships
     clinic_visits = db.relationship('ClinicVisit', backref='patient', lazy=True)
@@ -38,8 +43,19 @@ class Patient(db.Model):
         }
 
 
+@event.listens_for(Patient, 'before_insert')
+@event.listens_for(Patient, 'before_update')
+def update_search_text(mapper, connection, target):
+    target.search_text = patient_search_text(target.name, target.phone, target.national_id)
+
+
 class ClinicVisit(db.Model):
     __tablename__ = 'clinic_visits'
+    __table_args__ = (
+        db.Index('ix_clinic_visits_visit_date', 'visit_date'),
+        # Also serves plain patient_id lookups (leading column)
+        db.Index('ix_clinic_visits_patient_visit_date', 'patient_id', 'visit_date', 'visit_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -74,6 +90,14 @@ class ClinicVisit(db.Model):
 
 class WardAdmission(db.Model):
     __tablename__ = 'ward_admissions'
+    __table_args__ = (
+        db.Index('ix_ward_admissions_status', 'status'),
+        db.Index('ix_ward_admissions_patient_admission_date', 'patient_id', 'admission_date'),
+        db.Index('ix_ward_admissions_room_bed_status', 'room_number', 'bed_number', 'status'),
+        # One current admission per bed, enforced by the database for concurrent requests
+        db.Index('uq_ward_admissions_admitted_bed', 'room_number', 'bed_number', unique=True,
+                 sqlite_where=db.text("status = 'منوم'"), postgresql_where=db.text("status = 'منوم'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -87,6 +111,8 @@ class WardAdmission(db.Model):
     daily_notes = db.Column(db.Text)
     status = db.Column(db.String(20), default='منوم')  # منوم، خرج
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # False on rows from before medication_orders existed until db-upgrade copies their medications
+    legacy_synced = db.Column(db.Boolean, nullable=False, default=True, server_default='0')
     
     def to_dict(self):
         return {
@@ -109,6 +135,11 @@ class WardAdmission(db.Model):
 
 class Surgery(db.Model):
     __tablename__ = 'surgeries'
+    __table_args__ = (
+        db.Index('ix_surgeries_surgery_date_status', 'surgery_date', 'status'),
+        db.Index('ix_surgeries_patient_surgery_date', 'patient_id', 'surgery_date', 'surgery_time'),
+        db.Index('ix_surgeries_operating_room_surgery_date', 'operating_room', 'surgery_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -146,18 +177,27 @@ class Surgery(db.Model):
 
 class EmergencyCase(db.Model):
     __tablename__ = 'emergency_cases'
+    __table_args__ = (
+        db.Index('ix_emergency_cases_status_arrival_time', 'status', 'arrival_time'),
+        # Triage order: the open queue read in (severity, arrival_time) order straight off the index
+        db.Index('ix_emergency_cases_status_severity_arrival', 'status', 'severity', 'arrival_time'),
+        db.Index('ix_emergency_cases_patient_arrival_time', 'patient_id', 'arrival_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     arrival_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     complaint = db.Column(db.Text, nullable=False)
     priority = db.Column(db.String(20), nullable=False)  # حرج، عاجل، متوسط، غير عاجل
+    severity = db.Column(db.SmallInteger)  # 1 (حرج) .. 4 (غير عاجل), 5 غير معروف
     status = db.Column(db.String(30), default='في الانتظار')  # في الانتظار، قيد التقييم، قيد العلاج، قيد المراقبة، تم الخروج
     vital_signs = db.Column(db.Text)  # JSON string
     initial_assessment = db.Column(db.Text)
     decision = db.Column(db.String(100))  # تنويم، عملية عاجلة، خروج، تحويل
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # False on rows from before vital_signs existed as a table until db-upgrade copies their readings
+    legacy_synced = db.Column(db.Boolean, nullable=False, default=True, server_default='0')
     
     def to_dict(self):
         return {
@@ -169,6 +209,7 @@ class EmergencyCase(db.Model):
             'arrival_time': self.arrival_time.isoformat() if self.arrival_time else None,
             'complaint': self.complaint,
             'priority': self.priority,
+            'severity': self.severity,
             'status': self.status,
             'vital_signs': self.vital_signs,
             'initial_assessment': self.initial_assessment,
@@ -177,3 +218,9 @@ class EmergencyCase(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+
+@event.listens_for(EmergencyCase, 'before_insert')
+@event.listens_for(EmergencyCase, 'before_update')
+def update_severity(mapper, connection, target):
+    target.severity = severity_for(target.priority)
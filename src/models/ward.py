@@ -0,0 +1,26 @@
+from src.database import db
+from datetime import datetime
+
+class Bed(db.Model):
+    __tablename__ = 'beds'
+    __table_args__ = (
+        db.UniqueConstraint('room_number', 'bed_number', name='uq_beds_room_bed'),
+        db.Index('ix_beds_ward', 'ward'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ward = db.Column(db.String(50), nullable=False)
+    room_number = db.Column(db.String(10), nullable=False)
+    bed_number = db.Column(db.String(10), nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ward': self.ward,
+            'room_number': self.room_number,
+            'bed_number': self.bed_number,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
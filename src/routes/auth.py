@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, g
 from src.database import db
 from src.models.auth import User, InviteToken
 from src.models.patient import Patient
@@ -7,6 +7,32 @@ from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
 
+def load_current_user():
+    """Return the logged-in user's to_dict() data, loaded at most once per request.
+
+    The row is read by primary key on each request rather than cached
+    across requests, so a role change or deactivation applies at once in
+    every worker.
+    """
+    if 'current_user' in g:
+        return g.current_user
+
+    user = None
+    user_id = session.get('user_id')
+    if user_id is not None:
+        record = db.session.get(User, user_id)
+        if record:
+            user = record.to_dict()
+
+    g.current_user = user
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget this request's copy of a user after it changed"""
+    if session.get('user_id') == user_id:
+        g.pop('current_user', None)
+
 # Decorator للتحقق من تسجيل الدخول
 def login_required(f):
     @wraps(f)
@@ -23,8 +49,8 @@ def admin_required(f):
         if 'user_id' not in session:
             return jsonify({'error': 'يجب تسجيل الدخول أولاً'}), 401
         
-        user = User.query.get(session['user_id'])
-        if not user or user.role != 'admin':
+        user = load_current_user()
+        if not user or not user['is_active'] or user['role'] != 'admin':
             return jsonify({'error': 'صلاحيات المسؤول مطلوبة'}), 403
         
         return f(*args, **kwargs)
@@ -112,9 +138,14 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'الحساب غير مفعل'}), 403
         
+        # Upgrade hashes made with an older method or work factor
+        if user.password_needs_rehash():
+            user.set_password(password)
+        
         # Update last login
         user.last_login = datetime.utcnow()
         db.session.commit()
+        invalidate_user(user.id)
         
         # Set session
         session['user_id'] = user.id
@@ -135,6 +166,7 @@ def login():
 def logout():
     """Logout user"""
     session.clear()
+    g.pop('current_user', None)
     return jsonify({'message': 'تم تسجيل الخروج بنجاح'}), 200
 
 
@@ -143,11 +175,11 @@ def logout():
 def get_current_user():
     """Get current logged in user"""
     try:
-        user = User.query.get(session['user_id'])
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'المستخدم غير موجود'}), 404
         
-        return jsonify(user.to_dict()), 200
+        return jsonify(user), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -156,11 +188,11 @@ def get_current_user():
 def check_session():
     """Check if user is logged in"""
     if 'user_id' in session:
-        user = User.query.get(session['user_id'])
+        user = load_current_user()
         if user:
             return jsonify({
                 'logged_in': True,
-                'user': user.to_dict()
+                'user': user
             }), 200
     
     return jsonify({'logged_in': False}), 200
@@ -277,6 +309,7 @@ def update_user(user_id):
             user.is_active = data.get('is_active')
         
         db.session.commit()
+        invalidate_user(user_id)
         return jsonify({
             'message': 'تم تحديث المستخدم بنجاح',
             'user': user.to_dict()
@@ -299,6 +332,7 @@ def delete_user(user_id):
         user = User.query.get_or_404(user_id)
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         
         return jsonify({'message': 'تم حذف المستخدم بنجاح'}), 200
         
@@ -320,6 +354,7 @@ def change_password():
         
         user.set_password(data.get('new_password'))
         db.session.commit()
+        invalidate_user(user.id)
         
         return jsonify({'message': 'تم تغيير كلمة المرور بنجاح'}), 200
         
@@ -0,0 +1,192 @@
+from flask import Blueprint, request, jsonify, session
+from src.database import db
+from src.models.patient import Patient, WardAdmission, EmergencyCase
+from src.models.clinical import MedicationOrder
+from src.services.clinical import (
+    MEDICATION_FIELDS, active_medications, latest_vitals_text, medications_text,
+    query_vitals, record_vitals, vital_values
+)
+from src.services.events import publish
+from src.services.triage import EMERGENCY_CHANNEL
+from datetime import datetime
+
+clinical_bp = Blueprint('clinical', __name__)
+
+
+def parse_timestamp(value, name):
+    """ISO datetime from the request body, now when missing"""
+    if not value:
+        return datetime.utcnow()
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} يجب أن يكون تاريخاً بصيغة ISO')
+
+
+def read_vitals(data):
+    values = vital_values({key: value for key, value in data.items() if key != 'recorded_at'})
+    if not values:
+        raise ValueError('لا توجد قراءات')
+    return values
+
+
+# ==================== Vital Signs Routes ====================
+
+@clinical_bp.route('/vitals', methods=['GET'])
+def search_vitals():
+    """Find readings in SQL, e.g. ?metric=spo2&below=90&minutes=60"""
+    try:
+        return jsonify(query_vitals(request.args)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@clinical_bp.route('/patients/<int:patient_id>/vitals', methods=['GET'])
+def get_patient_vitals(patient_id):
+    """Get all readings of a patient (?metric=&from=&to=&below=&above=)"""
+    try:
+        Patient.query.get_or_404(patient_id)
+        return jsonify(query_vitals(request.args, patient_id=patient_id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@clinical_bp.route('/emergency-cases/<int:case_id>/vitals', methods=['GET'])
+def get_case_vitals(case_id):
+    """Get the readings of an emergency case"""
+    try:
+        EmergencyCase.query.get_or_404(case_id)
+        return jsonify(query_vitals(request.args, emergency_case_id=case_id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@clinical_bp.route('/emergency-cases/<int:case_id>/vitals', methods=['POST'])
+def record_case_vitals(case_id):
+    """Record a set of readings, e.g. {"spo2": 94, "blood_pressure": "120/80"}"""
+    try:
+        case = EmergencyCase.query.get_or_404(case_id)
+        data = request.get_json() or {}
+        rows = record_vitals(
+            case.patient_id, read_vitals(data), parse_timestamp(data.get('recorded_at'), 'recorded_at'),
+            emergency_case_id=case.id, recorded_by=session.get('user_id')
+        )
+        db.session.flush()
+        # Keep the old vital_signs field showing the latest values
+        case.vital_signs = latest_vitals_text(emergency_case_id=case.id)
+        db.session.commit()
+        publish(EMERGENCY_CHANNEL, 'updated', case.to_dict())
+        return jsonify([row.to_dict() for row in rows]), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@clinical_bp.route('/ward-admissions/<int:admission_id>/vitals', methods=['GET'])
+def get_admission_vitals(admission_id):
+    """Get the readings taken during a ward admission"""
+    try:
+        WardAdmission.query.get_or_404(admission_id)
+        return jsonify(query_vitals(request.args, ward_admission_id=admission_id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@clinical_bp.route('/ward-admissions/<int:admission_id>/vitals', methods=['POST'])
+def record_admission_vitals(admission_id):
+    """Record a set of readings for an admitted patient"""
+    try:
+        admission = WardAdmission.query.get_or_404(admission_id)
+        data = request.get_json() or {}
+        rows = record_vitals(
+            admission.patient_id, read_vitals(data), parse_timestamp(data.get('recorded_at'), 'recorded_at'),
+            ward_admission_id=admission.id, recorded_by=session.get('user_id')
+        )
+        db.session.commit()
+        return jsonify([row.to_dict() for row in rows]), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# ==================== Medication Routes ====================
+
+@clinical_bp.route('/ward-admissions/<int:admission_id>/medications', methods=['GET'])
+def get_admission_medications(admission_id):
+    """Get the medication orders of an admission (?active=1 for current ones)"""
+    try:
+        WardAdmission.query.get_or_404(admission_id)
+        if request.args.get('active') in ('1', 'true'):
+            orders = active_medications(admission_id)
+        else:
+            orders = MedicationOrder.query.filter_by(ward_admission_id=admission_id) \
+                .order_by(MedicationOrder.started_at, MedicationOrder.id).all()
+        return jsonify([order.to_dict() for order in orders]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@clinical_bp.route('/ward-admissions/<int:admission_id>/medications', methods=['POST'])
+def create_medication_order(admission_id):
+    """Start a medication for an admitted patient"""
+    try:
+        admission = WardAdmission.query.get_or_404(admission_id)
+        data = request.get_json() or {}
+        if not str(data.get('name') or '').strip():
+            return jsonify({'error': 'اسم الدواء مطلوب'}), 400
+
+        order = MedicationOrder(
+            patient_id=admission.patient_id,
+            ward_admission_id=admission.id,
+            started_at=parse_timestamp(data.get('started_at'), 'started_at'),
+            ordered_by=session.get('user_id'),
+            **{field: data.get(field) for field in MEDICATION_FIELDS}
+        )
+        db.session.add(order)
+        db.session.flush()
+        admission.medications = medications_text(admission.id)
+        db.session.commit()
+        return jsonify(order.to_dict()), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@clinical_bp.route('/medications/<int:order_id>', methods=['PUT'])
+def update_medication_order(order_id):
+    """Change the dose/route/frequency of an order, or stop it with {"stop": true}"""
+    try:
+        order = MedicationOrder.query.get_or_404(order_id)
+        data = request.get_json() or {}
+
+        order.dose = data.get('dose', order.dose)
+        order.route = data.get('route', order.route)
+        order.frequency = data.get('frequency', order.frequency)
+        if data.get('stop') and order.stopped_at is None:
+            order.stopped_at = datetime.utcnow()
+
+        db.session.flush()
+        admission = db.session.get(WardAdmission, order.ward_admission_id)
+        admission.medications = medications_text(admission.id)
+        db.session.commit()
+        return jsonify(order.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
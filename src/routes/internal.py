@@ -0,0 +1,56 @@
+from flask import Blueprint, Response, request, jsonify
+from src.database import db, pool_stats
+from src.routes.auth import admin_required
+from src.utils.metrics import add_collector, render_metrics
+from functools import wraps
+import hmac
+import os
+
+internal_bp = Blueprint('internal', __name__)
+
+# pool_stats() fields that only grow, with their Prometheus names
+POOL_COUNTERS = {
+    'wait_count': 'db_pool_waits_total',
+    'wait_time_total_seconds': 'db_pool_wait_seconds_total',
+    'timeouts': 'db_pool_timeouts_total'
+}
+
+
+def pool_samples():
+    """Pool figures of this worker for /internal/metrics"""
+    return [
+        (POOL_COUNTERS[name], 'counter', value) if name in POOL_COUNTERS else (f'db_pool_{name}', 'gauge', value)
+        for name, value in (pool_stats(db.engine) or {}).items()
+    ]
+
+
+add_collector(pool_samples)
+
+# Decorator للمسارات الداخلية: رمز X-Internal-Token أو جلسة مسؤول
+def internal_required(f):
+    admin_view = admin_required(f)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.environ.get('INTERNAL_API_TOKEN')
+        if token and hmac.compare_digest(request.headers.get('X-Internal-Token', ''), token):
+            return f(*args, **kwargs)
+        return admin_view(*args, **kwargs)
+    return decorated_function
+
+
+@internal_bp.route('/pool', methods=['GET'])
+@internal_required
+def get_pool_stats():
+    """Get database connection pool metrics"""
+    stats = pool_stats(db.engine)
+    if stats is None:
+        return jsonify({'error': 'مجمع الاتصالات غير مُراقَب'}), 404
+    return jsonify(stats), 200
+
+
+@internal_bp.route('/metrics', methods=['GET'])
+@internal_required
+def get_metrics():
+    """Get request, SQL and pool metrics in the Prometheus text format (all workers with METRICS_DIR)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
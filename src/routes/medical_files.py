@@ -1,27 +1,42 @@
-from flask import Blueprint, request, jsonify, send_file, session
+from flask import Blueprint, Response, redirect, request, jsonify, send_file, session
+from werkzeug.wsgi import wrap_file
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from src.database import db
-from src.models.medical_files import MedicalFile
+from src.models.medical_files import MedicalFile, UploadSession
 from src.models.patient import Patient
 from src.models.auth import User
-from datetime import datetime
+from src.routes.auth import admin_required
+from src.utils.streaming import wants_stream, stream_json
+from src.services.file_storage import (
+    UPLOAD_FOLDER, MAX_FILE_SIZE, FILE_SEND_MODE, FILE_ACCEL_PREFIX, FILE_CACHE_MAX_AGE,
+    FileTooLargeError, receive_multipart, release_blob, remove_file, store_blob
+)
+from src.services.storage_stats import patient_file_stats, storage_report
+from src.services.compression import iter_content, tiering_report
+from src.services.storage_backends import (
+    STORAGE_REDIRECT_DOWNLOADS, STORAGE_URL_TTL, ObjectReader, content_disposition, storage
+)
+from src.services.thumbnails import (
+    DEFAULT_THUMBNAIL_SIZE, THUMBNAIL_SIZES, get_thumbnail, remove_thumbnails, schedule_thumbnails
+)
+from src.services.resumable_uploads import (
+    abort_upload, create_upload, finish_upload, progress, write_chunk
+)
+from datetime import datetime, timezone
+from urllib.parse import quote
+import mimetypes
 import os
-import uuid
+import re
 
 medical_files_bp = Blueprint('medical_files', __name__)
 
-# Configuration
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+# Configuration (UPLOAD_FOLDER and MAX_FILE_SIZE live in services/file_storage.py)
 ALLOWED_EXTENSIONS = {
-    'image': {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'dicom'},
+    'image': {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'dicom', 'dcm'},
     'pdf': {'pdf'},
     'document': {'doc', 'docx', 'xls', 'xlsx', 'txt'}
 }
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-
-# Ensure upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 def allowed_file(filename, file_type):
     """Check if file extension is allowed"""
     if '.' not in filename:
@@ -52,8 +67,15 @@ def get_patient_files(patient_id):
         if category:
             query = query.filter_by(category=category)
         
-        files = query.order_by(MedicalFile.uploaded_at.desc()).all()
+        # Load patient and uploader names with the files instead of once per row
+        query = query.options(
+            joinedload(MedicalFile.patient), joinedload(MedicalFile.uploader)
+        ).order_by(MedicalFile.uploaded_at.desc())
         
+        if wants_stream(request.args):
+            return stream_json(f.to_dict() for f in query.yield_per(500))
+        
+        files = query.all()
         return jsonify([f.to_dict() for f in files]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -61,7 +83,8 @@ def get_patient_files(patient_id):
 
 @medical_files_bp.route('/patients/<int:patient_id>/files/upload', methods=['POST'])
 def upload_file(patient_id):
-    """Upload a new medical file"""
+    """Upload a new medical file (streamed to the blob store, duplicates are shared)"""
+    upload = None
     try:
         # Check if user is logged in
         if 'user_id' not in session:
@@ -70,42 +93,35 @@ def upload_file(patient_id):
         # Check if patient exists
         patient = Patient.query.get_or_404(patient_id)
         
+        # Reject what is obviously too large before reading the body
+        if request.content_length and request.content_length > MAX_FILE_SIZE + 64 * 1024:
+            return jsonify({'error': 'حجم الملف يتجاوز الحد المسموح'}), 413
+        
+        form, upload = receive_multipart(request)
+        
         # Check if file is in request
-        if 'file' not in request.files:
+        if upload is None:
             return jsonify({'error': 'لم يتم إرفاق ملف'}), 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
+        if not upload['filename']:
+            upload['writer'].discard()
             return jsonify({'error': 'لم يتم اختيار ملف'}), 400
         
         # Get form data
-        category = request.form.get('category', 'other')
-        description = request.form.get('description', '')
-        date_taken = request.form.get('date_taken')
+        category = form.get('category', 'other')
+        description = form.get('description', '')
+        date_taken = form.get('date_taken')
         
         # Determine file type
-        file_type = get_file_type(file.filename)
+        file_type = get_file_type(upload['filename'])
         
         # Validate file type
-        if not allowed_file(file.filename, file_type):
+        if not allowed_file(upload['filename'], file_type):
+            upload['writer'].discard()
             return jsonify({'error': 'نوع الملف غير مدعوم'}), 400
         
-        # Generate unique filename
-        original_filename = secure_filename(file.filename)
-        file_ext = original_filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}_{patient_id}.{file_ext}"
-        
-        # Create patient folder
-        patient_folder = os.path.join(UPLOAD_FOLDER, f"patient_{patient_id}")
-        os.makedirs(patient_folder, exist_ok=True)
-        
-        # Save file
-        file_path = os.path.join(patient_folder, unique_filename)
-        file.save(file_path)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
+        original_filename = secure_filename(upload['filename'])
+        content_hash, file_path = store_blob(upload['writer'])
         
         # Create database record
         medical_file = MedicalFile(
@@ -114,8 +130,9 @@ def upload_file(patient_id):
             file_name=original_filename,
             file_path=file_path,
             file_type=file_type,
-            file_size=file_size,
-            mime_type=file.content_type,
+            file_size=upload['writer'].size,
+            mime_type=upload['content_type'],
+            content_hash=content_hash,
             category=category,
             description=description,
             date_taken=datetime.fromisoformat(date_taken) if date_taken else None
@@ -124,11 +141,158 @@ def upload_file(patient_id):
         db.session.add(medical_file)
         db.session.commit()
         
+        # Thumbnails are made by the background pool, never in this request
+        schedule_thumbnails(file_path, original_filename, patient_id, medical_file.id)
+        
         return jsonify({
             'message': 'تم رفع الملف بنجاح',
             'file': medical_file.to_dict()
         }), 201
         
+    except FileTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        db.session.rollback()
+        if upload:
+            upload['writer'].discard()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        if upload:
+            upload['writer'].discard()
+        return jsonify({'error': str(e)}), 500
+
+
+# ==================== Resumable Uploads ====================
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def get_own_upload(upload_id):
+    """Return (upload, None) or (None, error response) for the logged-in uploader"""
+    if 'user_id' not in session:
+        return None, (jsonify({'error': 'يجب تسجيل الدخول أولاً'}), 401)
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None:
+        return None, (jsonify({'error': 'عملية الرفع غير موجودة أو انتهت صلاحيتها'}), 404)
+    if upload.uploaded_by != session['user_id']:
+        return None, (jsonify({'error': 'غير مصرح لك'}), 403)
+    return upload, None
+
+
+@medical_files_bp.route('/patients/<int:patient_id>/uploads', methods=['POST'])
+def initiate_upload(patient_id):
+    """Start a resumable upload: {file_name, file_size, mime_type, category, description, date_taken}"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'يجب تسجيل الدخول أولاً'}), 401
+        
+        Patient.query.get_or_404(patient_id)
+        data = request.get_json() or {}
+        
+        file_name = secure_filename(data.get('file_name') or '')
+        if not file_name:
+            return jsonify({'error': 'لم يتم اختيار ملف'}), 400
+        file_type = get_file_type(file_name)
+        if not allowed_file(file_name, file_type):
+            return jsonify({'error': 'نوع الملف غير مدعوم'}), 400
+        
+        date_taken = data.get('date_taken')
+        upload = create_upload(
+            patient_id=patient_id,
+            uploaded_by=session['user_id'],
+            file_name=file_name,
+            file_type=file_type,
+            mime_type=data.get('mime_type'),
+            category=data.get('category', 'other'),
+            description=data.get('description', ''),
+            date_taken=datetime.fromisoformat(date_taken) if date_taken else None,
+            total_size=int(data.get('file_size'))
+        )
+        return jsonify(progress(upload)), 201
+    except FileTooLargeError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 413
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Write one chunk; the position comes from ?offset= or a Content-Range header"""
+    try:
+        upload, error = get_own_upload(upload_id)
+        if error:
+            return error
+        
+        content_range = CONTENT_RANGE.fullmatch(request.headers.get('Content-Range', ''))
+        if content_range:
+            offset = int(content_range.group(1))
+        elif request.args.get('offset') is not None:
+            offset = int(request.args['offset'])
+        else:
+            return jsonify({'error': 'يجب تحديد offset أو Content-Range'}), 400
+        if request.content_length is None:
+            return jsonify({'error': 'يجب تحديد Content-Length'}), 411
+        
+        upload = write_chunk(upload, offset, request.stream, request.content_length)
+        return jsonify(progress(upload)), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload_progress(upload_id):
+    """Get how much of an upload has arrived and which ranges are missing"""
+    try:
+        upload, error = get_own_upload(upload_id)
+        if error:
+            return error
+        return jsonify(progress(upload)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Finish an upload once every byte has arrived (optional {"sha256": ...} check)"""
+    try:
+        upload, error = get_own_upload(upload_id)
+        if error:
+            return error
+        
+        data = request.get_json(silent=True) or {}
+        medical_file = finish_upload(upload, expected_sha256=data.get('sha256'))
+        schedule_thumbnails(medical_file.file_path, medical_file.file_name, medical_file.patient_id, medical_file.id)
+        return jsonify({
+            'message': 'تم رفع الملف بنجاح',
+            'file': medical_file.to_dict()
+        }), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """Cancel an upload and free its disk space"""
+    try:
+        upload, error = get_own_upload(upload_id)
+        if error:
+            return error
+        abort_upload(upload)
+        return jsonify({'message': 'تم إلغاء الرفع'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -144,20 +308,151 @@ def get_file(file_id):
         return jsonify({'error': str(e)}), 500
 
 
+def serve_file(path, file_name, mime_type, etag=None, last_modified=None, as_attachment=False,
+               max_age=FILE_CACHE_MAX_AGE):
+    """Send stored content with validators, Range support and optional web-server offload.
+
+    ``etag`` is the content hash when there is one, giving a strong ETag
+    that stays valid across workers and restarts; otherwise werkzeug
+    derives one from the file's mtime and size. In x-accel / x-sendfile
+    mode the worker only answers 304s itself and leaves reading the file
+    (including Range requests) to the web server.
+    """
+    if not os.path.exists(path):
+        return jsonify({'error': 'الملف غير موجود'}), 404
+    
+    mime_type = mime_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    relative = os.path.relpath(path, UPLOAD_FOLDER)
+    offload = FILE_SEND_MODE in ('x-accel', 'x-sendfile') and not relative.startswith('..')
+    
+    if not offload:
+        response = send_file(
+            path,
+            mimetype=mime_type,
+            as_attachment=as_attachment,
+            download_name=file_name,
+            conditional=True,
+            etag=etag or True,
+            last_modified=last_modified,
+            max_age=max_age
+        )
+    else:
+        response = Response(mimetype=mime_type)
+        response.headers['Content-Disposition'] = content_disposition(file_name, as_attachment)
+        if FILE_SEND_MODE == 'x-accel':
+            response.headers['X-Accel-Redirect'] = FILE_ACCEL_PREFIX + quote(relative.replace(os.sep, '/'))
+        else:
+            response.headers['X-Sendfile'] = path
+        if etag:
+            response.set_etag(etag)
+        response.last_modified = last_modified or datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+        response.cache_control.max_age = max_age
+        response = response.make_conditional(request)
+    
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
+
+
+def serve_object(key, file_name, mime_type, etag=None, last_modified=None, as_attachment=False,
+                 max_age=FILE_CACHE_MAX_AGE):
+    """Stream content from a remote storage backend, fetching only the requested Range"""
+    size = storage.size(key)
+    if size is None:
+        return jsonify({'error': 'الملف غير موجود'}), 404
+    
+    reader = ObjectReader(storage, key, size)
+    response = Response(
+        wrap_file(request.environ, reader),
+        mimetype=mime_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = content_disposition(file_name, as_attachment)
+    response.content_length = size
+    if etag:
+        response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.max_age = max_age
+    response.cache_control.private = True
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+
+
+def serve_compressed(medical_file, as_attachment, max_age=FILE_CACHE_MAX_AGE):
+    """Decompress a file of the cold tier while sending it.
+
+    Compressed content can't be read from an offset, so Range is not
+    offered and the whole file is sent; validators still allow 304s.
+    """
+    response = Response(
+        iter_content(medical_file.file_path, medical_file.blob.codec),
+        mimetype=medical_file.mime_type or mimetypes.guess_type(medical_file.file_name)[0] or 'application/octet-stream'
+    )
+    response.headers['Content-Disposition'] = content_disposition(medical_file.file_name, as_attachment)
+    response.content_length = medical_file.blob.size
+    response.set_etag(medical_file.content_hash)
+    response.last_modified = medical_file.uploaded_at
+    response.cache_control.max_age = max_age
+    response.cache_control.private = True
+    return response.make_conditional(request)
+
+
+def serve_medical_file(medical_file, as_attachment):
+    key = medical_file.file_path
+    if medical_file.content_hash and medical_file.blob.codec:
+        return serve_compressed(medical_file, as_attachment)
+    path = storage.local_path(key)
+    if path:
+        return serve_file(
+            path,
+            medical_file.file_name,
+            medical_file.mime_type,
+            etag=medical_file.content_hash,
+            last_modified=medical_file.uploaded_at,
+            as_attachment=as_attachment
+        )
+    
+    # Remote store: let the client download straight from it
+    if STORAGE_REDIRECT_DOWNLOADS:
+        url = storage.presigned_url(key, medical_file.file_name, medical_file.mime_type, as_attachment)
+        if url:
+            response = redirect(url)
+            response.cache_control.no_store = True
+            return response
+    return serve_object(
+        key,
+        medical_file.file_name,
+        medical_file.mime_type,
+        etag=medical_file.content_hash,
+        last_modified=medical_file.uploaded_at,
+        as_attachment=as_attachment
+    )
+
+
+@medical_files_bp.route('/storage/<path:key>', methods=['GET'])
+def download_presigned(key):
+    """Serve a presigned URL of the local object store (STORAGE_BACKEND=object)"""
+    try:
+        if storage.name != 'object' or not storage.verify(key, request.args):
+            return jsonify({'error': 'الرابط غير صالح أو منتهي الصلاحية'}), 403
+        return serve_object(
+            key,
+            request.args['name'],
+            request.args.get('type'),
+            as_attachment=request.args.get('attachment') == '1',
+            max_age=STORAGE_URL_TTL
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @medical_files_bp.route('/files/<int:file_id>/download', methods=['GET'])
 def download_file(file_id):
-    """Download a medical file"""
+    """Download a medical file (supports Range and If-None-Match)"""
     try:
         medical_file = MedicalFile.query.get_or_404(file_id)
-        
-        if not os.path.exists(medical_file.file_path):
-            return jsonify({'error': 'الملف غير موجود'}), 404
-        
-        return send_file(
-            medical_file.file_path,
-            as_attachment=True,
-            download_name=medical_file.file_name
-        )
+        return serve_medical_file(medical_file, as_attachment=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -167,14 +462,42 @@ def view_file(file_id):
     """View a medical file (for images and PDFs)"""
     try:
         medical_file = MedicalFile.query.get_or_404(file_id)
+        return serve_medical_file(medical_file, as_attachment=False)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/files/<int:file_id>/thumbnail', methods=['GET'])
+def get_file_thumbnail(file_id):
+    """Get a JPEG thumbnail of an image or the first page of a PDF (?size=small|medium|large)"""
+    try:
+        size = request.args.get('size', DEFAULT_THUMBNAIL_SIZE)
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({'error': f"الحجم يجب أن يكون أحد: {', '.join(THUMBNAIL_SIZES)}"}), 400
         
-        if not os.path.exists(medical_file.file_path):
-            return jsonify({'error': 'الملف غير موجود'}), 404
-        
-        return send_file(
-            medical_file.file_path,
-            mimetype=medical_file.mime_type
+        medical_file = MedicalFile.query.get_or_404(file_id)
+        path = get_thumbnail(
+            medical_file.file_path, medical_file.file_name, medical_file.patient_id, medical_file.id, size
         )
+        if path is None:
+            response = jsonify({'message': 'جاري إنشاء الصورة المصغرة'})
+            response.headers['Retry-After'] = '2'
+            return response, 202
+        
+        response = serve_file(
+            path,
+            f'{file_id}_{size}.jpg',
+            'image/jpeg',
+            etag=f'{medical_file.content_hash}-{size}' if medical_file.content_hash else None,
+            last_modified=medical_file.uploaded_at,
+            max_age=365 * 24 * 3600
+        )
+        # A file's content never changes, so neither do its thumbnails
+        if not isinstance(response, tuple):
+            response.cache_control.immutable = True
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -217,14 +540,21 @@ def delete_file(file_id):
         
         medical_file = MedicalFile.query.get_or_404(file_id)
         
-        # Delete physical file
-        if os.path.exists(medical_file.file_path):
-            os.remove(medical_file.file_path)
+        # Shared content is only removed with its last reference
+        if medical_file.content_hash:
+            unused_path = release_blob(medical_file.content_hash)
+        else:
+            unused_path = medical_file.file_path
         
         # Delete database record
         db.session.delete(medical_file)
         db.session.commit()
         
+        # Delete physical file once nothing refers to it
+        if unused_path:
+            remove_file(unused_path)
+        remove_thumbnails(medical_file.patient_id, medical_file.id)
+        
         return jsonify({'message': 'تم حذف الملف بنجاح'}), 200
         
     except Exception as e:
@@ -250,26 +580,28 @@ def get_categories():
 def get_patient_files_stats(patient_id):
     """Get statistics about patient's files"""
     try:
-        files = MedicalFile.query.filter_by(patient_id=patient_id).all()
-        
-        stats = {
-            'total': len(files),
-            'by_category': {},
-            'by_type': {},
-            'total_size': 0
-        }
-        
-        for file in files:
-            # Count by category
-            stats['by_category'][file.category] = stats['by_category'].get(file.category, 0) + 1
-            
-            # Count by type
-            stats['by_type'][file.file_type] = stats['by_type'].get(file.file_type, 0) + 1
-            
-            # Total size
-            stats['total_size'] += file.file_size or 0
-        
-        return jsonify(stats), 200
+        return jsonify(patient_file_stats(patient_id)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@medical_files_bp.route('/files/tiering-report', methods=['GET'])
+@admin_required
+def get_tiering_report():
+    """Get space reclaimed by compressing cold files and the decompression cost (Admin only)"""
+    try:
+        return jsonify(tiering_report(db.engine)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@medical_files_bp.route('/files/storage-report', methods=['GET'])
+@admin_required
+def get_storage_report():
+    """Get disk usage by category, patient, uploader and day (Admin only)"""
+    try:
+        top = min(request.args.get('top', 20, type=int), 200)
+        days = min(request.args.get('days', 30, type=int), 366)
+        return jsonify(storage_report(top=top, days=days)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
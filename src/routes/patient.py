@@ -1,18 +1,72 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 from src.database import db
 from src.models.patient import Patient, ClinicVisit, WardAdmission, Surgery, EmergencyCase
-from datetime import datetime, date, time
+from src.utils.pagination import apply_filters, is_paginated, paginate, parse_limit, parse_date_arg
+from src.utils.serializers import serialize_all
+from src.utils.streaming import wants_stream, iter_rows, stream_json
+from src.utils.cache import TTLCache
+from src.services.patient_import import iter_records, import_patients, export_patients
+from src.services.search import search_patient_ids
+from src.services.events import broker, publish
+from src.services.triage import EMERGENCY_CHANNEL, breaches, claim_next_case, triage_order, waiting_queue
+from src.services.clinical import sync_admission_medications, sync_case_vitals
+from src.services.beds import ADMITTED, bed_is_taken, occupancy
+from src.services.timeline import KINDS, decode_cursor, patient_timeline
+from src.services.scheduler import (
+    DEFAULT_SURGERY_MINUTES, INACTIVE_STATUSES, MAX_SURGERY_MINUTES, find_conflicts, load_room_schedule,
+    parse_duration
+)
+from datetime import datetime, date, time, timedelta
+import hashlib
+import json
+import os
+import queue
+import threading
 
 patient_bp = Blueprint('patient', __name__)
 
+# Dashboard counters are polled by every open tab, so keep them for a few seconds
+STATISTICS_CACHE_TTL = float(os.environ.get('STATISTICS_CACHE_TTL', 10))
+statistics_cache = TTLCache(ttl=STATISTICS_CACHE_TTL, maxsize=4)
+
+
+def invalidate_statistics():
+    """Drop cached dashboard counters after a write"""
+    statistics_cache.clear()
+
 # ==================== Patient Routes ====================
 
 @patient_bp.route('/patients', methods=['GET'])
 def get_patients():
-    """Get all patients"""
+    """Get all patients, or one page of them when ?after=/?limit=/?fields= is given"""
+    try:
+        query = apply_filters(Patient.query, request.args, date_column=Patient.created_at)
+        if is_paginated(request.args):
+            return jsonify(paginate(query, Patient, request.args)), 200
+
+        if wants_stream(request.args):
+            return stream_json(iter_rows(query, Patient))
+        return jsonify(serialize_all(query, Patient)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@patient_bp.route('/patients/search', methods=['GET'])
+def search_patients():
+    """Search patients by part of a name, phone number or national ID"""
     try:
-        patients = Patient.query.all()
-        return jsonify([patient.to_dict() for patient in patients]), 200
+        ids = search_patient_ids(request.args.get('q', ''), parse_limit(request.args, default=20))
+        if not ids:
+            return jsonify([]), 200
+
+        rows = serialize_all(Patient.query.filter(Patient.id.in_(ids)), Patient)
+        by_id = {row['id']: row for row in rows}
+        return jsonify([by_id[patient_id] for patient_id in ids if patient_id in by_id]), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -25,6 +79,42 @@ def get_patient(patient_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
+@patient_bp.route('/patients/<int:patient_id>/timeline', methods=['GET'])
+def get_patient_timeline(patient_id):
+    """Get all encounters of a patient merged into one newest-first timeline"""
+    try:
+        patient = db.session.get(Patient, patient_id)
+        if not patient:
+            return jsonify({'error': 'المريض غير موجود'}), 404
+
+        start = end = cursor = kinds = None
+        if request.args.get('from'):
+            start = parse_date_arg(request.args['from'], 'from')
+        if request.args.get('to'):
+            end = parse_date_arg(request.args['to'], 'to')
+            if len(request.args['to']) == 10:
+                end = datetime.combine(end.date(), time.max)
+        if request.args.get('before'):
+            cursor = decode_cursor(request.args['before'])
+        if request.args.get('types'):
+            kinds = request.args['types'].split(',')
+            unknown = [kind for kind in kinds if kind not in KINDS]
+            if unknown:
+                raise ValueError(f"أنواع غير معروفة: {', '.join(unknown)}")
+
+        items, next_cursor = patient_timeline(
+            patient_id, start, end, cursor, parse_limit(request.args), kinds
+        )
+        return jsonify({
+            'patient': patient.to_dict(),
+            'items': items,
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @patient_bp.route('/patients', methods=['POST'])
 def create_patient():
     """Create a new patient"""
@@ -42,6 +132,7 @@ def create_patient():
         )
         db.session.add(patient)
         db.session.commit()
+        invalidate_statistics()
         return jsonify(patient.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -64,19 +155,68 @@ def update_patient(patient_id):
         patient.chronic_diseases = data.get('chronic_diseases', patient.chronic_diseases)
         
         db.session.commit()
+        invalidate_statistics()
         return jsonify(patient.to_dict()), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def requested_format():
+    """Pick csv or ndjson from ?format= or the request content type"""
+    file_format = request.args.get('format')
+    if not file_format:
+        file_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if file_format not in ('csv', 'ndjson'):
+        raise ValueError('الصيغة المدعومة: csv أو ndjson')
+    return file_format
+
+@patient_bp.route('/patients/bulk', methods=['POST'])
+def bulk_import_patients():
+    """Import patients from a streamed NDJSON or CSV body (upsert on national_id)"""
+    try:
+        file_format = requested_format()
+        summary = import_patients(iter_records(request.stream, file_format))
+        invalidate_statistics()
+        status = 200 if not summary['errors'] else 207
+        return jsonify(summary), status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@patient_bp.route('/patients/export', methods=['GET'])
+def bulk_export_patients():
+    """Stream all patients as NDJSON or CSV"""
+    try:
+        file_format = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(export_patients(file_format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=patients.{file_format}'
+    return response
+
 # ==================== Clinic Visit Routes ====================
 
 @patient_bp.route('/clinic-visits', methods=['GET'])
 def get_clinic_visits():
-    """Get all clinic visits"""
+    """Get all clinic visits, or one page of them when ?after=/?limit=/?fields= is given"""
     try:
-        visits = ClinicVisit.query.order_by(ClinicVisit.visit_date.desc()).all()
-        return jsonify([visit.to_dict() for visit in visits]), 200
+        query = apply_filters(
+            ClinicVisit.query, request.args,
+            date_column=ClinicVisit.visit_date, status_column=ClinicVisit.status
+        )
+        if is_paginated(request.args):
+            return jsonify(paginate(query, ClinicVisit, request.args)), 200
+
+        query = query.order_by(ClinicVisit.visit_date.desc())
+        if wants_stream(request.args):
+            return stream_json(iter_rows(query, ClinicVisit))
+        return jsonify(serialize_all(query, ClinicVisit)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -107,6 +247,7 @@ def create_clinic_visit():
         )
         db.session.add(visit)
         db.session.commit()
+        invalidate_statistics()
         return jsonify(visit.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -132,6 +273,7 @@ def update_clinic_visit(visit_id):
         visit.notes = data.get('notes', visit.notes)
         
         db.session.commit()
+        invalidate_statistics()
         return jsonify(visit.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -139,12 +281,44 @@ def update_clinic_visit(visit_id):
 
 # ==================== Ward Admission Routes ====================
 
+def bed_taken():
+    return jsonify({'error': 'السرير مشغول بمريض آخر'}), 409
+
+def check_bed(room_number, bed_number, ignore_id=None):
+    """Return an error response if the bed is unknown or already occupied.
+
+    Two requests can both pass this check; the unique index on admitted
+    beds then rejects the second commit, which the routes also turn
+    into a 409.
+    """
+    if not room_number or not bed_number:
+        return None
+    occupancy.refresh()
+    if occupancy.has_registry() and not occupancy.is_registered(room_number, bed_number):
+        return jsonify({'error': 'السرير غير مسجل'}), 400
+    if bed_is_taken(room_number, bed_number, ignore_id):
+        return bed_taken()
+    return None
+
 @patient_bp.route('/ward-admissions', methods=['GET'])
 def get_ward_admissions():
-    """Get all ward admissions"""
+    """Get current ward admissions (?status= overrides), paginated when requested"""
     try:
-        admissions = WardAdmission.query.filter_by(status='منوم').all()
-        return jsonify([admission.to_dict() for admission in admissions]), 200
+        query = WardAdmission.query
+        if not request.args.get('status'):
+            query = query.filter_by(status='منوم')
+        query = apply_filters(
+            query, request.args,
+            date_column=WardAdmission.admission_date, status_column=WardAdmission.status
+        )
+        if is_paginated(request.args):
+            return jsonify(paginate(query, WardAdmission, request.args)), 200
+
+        if wants_stream(request.args):
+            return stream_json(iter_rows(query, WardAdmission))
+        return jsonify(serialize_all(query, WardAdmission)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -162,6 +336,11 @@ def create_ward_admission():
     """Create a new ward admission"""
     try:
         data = request.get_json()
+        
+        error = check_bed(data.get('room_number'), data.get('bed_number'))
+        if error:
+            return error
+        
         admission = WardAdmission(
             patient_id=data.get('patient_id'),
             admission_date=datetime.utcnow(),
@@ -174,8 +353,15 @@ def create_ward_admission():
             status='منوم'
         )
         db.session.add(admission)
+        db.session.flush()
+        sync_admission_medications(admission, ordered_by=session.get('user_id'))
         db.session.commit()
+        invalidate_statistics()
+        occupancy.occupy(admission.room_number, admission.bed_number, admission.id)
         return jsonify(admission.to_dict()), 201
+    except IntegrityError:
+        db.session.rollback()
+        return bed_taken()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -186,32 +372,94 @@ def update_ward_admission(admission_id):
     try:
         admission = WardAdmission.query.get_or_404(admission_id)
         data = request.get_json()
+        previous_bed = (admission.room_number, admission.bed_number)
+        
+        room_number = data.get('room_number', admission.room_number)
+        bed_number = data.get('bed_number', admission.bed_number)
+        status = data.get('status', admission.status)
+        # Moving to another bed, or re-admitting a discharged patient
+        if status == ADMITTED and ((room_number, bed_number) != previous_bed or admission.status != ADMITTED):
+            error = check_bed(room_number, bed_number, ignore_id=admission.id)
+            if error:
+                return error
         
         admission.room_number = data.get('room_number', admission.room_number)
         admission.bed_number = data.get('bed_number', admission.bed_number)
         admission.diagnosis = data.get('diagnosis', admission.diagnosis)
         admission.condition = data.get('condition', admission.condition)
+        previous_medications = admission.medications
         admission.medications = data.get('medications', admission.medications)
         admission.daily_notes = data.get('daily_notes', admission.daily_notes)
         admission.status = data.get('status', admission.status)
         
         if data.get('status') == 'خرج' and not admission.discharge_date:
             admission.discharge_date = datetime.utcnow()
+        if admission.medications != previous_medications:
+            sync_admission_medications(admission, ordered_by=session.get('user_id'))
         
         db.session.commit()
+        invalidate_statistics()
+        occupancy.release(*previous_bed, admission.id)
+        if admission.status == ADMITTED:
+            occupancy.occupy(admission.room_number, admission.bed_number, admission.id)
         return jsonify(admission.to_dict()), 200
+    except IntegrityError:
+        db.session.rollback()
+        return bed_taken()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # ==================== Surgery Routes ====================
 
+def check_room_conflicts(surgery, data):
+    """Return a 409 response if the surgery overlaps another booking of its room.
+
+    Sending "allow_overlap": true books it anyway; the overlaps are then
+    only reported in the response. Durations above MAX_SURGERY_MINUTES
+    are refused with 400.
+    """
+    if (parse_duration(surgery.duration) or 0) > MAX_SURGERY_MINUTES:
+        return jsonify({'error': f'مدة العملية أطول من الحد المسموح ({MAX_SURGERY_MINUTES} دقيقة)'}), 400
+    if surgery.status in INACTIVE_STATUSES:
+        return None
+    with db.session.no_autoflush:
+        conflicts = find_conflicts(
+            surgery.operating_room, surgery.surgery_date, surgery.surgery_time,
+            surgery.duration, ignore_id=surgery.id
+        )
+    if not conflicts or data.get('allow_overlap'):
+        return None
+
+    start = datetime.combine(surgery.surgery_date, surgery.surgery_time)
+    minutes = parse_duration(surgery.duration) or DEFAULT_SURGERY_MINUTES
+    # The surgery being moved must not block its own new slot
+    slot = load_room_schedule(
+        surgery.operating_room, surgery.surgery_date, exclude_id=surgery.id
+    ).next_free_slot(minutes, start)
+    return jsonify({
+        'error': 'غرفة العمليات محجوزة في هذا الوقت',
+        'conflicts': conflicts,
+        'next_free_slot': slot.isoformat() if slot else None
+    }), 409
+
 @patient_bp.route('/surgeries', methods=['GET'])
 def get_surgeries():
-    """Get all surgeries"""
+    """Get all surgeries, or one page of them when ?after=/?limit=/?fields= is given"""
     try:
-        surgeries = Surgery.query.order_by(Surgery.surgery_date.desc()).all()
-        return jsonify([surgery.to_dict() for surgery in surgeries]), 200
+        query = apply_filters(
+            Surgery.query, request.args,
+            date_column=Surgery.surgery_date, status_column=Surgery.status
+        )
+        if is_paginated(request.args):
+            return jsonify(paginate(query, Surgery, request.args)), 200
+
+        query = query.order_by(Surgery.surgery_date.desc())
+        if wants_stream(request.args):
+            return stream_json(iter_rows(query, Surgery))
+        return jsonify(serialize_all(query, Surgery)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -242,8 +490,15 @@ def create_surgery():
             post_op_notes=data.get('post_op_notes'),
             complications=data.get('complications')
         )
+        
+        conflict = check_room_conflicts(surgery, data)
+        if conflict:
+            db.session.rollback()
+            return conflict
+        
         db.session.add(surgery)
         db.session.commit()
+        invalidate_statistics()
         return jsonify(surgery.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -270,21 +525,184 @@ def update_surgery(surgery_id):
         surgery.post_op_notes = data.get('post_op_notes', surgery.post_op_notes)
         surgery.complications = data.get('complications', surgery.complications)
         
+        conflict = check_room_conflicts(surgery, data)
+        if conflict:
+            db.session.rollback()
+            return conflict
+        
         db.session.commit()
+        invalidate_statistics()
         return jsonify(surgery.to_dict()), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@patient_bp.route('/operating-rooms/<room>/schedule', methods=['GET'])
+def get_room_schedule(room):
+    """Get the bookings of an operating room for one day (?date=YYYY-MM-DD)"""
+    try:
+        day = parse_date_arg(request.args.get('date', date.today().isoformat()), 'date').date()
+        schedule = load_room_schedule(room, day)
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
+        bookings = [
+            {'surgery_id': surgery_id, 'start': start.isoformat(), 'end': end.isoformat()}
+            for start, end, surgery_id in zip(schedule.starts, schedule.ends, schedule.ids)
+            if start < day_end and end > day_start
+        ]
+        return jsonify({'room': room, 'date': day.isoformat(), 'bookings': bookings}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@patient_bp.route('/operating-rooms/<room>/next-slot', methods=['GET'])
+def get_room_next_slot(room):
+    """Find the next free slot of an operating room (?date=&after=HH:MM&duration=)"""
+    try:
+        day = parse_date_arg(request.args.get('date', date.today().isoformat()), 'date').date()
+        after = datetime.strptime(request.args.get('after', '00:00'), '%H:%M').time()
+        minutes = parse_duration(request.args.get('duration')) or DEFAULT_SURGERY_MINUTES
+        day_end = datetime.combine(day + timedelta(days=1), time.min)
+
+        slot = load_room_schedule(room, day).next_free_slot(
+            minutes, datetime.combine(day, after), not_after=day_end
+        )
+        return jsonify({
+            'room': room,
+            'duration_minutes': minutes,
+            'start': slot.isoformat() if slot else None,
+            'end': (slot + timedelta(minutes=minutes)).isoformat() if slot else None
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== Emergency Case Routes ====================
 
 @patient_bp.route('/emergency-cases', methods=['GET'])
 def get_emergency_cases():
-    """Get all emergency cases"""
+    """Get open emergency cases (?status= overrides), paginated when requested"""
+    try:
+        query = EmergencyCase.query
+        if not request.args.get('status'):
+            query = query.filter(EmergencyCase.status != 'تم الخروج')
+        query = apply_filters(
+            query, request.args,
+            date_column=EmergencyCase.arrival_time, status_column=EmergencyCase.status
+        )
+        if is_paginated(request.args):
+            return jsonify(paginate(query, EmergencyCase, request.args)), 200
+
+        # Triage order: most severe first, then longest waiting
+        query = query.order_by(*triage_order())
+        if wants_stream(request.args):
+            return stream_json(iter_rows(query, EmergencyCase))
+        return jsonify(serialize_all(query, EmergencyCase)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+SSE_KEEPALIVE_SECONDS = 15
+# Each open stream holds a gunicorn thread for its whole life; past this many per
+# worker, clients get 503 and retry, so streams can't take every thread from the API
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 4))
+SSE_RETRY_AFTER_SECONDS = 30
+stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+def sse_message(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@patient_bp.route('/emergency-cases/stream', methods=['GET'])
+def stream_emergency_cases():
+    """Server-Sent Events: a snapshot of open cases, then created/updated events"""
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'عدد الاتصالات المفتوحة كبير، حاول لاحقاً'})
+        response.headers['Retry-After'] = str(SSE_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    # Subscribe before reading the snapshot so no event falls in between
+    subscriber = broker.subscribe(EMERGENCY_CHANNEL)
+    closed = threading.Event()
+
+    def close():
+        # Also runs when the client leaves before the generator starts
+        if not closed.is_set():
+            closed.set()
+            broker.unsubscribe(EMERGENCY_CHANNEL, subscriber)
+            stream_slots.release()
+
     try:
-        cases = EmergencyCase.query.filter(EmergencyCase.status != 'تم الخروج').order_by(EmergencyCase.arrival_time.desc()).all()
-        return jsonify([case.to_dict() for case in cases]), 200
+        query = EmergencyCase.query.filter(EmergencyCase.status != 'تم الخروج').order_by(*triage_order())
+        snapshot = serialize_all(query, EmergencyCase)
     except Exception as e:
+        close()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Give the connection back to the pool for the lifetime of the stream
+        db.session.remove()
+
+    def events():
+        yield 'retry: 3000\n\n'
+        yield sse_message('snapshot', snapshot)
+        while True:
+            try:
+                event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            yield sse_message(event['type'], event['data'])
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(close)
+    return response
+
+def with_case_details(entries):
+    """Attach each queued case's record, read with one query"""
+    ids = [entry['id'] for entry in entries]
+    cases = serialize_all(EmergencyCase.query.filter(EmergencyCase.id.in_(ids)), EmergencyCase) if ids else []
+    by_id = {case['id']: case for case in cases}
+    for entry in entries:
+        entry['case'] = by_id.get(entry['id'])
+    return entries
+
+@patient_bp.route('/emergency-cases/queue', methods=['GET'])
+def get_triage_queue():
+    """Get waiting cases in triage order with wait times against the targets"""
+    try:
+        entries = waiting_queue(limit=request.args.get('limit', type=int))
+        return jsonify(with_case_details(entries)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@patient_bp.route('/emergency-cases/breaches', methods=['GET'])
+def get_triage_breaches():
+    """Get waiting cases past their target wait, most overdue first"""
+    try:
+        return jsonify(with_case_details(breaches())), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@patient_bp.route('/emergency-cases/next', methods=['POST'])
+def next_emergency_case():
+    """Take the most urgent waiting case and move it to assessment"""
+    try:
+        case = claim_next_case()
+        if case is None:
+            return jsonify({'error': 'لا توجد حالات في الانتظار'}), 404
+        invalidate_statistics()
+        
+        result = case.to_dict()
+        publish(EMERGENCY_CHANNEL, 'updated', result)
+        return jsonify(result), 200
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @patient_bp.route('/emergency-cases/<int:case_id>', methods=['GET'])
@@ -313,8 +731,14 @@ def create_emergency_case():
             notes=data.get('notes')
         )
         db.session.add(case)
+        db.session.flush()
+        sync_case_vitals(case, recorded_by=session.get('user_id'))
         db.session.commit()
-        return jsonify(case.to_dict()), 201
+        invalidate_statistics()
+        
+        result = case.to_dict()
+        publish(EMERGENCY_CHANNEL, 'created', result)
+        return jsonify(result), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -329,39 +753,61 @@ def update_emergency_case(case_id):
         case.complaint = data.get('complaint', case.complaint)
         case.priority = data.get('priority', case.priority)
         case.status = data.get('status', case.status)
+        previous_vitals = case.vital_signs
         case.vital_signs = data.get('vital_signs', case.vital_signs)
         case.initial_assessment = data.get('initial_assessment', case.initial_assessment)
         case.decision = data.get('decision', case.decision)
         case.notes = data.get('notes', case.notes)
+        if case.vital_signs != previous_vitals:
+            sync_case_vitals(case, recorded_at=datetime.utcnow(), recorded_by=session.get('user_id'))
         
         db.session.commit()
-        return jsonify(case.to_dict()), 200
+        invalidate_statistics()
+        
+        result = case.to_dict()
+        publish(EMERGENCY_CHANNEL, 'updated', result)
+        return jsonify(result), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # ==================== Statistics Routes ====================
 
+def compute_statistics(today):
+    """Compute all dashboard counters in a single round trip"""
+    def count(model, *criteria):
+        return select(func.count(model.id)).where(*criteria).scalar_subquery()
+
+    row = db.session.query(
+        count(ClinicVisit, ClinicVisit.visit_date == today).label('today_appointments'),
+        count(WardAdmission, WardAdmission.status == 'منوم').label('ward_patients'),
+        count(
+            Surgery,
+            Surgery.surgery_date >= today,
+            Surgery.status.in_(['مجدولة', 'قيد التحضير'])
+        ).label('scheduled_surgeries'),
+        count(EmergencyCase, EmergencyCase.status != 'تم الخروج').label('emergency_cases'),
+        count(Patient).label('total_patients')
+    ).one()
+    return dict(row._mapping)
+
+
 @patient_bp.route('/statistics', methods=['GET'])
 def get_statistics():
-    """Get dashboard statistics"""
+    """Get dashboard statistics (cached, supports If-None-Match)"""
     try:
         today = date.today()
-        
-        stats = {
-            'today_appointments': ClinicVisit.query.filter_by(visit_date=today).count(),
-            'ward_patients': WardAdmission.query.filter_by(status='منوم').count(),
-            'scheduled_surgeries': Surgery.query.filter(
-                Surgery.surgery_date >= today,
-                Surgery.status.in_(['مجدولة', 'قيد التحضير'])
-            ).count(),
-            'emergency_cases': EmergencyCase.query.filter(
-                EmergencyCase.status != 'تم الخروج'
-            ).count(),
-            'total_patients': Patient.query.count()
-        }
-        
-        return jsonify(stats), 200
+        cached = statistics_cache.get(today)
+        if cached is None:
+            stats = compute_statistics(today)
+            etag = hashlib.sha1(json.dumps(stats, sort_keys=True).encode()).hexdigest()
+            cached = (stats, etag)
+            statistics_cache.set(today, cached)
+
+        stats, etag = cached
+        response = jsonify(stats)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
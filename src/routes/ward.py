@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify
+from src.database import db
+from src.models.ward import Bed
+from src.routes.auth import admin_required
+from src.services.beds import occupancy, occupancy_by_day
+from datetime import date, datetime, timedelta
+
+ward_bp = Blueprint('ward', __name__)
+
+
+@ward_bp.route('/beds', methods=['GET'])
+def get_beds():
+    """Get registered beds with their current admission (?ward= to filter)"""
+    try:
+        occupancy.refresh()
+        return jsonify(occupancy.beds(request.args.get('ward'))), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@ward_bp.route('/beds', methods=['POST'])
+@admin_required
+def create_bed():
+    """Register a bed (Admin only)"""
+    try:
+        data = request.get_json()
+        if not data.get('ward') or not data.get('room_number') or not data.get('bed_number'):
+            return jsonify({'error': 'القسم ورقم الغرفة ورقم السرير مطلوبة'}), 400
+
+        if Bed.query.filter_by(room_number=data.get('room_number'), bed_number=data.get('bed_number')).first():
+            return jsonify({'error': 'السرير مسجل مسبقاً'}), 400
+
+        bed = Bed(
+            ward=data.get('ward'),
+            room_number=data.get('room_number'),
+            bed_number=data.get('bed_number')
+        )
+        db.session.add(bed)
+        db.session.commit()
+        occupancy.add_bed(bed.ward, bed.room_number, bed.bed_number)
+        return jsonify(bed.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@ward_bp.route('/beds/free', methods=['GET'])
+def get_free_beds():
+    """Get beds without a current admission (?ward= to filter)"""
+    try:
+        occupancy.refresh()
+        return jsonify(occupancy.free_beds(request.args.get('ward'))), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@ward_bp.route('/beds/occupancy', methods=['GET'])
+def get_bed_occupancy():
+    """Get the number of occupied beds per day (?from=&to=&ward=, last 30 days by default)"""
+    try:
+        end = date.today()
+        if request.args.get('to'):
+            end = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+        start = end - timedelta(days=29)
+        if request.args.get('from'):
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+        if start > end or (end - start).days > 366:
+            return jsonify({'error': 'الفترة يجب ألا تتجاوز سنة'}), 400
+
+        ward = request.args.get('ward')
+        occupancy.refresh()
+        return jsonify({
+            'ward': ward,
+            'total_beds': len(occupancy.beds(ward)),
+            'days': occupancy_by_day(start, end, ward)
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from src.database import db
+from src.models.patient import WardAdmission
+from src.models.ward import Bed
+
+ADMITTED = 'منوم'
+# Other workers' admissions become visible after this many seconds
+BED_MAP_TTL = float(os.environ.get('BED_MAP_TTL', 30))
+
+
+class OccupancyMap:
+    """In-process map of registered beds and the admissions occupying them.
+
+    Lookups by (room, bed) are dictionary hits. The map is rebuilt from
+    the database in one pass on first use and whenever it is older than
+    BED_MAP_TTL, and updated in place by this worker's own writes. Double
+    booking is still checked against the database (bed_is_taken, backed by
+    a unique index on admitted beds), so a stale map can only affect what
+    is displayed, never what is stored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._beds = {}
+        self._wards = {}
+        self._occupied = {}
+        self._built_at = None
+
+    def rebuild(self):
+        beds = db.session.query(Bed.ward, Bed.room_number, Bed.bed_number).filter(Bed.is_active.isnot(False)).all()
+        admissions = db.session.query(
+            WardAdmission.id, WardAdmission.room_number, WardAdmission.bed_number
+        ).filter(
+            WardAdmission.status == ADMITTED,
+            WardAdmission.room_number.isnot(None),
+            WardAdmission.bed_number.isnot(None)
+        ).all()
+
+        with self._lock:
+            self._beds = {}
+            self._wards = {}
+            for ward, room, bed in beds:
+                self._beds[(room, bed)] = ward
+                self._wards.setdefault(ward, set()).add((room, bed))
+            self._occupied = {(room, bed): admission_id for admission_id, room, bed in admissions}
+            self._built_at = time.monotonic()
+
+    def refresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > BED_MAP_TTL:
+            self.rebuild()
+
+    def add_bed(self, ward, room, bed):
+        with self._lock:
+            self._beds[(room, bed)] = ward
+            self._wards.setdefault(ward, set()).add((room, bed))
+
+    def occupy(self, room, bed, admission_id):
+        if room and bed:
+            with self._lock:
+                self._occupied[(room, bed)] = admission_id
+
+    def release(self, room, bed, admission_id):
+        with self._lock:
+            if self._occupied.get((room, bed)) == admission_id:
+                del self._occupied[(room, bed)]
+
+    def is_registered(self, room, bed):
+        return (room, bed) in self._beds
+
+    def has_registry(self):
+        return bool(self._beds)
+
+    def occupant(self, room, bed):
+        return self._occupied.get((room, bed))
+
+    def ward_of(self, room, bed):
+        return self._beds.get((room, bed))
+
+    def beds(self, ward=None):
+        with self._lock:
+            keys = self._wards.get(ward, set()) if ward else self._beds.keys()
+            return [
+                {'ward': self._beds[key], 'room_number': key[0], 'bed_number': key[1],
+                 'admission_id': self._occupied.get(key)}
+                for key in sorted(keys)
+            ]
+
+    def free_beds(self, ward=None):
+        return [bed for bed in self.beds(ward) if bed['admission_id'] is None]
+
+
+occupancy = OccupancyMap()
+
+
+def bed_is_taken(room, bed, ignore_id=None):
+    """Check the database for another current admission in the same bed"""
+    query = WardAdmission.query.filter_by(room_number=room, bed_number=bed, status=ADMITTED)
+    if ignore_id is not None:
+        query = query.filter(WardAdmission.id != ignore_id)
+    return db.session.query(query.exists()).scalar()
+
+
+def occupancy_by_day(start, end, ward=None):
+    """Count occupied beds for each day in [start, end] from admission intervals"""
+    window_start = datetime.combine(start, datetime.min.time())
+    window_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    query = db.session.query(
+        WardAdmission.admission_date, WardAdmission.discharge_date
+    ).filter(
+        WardAdmission.admission_date < window_end,
+        (WardAdmission.discharge_date.is_(None)) | (WardAdmission.discharge_date >= window_start)
+    )
+    if ward:
+        query = query.join(
+            Bed, (Bed.room_number == WardAdmission.room_number) & (Bed.bed_number == WardAdmission.bed_number)
+        ).filter(Bed.ward == ward)
+
+    # Sweep line: +1 on the admission day, -1 the day after discharge
+    changes = {}
+    for admitted, discharged in query.all():
+        first = max(admitted.date(), start)
+        changes[first] = changes.get(first, 0) + 1
+        if discharged is not None:
+            after = discharged.date() + timedelta(days=1)
+            changes[after] = changes.get(after, 0) - 1
+
+    days = []
+    occupied = 0
+    day = start
+    while day <= end:
+        occupied += changes.get(day, 0)
+        days.append({'date': day.isoformat(), 'occupied': occupied})
+        day += timedelta(days=1)
+    return days
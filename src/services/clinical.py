@@ -0,0 +1,370 @@
+import json
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import exists
+from src.database import db
+from src.models.patient import Patient, WardAdmission, EmergencyCase
+from src.models.clinical import VitalSign, MedicationOrder
+from src.utils.arabic import normalize_arabic
+
+# Accepted range of each metric; readings outside it are rejected
+METRICS = {
+    'heart_rate': (0, 300),
+    'systolic_bp': (0, 300),
+    'diastolic_bp': (0, 250),
+    'respiratory_rate': (0, 100),
+    'temperature': (25, 45),
+    'spo2': (0, 100),
+    'blood_glucose': (0, 2000),
+    'pain_score': (0, 10),
+    'gcs': (3, 15),
+}
+BLOOD_PRESSURE = 'blood_pressure'
+
+# Key spellings found in the old vital_signs JSON / free text
+_ALIASES = {
+    'heart_rate': ('hr', 'pulse', 'heart rate', 'heartrate', 'النبض', 'نبض', 'معدل النبض'),
+    'respiratory_rate': ('rr', 'resp', 'respiration', 'respiratory rate', 'التنفس', 'معدل التنفس'),
+    'temperature': ('temp', 't', 'الحرارة', 'حرارة', 'درجة الحرارة'),
+    'spo2': ('sao2', 'o2', 'o2 sat', 'oxygen', 'oxygen saturation', 'sat', 'الأكسجين', 'تشبع الأكسجين'),
+    'blood_glucose': ('glucose', 'sugar', 'blood sugar', 'bs', 'rbs', 'السكر', 'سكر الدم'),
+    'pain_score': ('pain', 'الألم', 'ألم'),
+    'gcs': ('glasgow', 'غلاسكو'),
+    'systolic_bp': ('systolic', 'sbp', 'الانقباضي'),
+    'diastolic_bp': ('diastolic', 'dbp', 'الانبساطي'),
+    BLOOD_PRESSURE: ('bp', 'blood pressure', 'pressure', 'الضغط', 'ضغط', 'ضغط الدم'),
+}
+TIME_KEYS = ('recorded_at', 'time', 'at', 'date', 'الوقت')
+
+DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫', '01234567890123456789.')
+NUMBER = re.compile(r'-?\d+(?:[.,]\d+)?')
+PRESSURE = re.compile(r'(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)')
+LIST_SEPARATORS = re.compile(r'[,،;؛\n]+')
+
+# Rows copied per transaction by backfill_clinical_data
+BACKFILL_BATCH_SIZE = 500
+
+
+def _key(name):
+    return normalize_arabic(name).replace(' ', '').replace('_', '')
+
+
+KEYS = {_key(metric): metric for metric in list(METRICS) + [BLOOD_PRESSURE]}
+for _metric, _names in _ALIASES.items():
+    KEYS.update({_key(name): _metric for name in _names})
+
+
+def metric_for(key):
+    return KEYS.get(_key(key))
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER.search(str(value).translate(DIGITS))
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def vital_values(payload, strict=True):
+    """Turn {"spo2": 95, "bp": "120/80", ...} into {metric: value}.
+
+    With ``strict`` unknown metrics and out-of-range values raise
+    ValueError (API input); otherwise they are skipped (old free-form data).
+    """
+    values = {}
+    for key, raw in payload.items():
+        if key in TIME_KEYS or raw is None or raw == '':
+            continue
+        metric = metric_for(key)
+        if metric is None:
+            if strict:
+                raise ValueError(f'مؤشر حيوي غير معروف: {key}')
+            continue
+
+        if metric == BLOOD_PRESSURE:
+            match = PRESSURE.search(str(raw).translate(DIGITS))
+            if not match:
+                if strict:
+                    raise ValueError('ضغط الدم يجب أن يكون بالشكل 120/80')
+                continue
+            pairs = [('systolic_bp', float(match.group(1))), ('diastolic_bp', float(match.group(2)))]
+        else:
+            pairs = [(metric, _number(raw))]
+
+        for name, value in pairs:
+            low, high = METRICS[name]
+            if value is None or not low <= value <= high:
+                if strict:
+                    raise ValueError(f'قيمة غير صالحة لـ {name}: {raw}')
+                continue
+            values[name] = value
+    return values
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(str(value)) if value else None
+    except ValueError:
+        return None
+
+
+def parse_legacy_vitals(text):
+    """Read the old vital_signs field (JSON object, list of objects or free text).
+
+    Returns a list of (recorded_at or None, {metric: value}).
+    """
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        data = None
+
+    if isinstance(data, dict):
+        return [(_parse_time(next((data[key] for key in TIME_KEYS if key in data), None)), vital_values(data, strict=False))]
+    if isinstance(data, list):
+        readings = []
+        for item in data:
+            if isinstance(item, dict):
+                at = _parse_time(next((item[key] for key in TIME_KEYS if key in item), None))
+                readings.append((at, vital_values(item, strict=False)))
+        return readings
+
+    # Free text such as "BP 120/80, HR 90, SpO2 95%" or "النبض: 90، الحرارة 37.5"
+    pairs = {}
+    for part in LIST_SEPARATORS.split(str(text)):
+        # The key may hold digits ("SpO2", "O2 sat"); it ends at the first
+        # number after a space, ':' or '='. "HR90" is still read as HR.
+        match = re.match(r'\s*(.+?)(?:\s*[:=]\s*|\s+)([\d٠-٩].*)$', part) \
+            or re.match(r'\s*([^\d:=٠-٩]+?)([\d٠-٩].*)$', part)
+        if match:
+            pairs[match.group(1)] = match.group(2)
+    return [(None, vital_values(pairs, strict=False))]
+
+
+def record_vitals(patient_id, values, recorded_at=None, emergency_case_id=None,
+                  ward_admission_id=None, recorded_by=None, source='api'):
+    """Add one row per metric to the session (the caller commits)"""
+    recorded_at = recorded_at or datetime.utcnow()
+    rows = [
+        VitalSign(
+            patient_id=patient_id,
+            emergency_case_id=emergency_case_id,
+            ward_admission_id=ward_admission_id,
+            metric=metric,
+            value=value,
+            recorded_at=recorded_at,
+            recorded_by=recorded_by,
+            source=source
+        )
+        for metric, value in values.items()
+    ]
+    db.session.add_all(rows)
+    return rows
+
+
+def sync_case_vitals(case, recorded_at=None, recorded_by=None):
+    """Record the readings in a case's vital_signs text sent through the old API.
+
+    Timestamped readings already stored (a client sending back the whole
+    list with one reading appended) are not recorded twice, and a reading
+    without a time is only recorded for metrics whose value differs from
+    the latest one stored for the case, so editing one value of the text
+    adds one row.
+    """
+    stored = set()
+    latest = {}
+    rows = db.session.query(VitalSign.metric, VitalSign.value, VitalSign.recorded_at) \
+        .filter_by(emergency_case_id=case.id) \
+        .order_by(VitalSign.recorded_at.desc(), VitalSign.id.desc())
+    for metric, value, at in rows:
+        stored.add((metric, at))
+        latest.setdefault(metric, value)
+    for at, values in parse_legacy_vitals(case.vital_signs):
+        if at is None:
+            values = {metric: value for metric, value in values.items() if latest.get(metric) != value}
+        at = at or recorded_at or case.arrival_time
+        values = {metric: value for metric, value in values.items() if (metric, at) not in stored}
+        record_vitals(
+            case.patient_id, values, at,
+            emergency_case_id=case.id, recorded_by=recorded_by, source='legacy'
+        )
+        latest.update(values)
+
+
+def latest_vitals_text(**criteria):
+    """JSON of the latest value of each metric, for the old vital_signs field"""
+    rows = db.session.query(VitalSign.metric, VitalSign.value).filter_by(**criteria) \
+        .order_by(VitalSign.recorded_at.desc(), VitalSign.id.desc()).all()
+    latest = {}
+    for metric, value in rows:
+        latest.setdefault(metric, int(value) if value.is_integer() else value)
+    if 'systolic_bp' in latest and 'diastolic_bp' in latest:
+        latest[BLOOD_PRESSURE] = f"{latest.pop('systolic_bp')}/{latest.pop('diastolic_bp')}"
+    return json.dumps(latest, ensure_ascii=False)
+
+
+def query_vitals(args, **criteria):
+    """Readings filtered in SQL.
+
+    ``?metric=spo2&below=90&minutes=60`` finds every SpO2 under 90 in the
+    last hour; ``from``/``to`` (ISO datetimes), ``above`` and ``limit``
+    are also accepted. Newest first, with the patient's name.
+    """
+    query = db.session.query(
+        VitalSign.id, VitalSign.patient_id, Patient.name.label('patient_name'),
+        VitalSign.emergency_case_id, VitalSign.ward_admission_id,
+        VitalSign.metric, VitalSign.value, VitalSign.recorded_at, VitalSign.source
+    ).join(Patient, Patient.id == VitalSign.patient_id).filter(
+        *[getattr(VitalSign, name) == value for name, value in criteria.items()]
+    )
+
+    metrics = [metric for metric in args.get('metric', '').split(',') if metric]
+    for metric in metrics:
+        if metric not in METRICS:
+            raise ValueError(f'مؤشر حيوي غير معروف: {metric}')
+    if metrics:
+        query = query.filter(VitalSign.metric.in_(metrics))
+    if args.get('below') or args.get('above'):
+        if len(metrics) != 1:
+            raise ValueError('حدد مؤشراً واحداً عند استخدام below أو above')
+        if args.get('below'):
+            query = query.filter(VitalSign.value < float(args['below']))
+        if args.get('above'):
+            query = query.filter(VitalSign.value > float(args['above']))
+
+    if args.get('minutes'):
+        query = query.filter(VitalSign.recorded_at >= datetime.utcnow() - timedelta(minutes=float(args['minutes'])))
+    if args.get('from'):
+        query = query.filter(VitalSign.recorded_at >= datetime.fromisoformat(args['from']))
+    if args.get('to'):
+        query = query.filter(VitalSign.recorded_at <= datetime.fromisoformat(args['to']))
+
+    limit = min(int(args.get('limit', 500)), 5000)
+    rows = query.order_by(VitalSign.recorded_at.desc(), VitalSign.id.desc()).limit(limit).all()
+    return [
+        dict(row._mapping, recorded_at=row.recorded_at.isoformat())
+        for row in rows
+    ]
+
+
+
+# ==================== Medications ====================
+
+MEDICATION_FIELDS = ('name', 'dose', 'route', 'frequency')
+
+
+def parse_medications(text):
+    """Read the old medications field: a JSON list of names or objects, or free text"""
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        data = [part.strip() for part in LIST_SEPARATORS.split(str(text))]
+
+    if isinstance(data, dict):
+        data = [data] if 'name' in data else [{'name': name, 'dose': dose} for name, dose in data.items()]
+    if not isinstance(data, list):
+        data = [str(data)]
+
+    medications = []
+    for item in data:
+        if isinstance(item, dict):
+            item = {field: item.get(field) for field in MEDICATION_FIELDS}
+        else:
+            item = {'name': item}
+        if item['name'] and str(item['name']).strip():
+            item['name'] = str(item['name']).strip()[:200]
+            medications.append(item)
+    return medications
+
+
+def active_medications(admission_id):
+    return MedicationOrder.query.filter_by(ward_admission_id=admission_id, stopped_at=None) \
+        .order_by(MedicationOrder.started_at, MedicationOrder.id).all()
+
+
+def sync_admission_medications(admission, at=None, ordered_by=None):
+    """Bring the admission's active orders in line with its medications text.
+
+    Medications that disappeared from the list are stopped and new ones
+    started, so the orders table keeps the history the text field loses.
+    """
+    at = at or datetime.utcnow()
+    wanted = {normalize_arabic(item['name']): item for item in parse_medications(admission.medications)}
+    for order in active_medications(admission.id):
+        key = normalize_arabic(order.name)
+        if key in wanted:
+            wanted.pop(key)
+        else:
+            order.stopped_at = at
+    started = [
+        MedicationOrder(
+            patient_id=admission.patient_id,
+            ward_admission_id=admission.id,
+            started_at=at,
+            ordered_by=ordered_by,
+            source='legacy',
+            **item
+        )
+        for item in wanted.values()
+    ]
+    db.session.add_all(started)
+    return started
+
+
+def medications_text(admission_id):
+    """JSON of the active orders, for the old medications field"""
+    items = []
+    for order in active_medications(admission_id):
+        details = {field: getattr(order, field) for field in MEDICATION_FIELDS if getattr(order, field)}
+        items.append(order.name if len(details) == 1 else details)
+    return json.dumps(items, ensure_ascii=False)
+
+
+# ==================== Migration ====================
+
+def backfill_clinical_data(batch_size=BACKFILL_BATCH_SIZE):
+    """Copy the JSON-in-text vitals and medications of existing rows into the new tables.
+
+    Run by `flask db-upgrade` (under its lock). Rows are read in batches
+    of ``batch_size`` and each batch is committed with its rows marked
+    legacy_synced, so an interrupted run resumes where it stopped and a
+    row whose text holds no readings is parsed only once. Rows written
+    since the tables exist are created already marked.
+    """
+    cases = _backfill(
+        EmergencyCase, EmergencyCase.vital_signs,
+        exists().where(VitalSign.emergency_case_id == EmergencyCase.id),
+        sync_case_vitals, batch_size
+    )
+
+    def sync_medications(admission):
+        for order in sync_admission_medications(admission, at=admission.admission_date):
+            order.stopped_at = admission.discharge_date
+
+    admissions = _backfill(
+        WardAdmission, WardAdmission.medications,
+        exists().where(MedicationOrder.ward_admission_id == WardAdmission.id),
+        sync_medications, batch_size
+    )
+    return cases, admissions
+
+
+def _backfill(model, text_column, already_synced, sync, batch_size):
+    synced = 0
+    while True:
+        batch = db.session.query(model, already_synced).filter(
+            model.legacy_synced.is_(False)
+        ).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            return synced
+        for row, has_rows in batch:
+            if getattr(row, text_column.key) and not has_rows:
+                sync(row)
+                synced += 1
+            row.legacy_synced = True
+        db.session.commit()
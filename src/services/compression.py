@@ -0,0 +1,287 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from src.database import lock_sqlite_writes
+from src.models.medical_files import FileBlob, MedicalFile
+from src.services.file_storage import CHUNK_SIZE, INCOMING_FOLDER
+from src.services.storage_backends import local_copy, storage
+from src.services.storage_stats import count_stored_bytes
+
+try:
+    import zstandard
+except ImportError:  # gzip is used for everything without zstandard
+    zstandard = None
+
+# Blobs whose newest upload is older than this are moved to the compressed tier
+TIERING_AGE_DAYS = int(os.environ.get('TIERING_AGE_DAYS', 365))
+TIERING_WORKERS = int(os.environ.get('TIERING_WORKERS', 2))
+TIERING_MIN_SIZE = 64 * 1024
+# Keep the original when compression saves less than this fraction
+TIERING_MIN_SAVING = 0.1
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+CODEC_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+# Already compressed formats (JPEG, PNG, GIF, Office zip containers) gain nothing
+INCOMPRESSIBLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'docx', 'xlsx'}
+# Raw imaging data compresses far better and faster with zstd; documents and PDFs use gzip
+ZSTD_EXTENSIONS = {'dcm', 'dicom', 'tiff', 'bmp'}
+
+logger = logging.getLogger(__name__)
+
+
+def choose_codec(file_name):
+    """Codec for a file, or None when it should stay as it is"""
+    ext = file_name.rsplit('.', 1)[1].lower() if '.' in file_name else ''
+    if ext in INCOMPRESSIBLE_EXTENSIONS:
+        return None
+    if ext in ZSTD_EXTENSIONS and zstandard is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+def compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def decompressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd-compressed files need the zstandard package')
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def codec_for_key(key):
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if key.endswith(suffix):
+            return codec
+    return None
+
+
+def iter_content(key, codec, chunk_size=CHUNK_SIZE):
+    """Yield the original bytes of a stored object, decompressing on the fly"""
+    stream = storage.open(key)
+    try:
+        if codec is None:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                yield chunk
+            return
+        decompress = decompressor(codec)
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            data = decompress.decompress(chunk)
+            if data:
+                yield data
+        if codec == 'gzip':
+            data = decompress.flush()
+            if data:
+                yield data
+    finally:
+        stream.close()
+
+
+@contextmanager
+def local_content(key, workdir=None):
+    """Like local_copy, but always with the original bytes (for thumbnails)"""
+    codec = codec_for_key(key)
+    if codec is None:
+        with local_copy(storage, key, workdir) as path:
+            yield path
+        return
+    with tempfile.NamedTemporaryFile(dir=workdir, delete=False) as f:
+        for chunk in iter_content(key, codec):
+            f.write(chunk)
+    try:
+        yield f.name
+    finally:
+        os.remove(f.name)
+
+
+def hash_content(path, codec=None):
+    """SHA-256 of the original content of a local file, compressed or not"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        decompress = decompressor(codec) if codec else None
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(decompress.decompress(chunk) if decompress else chunk)
+        if codec == 'gzip':
+            sha256.update(decompress.flush())
+    return sha256.hexdigest()
+
+
+# ==================== Tiering ====================
+
+def cold_blobs(engine, now=None, limit=None):
+    """Untiered blobs that nobody has uploaded for TIERING_AGE_DAYS, with a file name for the codec"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=TIERING_AGE_DAYS)
+    uploads = select(
+        MedicalFile.content_hash,
+        func.max(MedicalFile.uploaded_at).label('newest'),
+        func.min(MedicalFile.file_name).label('file_name')
+    ).where(MedicalFile.content_hash.isnot(None)).group_by(MedicalFile.content_hash).subquery()
+    query = select(FileBlob.sha256, FileBlob.size, FileBlob.storage_path, uploads.c.file_name) \
+        .join(uploads, uploads.c.content_hash == FileBlob.sha256) \
+        .where(FileBlob.tiered_at.is_(None), FileBlob.size >= TIERING_MIN_SIZE, uploads.c.newest < cutoff) \
+        .order_by(FileBlob.size.desc())
+    if limit:
+        query = query.limit(limit)
+    with engine.connect() as conn:
+        return conn.execute(query).all()
+
+
+def compress_blob(engine, sha256, size, storage_path, file_name):
+    """Compress one blob into a new object and point its rows at it.
+
+    The content is re-hashed while it is compressed, so a damaged blob is
+    never turned into a compressed one. The switch locks the blob row,
+    which an upload of the same content (store_file's upsert) also
+    locks, so the upload either commits first and has its row moved too,
+    or waits and gets the new key. The original is deleted only after
+    the switch committed and no row refers to it any more. The time to
+    decompress the new object is measured here and stored on the blob
+    for tiering_report. Returns (status, bytes saved).
+    """
+    codec = choose_codec(file_name)
+    compressed_key = storage_path + CODEC_SUFFIXES[codec] if codec else None
+    temp_path = None
+    saved = 0
+    try:
+        if codec:
+            compress = compressor(codec)
+            sha = hashlib.sha256()
+            with tempfile.NamedTemporaryFile(dir=INCOMING_FOLDER, delete=False) as f:
+                temp_path = f.name
+                stream = storage.open(storage_path)
+                try:
+                    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                        sha.update(chunk)
+                        f.write(compress.compress(chunk))
+                finally:
+                    stream.close()
+                f.write(compress.flush())
+            if sha.hexdigest() != sha256:
+                return 'corrupt', 0
+            stored_size = os.path.getsize(temp_path)
+            if stored_size <= size * (1 - TIERING_MIN_SAVING):
+                decompress_seconds = _time_decompress(temp_path, codec)
+                storage.put_file(compressed_key, temp_path)
+                temp_path = None
+                saved = size - stored_size
+
+        with engine.begin() as conn:
+            # Lock the blob so a concurrent delete or upload of the same content waits for us
+            lock_sqlite_writes(conn)
+            blob_query = select(FileBlob.storage_path).where(FileBlob.sha256 == sha256)
+            if conn.dialect.name == 'postgresql':
+                blob_query = blob_query.with_for_update()
+            current = conn.execute(blob_query).scalar()
+            if current != storage_path:
+                # Deleted or already moved meanwhile
+                if saved:
+                    storage.delete(compressed_key)
+                return 'skipped', 0
+            values = {'tiered_at': datetime.utcnow()}
+            if saved:
+                values.update(codec=codec, stored_size=size - saved, storage_path=compressed_key,
+                              decompress_seconds=decompress_seconds)
+                conn.execute(update(MedicalFile).where(MedicalFile.content_hash == sha256)
+                             .values(file_path=compressed_key))
+                count_stored_bytes(conn, -saved)
+            conn.execute(update(FileBlob).where(FileBlob.sha256 == sha256).values(**values))
+
+        if saved:
+            if _still_referenced(engine, storage_path):
+                logger.warning('Kept %s after compressing it: rows still refer to it', storage_path)
+            else:
+                storage.delete(storage_path)
+            return 'compressed', saved
+        return 'kept', 0
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _time_decompress(path, codec):
+    """Seconds to decompress a local compressed file, i.e. what it adds to a download"""
+    started = time.perf_counter()
+    decompress = decompressor(codec)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            decompress.decompress(chunk)
+    if codec == 'gzip':
+        decompress.flush()
+    return time.perf_counter() - started
+
+
+def _still_referenced(engine, storage_path):
+    with engine.connect() as conn:
+        files = conn.execute(select(MedicalFile.id).where(MedicalFile.file_path == storage_path).limit(1)).first()
+        blobs = conn.execute(select(FileBlob.sha256).where(FileBlob.storage_path == storage_path).limit(1)).first()
+    return files is not None or blobs is not None
+
+
+def tier_cold_files(engine, limit=None, workers=TIERING_WORKERS):
+    """Compress every cold blob, several at a time"""
+    report = {'compressed': 0, 'kept': 0, 'skipped': 0, 'corrupt': 0, 'failed': 0, 'bytes_saved': 0, 'errors': []}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tiering') as pool:
+        futures = {pool.submit(compress_blob, engine, *row): row.sha256 for row in cold_blobs(engine, limit=limit)}
+        for future, sha256 in futures.items():
+            try:
+                status, saved = future.result()
+            except Exception as e:
+                status, saved = 'failed', 0
+                report['errors'].append({'sha256': sha256, 'error': str(e)})
+            report[status] += 1
+            report['bytes_saved'] += saved
+    return report
+
+
+def tiering_report(engine):
+    """Space reclaimed per codec, and what decompressing costs on download.
+
+    Only reads the blob table: the decompression time of each blob was
+    measured by the tiering job when it compressed it (blobs compressed
+    before that was recorded are left out of the latency figures).
+    """
+    measured = FileBlob.decompress_seconds.isnot(None)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(
+                FileBlob.codec, func.count(FileBlob.sha256), func.sum(FileBlob.size), func.sum(FileBlob.stored_size),
+                func.sum(FileBlob.size).filter(measured), func.sum(FileBlob.decompress_seconds)
+            ).where(FileBlob.codec.isnot(None)).group_by(FileBlob.codec)
+        ).all()
+        cold = conn.execute(select(func.count(FileBlob.sha256)).where(FileBlob.tiered_at.is_(None))).scalar()
+
+    report = {'codecs': {}, 'original_bytes': 0, 'stored_bytes': 0, 'bytes_saved': 0, 'untiered_blobs': cold}
+    for codec, count, original, stored, measured_bytes, seconds in rows:
+        original, stored = int(original or 0), int(stored or 0)
+        entry = {
+            'blobs': count,
+            'original_bytes': original,
+            'stored_bytes': stored,
+            'bytes_saved': original - stored,
+            'ratio': round(stored / original, 3) if original else None
+        }
+        if measured_bytes and seconds:
+            megabytes = measured_bytes / (1024 * 1024)
+            entry.update(
+                measured_bytes=int(measured_bytes),
+                decompress_mb_per_s=round(megabytes / seconds, 1),
+                # Extra time a download spends per MB because the file is compressed
+                added_ms_per_mb=round(seconds * 1000 / megabytes, 2)
+            )
+        report['codecs'][codec] = entry
+        report['original_bytes'] += original
+        report['stored_bytes'] += stored
+        report['bytes_saved'] += original - stored
+    return report
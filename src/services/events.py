@@ -0,0 +1,169 @@
+import errno
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+
+# local: fan out inside this process only; socket: also to the other gunicorn workers on this host
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'socket')
+EVENTS_SOCKET_DIR = os.environ.get('EVENTS_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'surgery-events'))
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBroker:
+    """In-process publish/subscribe with one bounded queue per subscriber"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listeners = {}
+
+    def subscribe(self, channel):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers.get(channel, set()).discard(subscriber)
+
+    def add_listener(self, channel, callback):
+        """Call ``callback(event)`` for every event on the channel, in the delivering thread"""
+        with self._lock:
+            self._listeners.setdefault(channel, []).append(callback)
+
+    def start(self):
+        """Nothing to set up within one process"""
+
+    def subscriber_count(self, channel):
+        return len(self._subscribers.get(channel, ()))
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+    def deliver(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+            listeners = list(self._listeners.get(channel, ()))
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception('Event listener %r failed on %s', callback, channel)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client must not block writers: drop it and end its
+                # stream (None), so the browser reconnects with a fresh snapshot
+                self.unsubscribe(channel, subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+
+class SocketBroker(LocalBroker):
+    """Fan events out to every worker on the host through Unix datagram sockets.
+
+    Each worker binds ``<EVENTS_SOCKET_DIR>/<pid>.sock`` when the app
+    starts (start(), called from main.py; again after a fork) and runs a
+    listener thread that hands received events to its local subscribers
+    and listeners. Publishing delivers locally and sends one datagram to
+    every other socket in the directory.
+    """
+
+    def __init__(self, socket_dir):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self._pid = None
+        self._socket = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Bind this process's socket so it receives events before its first publish or subscribe"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.socket_dir, exist_ok=True)
+            path = os.path.join(self.socket_dir, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.remove(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._socket = sock
+            self._path = path
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, args=(sock,), name='events-listener', daemon=True).start()
+
+    def _listen(self, sock):
+        while True:
+            try:
+                data = sock.recv(256 * 1024)
+            except OSError:
+                return
+            try:
+                message = json.loads(data)
+                self.deliver(message['channel'], message['event'])
+            except (ValueError, KeyError):
+                logger.warning('Ignoring malformed event datagram (%d bytes)', len(data))
+            except Exception:
+                # Keep listening: a dead listener thread would silently cut this worker off
+                logger.exception('Failed to deliver an event from another worker')
+
+    def subscribe(self, channel):
+        self._ensure_started()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        self._ensure_started()
+        self.deliver(channel, event)
+
+        payload = json.dumps({'channel': channel, 'event': event}).encode()
+        for path in glob.glob(os.path.join(self.socket_dir, '*.sock')):
+            if path == self._path:
+                continue
+            try:
+                self._socket.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that owned this socket is gone
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                if e.errno == errno.EMSGSIZE:
+                    # Too large for every worker alike, not worth trying the others
+                    logger.error('Event on %s not sent to other workers: %d bytes exceeds the datagram limit',
+                                 channel, len(payload))
+                    return
+                logger.warning('Event on %s not sent to %s: %s (%s)',
+                               channel, path, e.strerror, errno.errorcode.get(e.errno, e.errno))
+
+
+def create_broker():
+    if EVENTS_BACKEND == 'socket' and hasattr(socket, 'AF_UNIX'):
+        return SocketBroker(EVENTS_SOCKET_DIR)
+    return LocalBroker()
+
+
+broker = create_broker()
+
+
+def publish(channel, event_type, data):
+    """Publish an event; failures never affect the request that triggered it"""
+    try:
+        broker.publish(channel, {'type': event_type, 'data': data})
+    except Exception:
+        logger.exception('Failed to publish %s on %s', event_type, channel)
@@ -0,0 +1,289 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, func, select, update
+from sqlalchemy.engine import Engine
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from src.database import db
+from src.models.medical_files import FileBlob, MedicalFile
+from src.services.storage_backends import UPLOAD_FOLDER, storage
+from src.services.storage_stats import count_blob
+
+# Uploads are staged on local disk before they go to the storage backend
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, 'incoming')
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+CHUNK_SIZE = 1024 * 1024
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+# python: stream from the worker; x-accel: hand off to nginx (X-Accel-Redirect); x-sendfile: Apache/lighttpd
+FILE_SEND_MODE = os.environ.get('FILE_SEND_MODE', 'python')
+# nginx `internal` location that maps to UPLOAD_FOLDER, e.g. location /protected-uploads/ { internal; alias .../uploads/; }
+FILE_ACCEL_PREFIX = os.environ.get('FILE_ACCEL_PREFIX', '/protected-uploads/')
+# Stored content never changes for a given file id, so browsers may keep it this long (seconds)
+FILE_CACHE_MAX_AGE = int(os.environ.get('FILE_CACHE_MAX_AGE', 86400))
+
+os.makedirs(INCOMING_FOLDER, exist_ok=True)
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+def blob_key(sha256):
+    """Storage key of the content with this hash: blobs/ab/abcdef..."""
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+
+class BlobWriter:
+    """Write an upload to a temporary file in chunks, hashing it on the way.
+
+    The size limit is checked on every chunk, so an oversized upload is
+    rejected as soon as it crosses ``max_size`` instead of after it has
+    been stored.
+    """
+
+    def __init__(self, max_size=MAX_FILE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=INCOMING_FOLDER, delete=False)
+        self.path = self._file.name
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise FileTooLargeError('حجم الملف يتجاوز الحد المسموح')
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+
+def _upsert_blob(sha256, size, key):
+    """INSERT the blob, or add a reference if the same content is already stored.
+
+    Returns the blob's storage_path and its new ref_count: 1 means this
+    statement inserted the row (an existing row always ends up above 1,
+    since release_blob deletes it once it reaches 0).
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(FileBlob).values(sha256=sha256, size=size, storage_path=key, ref_count=1)
+    return statement.on_conflict_do_update(
+        index_elements=['sha256'], set_={'ref_count': FileBlob.ref_count + 1}
+    ).returning(FileBlob.storage_path, FileBlob.ref_count)
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def store_file(source_path, sha256, size):
+    """Move a complete file into the blob store and count the reference.
+
+    Content that is already stored is not written again: the source file
+    is dropped and only the reference count changes, so a duplicate
+    upload costs a metadata insert. On local storage the file is moved,
+    never copied. Returns the storage key; the caller commits.
+
+    The upsert comes first and keeps the blob row locked until the
+    caller's transaction ends, so concurrent uploads of the same new
+    content (and the tiering job moving it) wait for each other: only the
+    transaction that inserted the row counts the blob and writes the
+    file, overwriting whatever an earlier failed upload left at the key.
+    """
+    stored_path, ref_count = db.session.execute(_upsert_blob(sha256, size, blob_key(sha256))).one()
+    if ref_count > 1:
+        # A compressed blob lives under another key, which stored_path already is
+        os.remove(source_path)
+        return stored_path
+
+    count_blob(db.session.connection(), 1, size)
+    storage.put_file(stored_path, source_path)
+    # Removed again if the transaction rolls back (see _drop_new_blobs)
+    db.session.connection().info.setdefault('new_blobs', []).append(stored_path)
+    return stored_path
+
+
+@event.listens_for(Engine, 'commit')
+def _keep_new_blobs(connection):
+    connection.info.pop('new_blobs', None)
+
+
+@event.listens_for(Engine, 'rollback')
+def _drop_new_blobs(connection):
+    """Don't leave content on disk that no committed row refers to.
+
+    Runs before the ROLLBACK is sent, while the new blob rows are still
+    locked: an upload of the same content waiting on them only inserts
+    (and writes the file) again after the file is gone.
+    """
+    for key in connection.info.pop('new_blobs', []):
+        remove_file(key)
+
+
+def store_blob(writer):
+    """Store a finished BlobWriter upload; returns (sha256, key)"""
+    writer.close()
+    return writer.sha256, store_file(writer.path, writer.sha256, writer.size)
+
+
+def release_blob(sha256):
+    """Drop one reference; return the key to delete once nothing uses the content"""
+    db.session.execute(
+        update(FileBlob).where(FileBlob.sha256 == sha256).values(ref_count=FileBlob.ref_count - 1)
+    )
+    blob = db.session.get(FileBlob, sha256, populate_existing=True)
+    if blob is not None and blob.ref_count <= 0:
+        db.session.delete(blob)
+        count_blob(db.session.connection(), -1, blob.stored_size or blob.size)
+        return blob.storage_path
+    return None
+
+
+def remove_file(key):
+    """Delete a stored file after the database change that released it was committed"""
+    storage.delete(key)
+
+
+def relativize_storage_paths(engine):
+    """Turn absolute paths under UPLOAD_FOLDER (rows from before storage keys) into keys"""
+    prefix = os.path.join(UPLOAD_FOLDER, '')
+    updated = 0
+    with engine.begin() as conn:
+        for table, column in ((MedicalFile.__table__, 'file_path'), (FileBlob.__table__, 'storage_path')):
+            path = table.c[column]
+            result = conn.execute(
+                update(table).where(path.like(prefix + '%'))
+                .values({column: func.substr(path, len(prefix) + 1)})
+            )
+            updated += result.rowcount
+    return updated
+
+
+def stored_keys(engine):
+    """Every key the database refers to, with its expected size"""
+    with engine.connect() as conn:
+        keys = dict(conn.execute(
+            select(FileBlob.storage_path, func.coalesce(FileBlob.stored_size, FileBlob.size))
+        ).all())
+        keys.update(conn.execute(
+            select(MedicalFile.file_path, MedicalFile.file_size).where(MedicalFile.content_hash.is_(None))
+        ).all())
+    return keys
+
+
+def migrate_storage(engine, source, target, workers=8):
+    """Copy every stored file from one backend to another, several at a time.
+
+    Keys are the same in every backend, so no row changes: once the copy
+    is complete, switch STORAGE_BACKEND. Files already on the target with
+    the right size are skipped, which makes an interrupted migration
+    resumable. Nothing is deleted from the source.
+    """
+    def copy(key, size):
+        if os.path.isabs(key):
+            return 'failed', key, 'المسار خارج مجلد الرفع'
+        try:
+            if size is not None and target.size(key) == size:
+                return 'skipped', key, None
+            stream = source.open(key)
+            try:
+                target.put_stream(key, stream)
+            finally:
+                stream.close()
+            copied = target.size(key)
+        except Exception as e:
+            return 'failed', key, str(e)
+        if size is not None and copied != size:
+            return 'failed', key, f'الحجم {copied} بدلاً من {size}'
+        return 'copied', key, copied
+
+    report = {'copied': 0, 'skipped': 0, 'failed': 0, 'bytes': 0, 'errors': []}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='storage-migrate') as pool:
+        futures = [pool.submit(copy, key, size) for key, size in stored_keys(engine).items()]
+        for future in futures:
+            status, key, detail = future.result()
+            report[status] += 1
+            if status == 'copied':
+                report['bytes'] += detail or 0
+            elif status == 'failed':
+                report['errors'].append({'key': key, 'error': detail})
+    return report
+
+
+def receive_multipart(request, file_field='file', max_size=MAX_FILE_SIZE):
+    """Read a multipart upload straight from the request stream.
+
+    Unlike ``request.files`` nothing is spooled to a werkzeug temp file
+    first: the file part goes through a BlobWriter chunk by chunk and the
+    other parts are returned as a dict of form fields. Returns
+    ``(form, upload)`` where upload is None or a dict with filename,
+    content_type and writer.
+    """
+    content_type, options = parse_options_header(request.headers.get('Content-Type', ''))
+    if content_type != 'multipart/form-data' or 'boundary' not in options:
+        raise ValueError('يجب إرسال الملف بصيغة multipart/form-data')
+
+    decoder = MultipartDecoder(options['boundary'].encode())
+    stream = request.stream
+    form = {}
+    upload = None
+    target = None
+
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == file_field and upload is None:
+                    upload = {
+                        'filename': event.filename,
+                        'content_type': event.headers.get('Content-Type'),
+                        'writer': BlobWriter(max_size)
+                    }
+                    target = upload['writer']
+                elif isinstance(event, Field):
+                    target = form.setdefault(event.name, bytearray())
+                elif isinstance(event, File):
+                    target = None  # Extra files are ignored
+                elif isinstance(event, Data) and target is not None:
+                    if isinstance(target, bytearray):
+                        target.extend(event.data)
+                        if len(target) > MAX_FORM_FIELD_SIZE:
+                            raise ValueError('حقل النموذج أكبر من الحد المسموح')
+                    else:
+                        target.write(event.data)
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except Exception:
+        if upload:
+            upload['writer'].discard()
+        raise
+
+    if upload:
+        upload['writer'].close()
+    return {name: bytes(value).decode('utf-8', 'replace') for name, value in form.items()}, upload
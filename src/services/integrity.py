@@ -0,0 +1,295 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+from sqlalchemy import func, select
+from src.models.medical_files import FileBlob, MedicalFile, UploadSession
+from src.services.compression import hash_content
+from src.services.file_storage import UPLOAD_FOLDER
+from src.services.storage_backends import storage
+
+QUARANTINE_FOLDER = os.path.join(UPLOAD_FOLDER, 'quarantine')
+CHECKPOINT_PATH = os.path.join(UPLOAD_FOLDER, '.integrity_checkpoint.json')
+# Unchanged directories are still rescanned after this many days
+FULL_SCAN_INTERVAL_DAYS = int(os.environ.get('INTEGRITY_FULL_SCAN_DAYS', 7))
+# Files younger than this may belong to an upload that has not committed yet
+ORPHAN_GRACE_SECONDS = int(os.environ.get('INTEGRITY_ORPHAN_GRACE_SECONDS', 3600))
+SCAN_WORKERS = int(os.environ.get('INTEGRITY_SCAN_WORKERS', 4))
+MAX_REPORTED = 1000
+
+PATIENT_DIR = re.compile(r'patient_(\d+)$')
+THUMBNAIL = re.compile(r'(\d+)_\w+\.jpg$')
+HEX = '0123456789abcdef'
+COUNTERS = ('units_scanned', 'units_skipped', 'files_checked', 'bytes_hashed', 'quarantined')
+FINDINGS = ('missing', 'size_mismatch', 'hash_mismatch', 'refcount_mismatch', 'orphans')
+
+
+class ScanReport:
+    """Findings collected from every scan thread"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counts = dict.fromkeys(COUNTERS + FINDINGS, 0)
+        # Details are kept for the first MAX_REPORTED findings of each kind
+        self.findings = {kind: [] for kind in FINDINGS}
+
+    def add(self, finding, **details):
+        with self._lock:
+            if len(self.findings[finding]) < MAX_REPORTED:
+                self.findings[finding].append(details)
+            self.counts[finding] += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def to_dict(self):
+        return dict(self.counts, findings=self.findings)
+
+
+class Checkpoint:
+    """Scan state kept between runs, saved after each directory.
+
+    Remembers when each directory was last scanned and its mtime at the
+    time, so the next run (or an interrupted one resuming) skips
+    directories nothing was added to or removed from, and the size and
+    mtime of every blob whose hash was verified, so an unchanged blob is
+    only re-hashed once every FULL_SCAN_INTERVAL_DAYS.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._lock = Lock()
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        self.scanned = state.get('scanned', {})
+        self.units = state.get('verified', {})
+
+    def unchanged(self, unit, mtime_ns):
+        """Whether the directory was scanned within FULL_SCAN_INTERVAL_DAYS and not modified since.
+
+        A directory modified less than ORPHAN_GRACE_SECONDS before its
+        last scan still counts as changed: files that were too young to
+        be reported as orphans then are checked again.
+        """
+        if unit not in self.scanned:
+            return False
+        previous, scanned_at = self.scanned[unit]
+        if previous != mtime_ns or scanned_at < time.time() - FULL_SCAN_INTERVAL_DAYS * 86400:
+            return False
+        return mtime_ns is None or mtime_ns < (scanned_at - ORPHAN_GRACE_SECONDS) * 1e9
+
+    def verified(self, unit):
+        """{file name: [size, mtime_ns, verified_at]} of the blobs that need no re-hashing"""
+        cutoff = time.time() - FULL_SCAN_INTERVAL_DAYS * 86400
+        return {name: entry for name, entry in self.units.get(unit, {}).items() if entry[2] >= cutoff}
+
+    def save_unit(self, unit, mtime_ns, verified):
+        with self._lock:
+            self.scanned[unit] = [mtime_ns, time.time()]
+            self.units[unit] = verified
+            self._write()
+
+    def _write(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'scanned': self.scanned, 'verified': self.units}, f)
+        os.replace(temp_path, self.path)
+
+
+class UploadScanner:
+    """Reconcile the uploads folder with medical_files / file_blobs.
+
+    The folder is split into units (each ``patient_*`` directory, each
+    ``blobs/xx`` shard and ``incoming``) that are scanned in parallel by
+    a thread pool, each with its own connection and a query limited to
+    the rows that belong in that directory.
+    """
+
+    def __init__(self, engine, quarantine=False, verify_hashes=True, full=False, workers=SCAN_WORKERS):
+        self.engine = engine
+        self.quarantine = quarantine
+        self.verify_hashes = verify_hashes
+        self.full = full
+        self.workers = workers
+        self.checkpoint = Checkpoint()
+        self.report = ScanReport()
+        self.quarantine_dir = os.path.join(QUARANTINE_FOLDER, datetime.utcnow().strftime('%Y%m%d-%H%M%S'))
+        self.now = time.time()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='integrity') as pool:
+            for future in [pool.submit(self.scan_unit, unit, scan) for unit, scan in self.units()]:
+                future.result()
+        return self.report.to_dict()
+
+    def units(self):
+        with self.engine.connect() as conn:
+            legacy_patients = set(conn.execute(
+                select(MedicalFile.patient_id).where(MedicalFile.content_hash.is_(None)).distinct()
+            ).scalars())
+        on_disk = {
+            int(match.group(1)) for match in map(PATIENT_DIR.match, os.listdir(UPLOAD_FOLDER)) if match
+        } if os.path.isdir(UPLOAD_FOLDER) else set()
+
+        for patient_id in sorted(on_disk | legacy_patients):
+            yield f'patient_{patient_id}', lambda conn, path, patient_id=patient_id: self.scan_patient(conn, path, patient_id)
+        for shard in (a + b for a in HEX for b in HEX):
+            yield os.path.join('blobs', shard), lambda conn, path, shard=shard: self.scan_shard(conn, path, shard)
+        yield 'incoming', lambda conn, path: self.scan_incoming(conn, path)
+
+    def scan_unit(self, unit, scan):
+        path = os.path.join(UPLOAD_FOLDER, unit)
+        mtime_ns = self._mtime(path)
+        # incoming is always scanned: its files turn into orphans as upload sessions expire
+        if not self.full and unit != 'incoming' and self.checkpoint.unchanged(unit, mtime_ns):
+            self.report.count('units_skipped')
+            return
+        with self.engine.connect() as conn:
+            verified = scan(conn, path) or {}
+        self.report.count('units_scanned')
+        if self.verify_hashes:
+            # A --no-verify pass must not make the next run skip hashing this directory
+            self.checkpoint.save_unit(unit, mtime_ns, verified)
+
+    # ==================== Units ====================
+
+    def scan_patient(self, conn, path, patient_id):
+        """Legacy files (stored before blobs) and thumbnails of one patient"""
+        rows = conn.execute(
+            select(MedicalFile.id, MedicalFile.file_path, MedicalFile.file_size, MedicalFile.content_hash)
+            .where(MedicalFile.patient_id == patient_id)
+        ).all()
+        file_ids = {row.id for row in rows}
+        expected = {
+            os.path.realpath(os.path.join(UPLOAD_FOLDER, row.file_path)): row for row in rows
+            if row.content_hash is None and row.file_path
+        }
+
+        seen = set()
+        for entry in self._walk(path):
+            real = os.path.realpath(entry.path)
+            if os.path.basename(os.path.dirname(entry.path)) == 'thumbnails':
+                match = THUMBNAIL.match(entry.name)
+                if not match or int(match.group(1)) not in file_ids:
+                    self._orphan(entry, 'thumbnail')
+                continue
+            self.report.count('files_checked')
+            row = expected.get(real)
+            if row is None:
+                self._orphan(entry, 'file')
+                continue
+            seen.add(real)
+            if row.file_size is not None and entry.stat().st_size != row.file_size:
+                self.report.add('size_mismatch', file_id=row.id, path=row.file_path,
+                                expected=row.file_size, actual=entry.stat().st_size)
+
+        for real, row in expected.items():
+            if real not in seen and not os.path.exists(real):
+                self.report.add('missing', kind='file', file_id=row.id, path=row.file_path)
+
+    def scan_shard(self, conn, path, shard):
+        """Content-addressed blobs whose hash starts with ``shard``"""
+        # A range rather than LIKE so the primary key index is used
+        in_shard = FileBlob.sha256 >= shard
+        if shard != 'ff':
+            in_shard = in_shard & (FileBlob.sha256 < format(int(shard, 16) + 1, '02x'))
+        # By file name: compressed blobs are stored as <sha256>.gz / .zst
+        blobs = {os.path.basename(row.storage_path): row for row in conn.execute(
+            select(FileBlob.sha256, FileBlob.size, FileBlob.ref_count, FileBlob.storage_path,
+                   FileBlob.codec, FileBlob.stored_size).where(in_shard)
+        )}
+        references = dict(conn.execute(
+            select(MedicalFile.content_hash, func.count(MedicalFile.id))
+            .where(MedicalFile.content_hash.in_([row.sha256 for row in blobs.values()]))
+            .group_by(MedicalFile.content_hash)
+        ).all()) if blobs else {}
+
+        previously_verified = {} if self.full else self.checkpoint.verified(os.path.join('blobs', shard))
+        verified = {}
+        for entry in self._walk(path):
+            self.report.count('files_checked')
+            blob = blobs.pop(entry.name, None)
+            if blob is None:
+                self._orphan(entry, 'blob')
+                continue
+            stat = entry.stat()
+            expected_size = blob.stored_size if blob.codec else blob.size
+            if stat.st_size != expected_size:
+                self.report.add('size_mismatch', sha256=blob.sha256, expected=expected_size, actual=stat.st_size)
+                continue
+            if blob.ref_count != references.get(blob.sha256, 0):
+                self.report.add('refcount_mismatch', sha256=blob.sha256, stored=blob.ref_count,
+                                actual=references.get(blob.sha256, 0))
+            signature = [stat.st_size, stat.st_mtime_ns]
+            previous = previously_verified.get(entry.name)
+            if previous and previous[:2] == signature:
+                verified[entry.name] = previous
+                continue
+            if not self.verify_hashes:
+                continue
+            self.report.count('bytes_hashed', stat.st_size)
+            if hash_content(entry.path, blob.codec) == blob.sha256:
+                verified[entry.name] = signature + [time.time()]
+            else:
+                self.report.add('hash_mismatch', sha256=blob.sha256, path=entry.path)
+
+        for blob in blobs.values():
+            self.report.add('missing', kind='blob', sha256=blob.sha256, references=references.get(blob.sha256, 0))
+        return verified
+
+    def scan_incoming(self, conn, path):
+        """Temporary upload files left behind by crashed or abandoned requests"""
+        sessions = set(conn.execute(select(UploadSession.id)).scalars())
+        for entry in self._walk(path):
+            if entry.name.endswith('.part') and entry.name[:-len('.part')] in sessions:
+                continue
+            self._orphan(entry, 'incoming')
+
+    # ==================== Helpers ====================
+
+    def _mtime(self, path):
+        """Newest mtime of a directory and its subdirectories: changes when a file is added or removed"""
+        if not os.path.isdir(path):
+            return None
+        newest = os.stat(path).st_mtime_ns
+        for root, dirs, _ in os.walk(path):
+            for name in dirs:
+                newest = max(newest, os.stat(os.path.join(root, name)).st_mtime_ns)
+        return newest
+
+    def _walk(self, path):
+        if not os.path.isdir(path):
+            return
+        stack = [path]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                        yield entry
+
+    def _orphan(self, entry, kind):
+        if self.now - entry.stat().st_mtime < ORPHAN_GRACE_SECONDS:
+            return
+        relative = os.path.relpath(entry.path, UPLOAD_FOLDER)
+        self.report.add('orphans', kind=kind, path=relative, size=entry.stat().st_size)
+        if self.quarantine:
+            target = os.path.join(self.quarantine_dir, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(entry.path, target)
+            self.report.count('quarantined')
+
+
+def scan_uploads(engine, **options):
+    """Run one reconciliation pass and return the report"""
+    if storage.name != 'local':
+        raise ValueError(f'scan-uploads checks the local uploads folder, not the {storage.name} backend')
+    return UploadScanner(engine, **options).run()
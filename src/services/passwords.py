@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+# 'thread' works with gthread workers (hashlib releases the GIL); 'process' isolates the CPU work
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+# At most this many hashes run at once per gunicorn worker. The request thread still
+# waits for its hash, so the pool frees no threads: it is a concurrency limiter that
+# keeps a burst of logins (8 with --threads 8) from taking every core from the
+# other requests while the remaining logins queue
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 30))
+
+_executor = None
+_executor_pid = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Return the bounded hashing pool, creating it lazily in each gunicorn worker"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            if PASSWORD_HASH_EXECUTOR == 'process':
+                _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash'
+                )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def hash_password(password):
+    """Hash a password with the configured work factor, waiting for a pool slot"""
+    future = get_executor().submit(generate_password_hash, password, PASSWORD_HASH_METHOD)
+    return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+
+
+def verify_password(password_hash, password):
+    """Check a password against its hash, waiting for a pool slot"""
+    future = get_executor().submit(check_password_hash, password_hash, password)
+    return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+
+
+@lru_cache(maxsize=1)
+def current_method():
+    """The full method prefix werkzeug writes for PASSWORD_HASH_METHOD, e.g. 'scrypt:32768:8:1'.
+
+    Found by hashing an empty password, so main.py calls it at startup
+    rather than leaving the cost to the first login.
+    """
+    return generate_password_hash('', PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with a different method or work factor"""
+    return password_hash.split('$', 1)[0] != current_method()
@@ -0,0 +1,244 @@
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import bindparam, insert, select, update
+from src.database import db
+from src.models.patient import Patient
+from src.utils.arabic import patient_search_text
+from src.utils.serializers import MODEL_FIELDS, select_rows, serialize_row
+
+IMPORT_FIELDS = (
+    'name', 'age', 'phone', 'national_id', 'gender', 'blood_type',
+    'allergies', 'chronic_diseases'
+)
+EXPORT_FIELDS = MODEL_FIELDS[Patient]
+BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def iter_records(stream, file_format):
+    """Yield (line_number, record) pairs from an NDJSON or CSV byte stream.
+
+    The stream is decoded incrementally, so the request body is never
+    held in memory as a whole. Lines that cannot be parsed are yielded
+    with a ValueError instead of a record.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f'JSON غير صالح: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield line_number, ValueError('يجب أن يكون كل سطر كائن JSON')
+            continue
+        yield line_number, record
+
+
+def clean_record(record):
+    """Validate one imported row and keep only the known patient fields it has.
+
+    Fields missing from the row (a column absent from the CSV header, a
+    key absent from the JSON object) are left out, so an update does not
+    clear them.
+    """
+    values = {}
+    for field in IMPORT_FIELDS:
+        if field not in record:
+            continue
+        value = record[field]
+        if isinstance(value, str):
+            value = value.strip() or None
+        values[field] = value
+
+    if not values.get('name'):
+        raise ValueError('الاسم مطلوب')
+    try:
+        values['age'] = int(values.get('age'))
+    except (TypeError, ValueError):
+        raise ValueError('العمر مطلوب ويجب أن يكون رقماً')
+    if values.get('national_id') is not None:
+        values['national_id'] = str(values['national_id'])
+    if values.get('phone') is not None:
+        values['phone'] = str(values['phone'])
+    # Core inserts skip the ORM hook that maintains the search column
+    values['search_text'] = patient_search_text(values['name'], values.get('phone'), values.get('national_id'))
+    return values
+
+
+def drop_duplicates(batch):
+    """Split a batch into rows to write and errors for national IDs it repeats.
+
+    One statement cannot update the same patient twice, so the last row
+    of a national ID is kept and the earlier ones are reported.
+    """
+    last = {}
+    for line_number, values in batch:
+        if values.get('national_id'):
+            last[values['national_id']] = line_number
+    rows, errors = [], []
+    for line_number, values in batch:
+        kept = last.get(values.get('national_id'), line_number)
+        if kept == line_number:
+            rows.append((line_number, values))
+        else:
+            errors.append({'line': line_number, 'error': f'رقم الهوية مكرر في السطر {kept}، تم استيراد السطر الأخير'})
+    return rows, errors
+
+
+def _by_columns(rows):
+    """Group rows by the columns they set; one statement needs the same columns in every row"""
+    groups = {}
+    for values in rows:
+        groups.setdefault(tuple(values), []).append(values)
+    return groups.values()
+
+
+def _upsert_statement(rows):
+    """INSERT ... ON CONFLICT (national_id) DO UPDATE for SQLite and PostgreSQL"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(Patient).values(rows)
+    updated = {field: statement.excluded[field] for field in rows[0] if field != 'national_id'}
+    if 'phone' not in rows[0]:
+        # The stored phone is kept, so the search text is rebuilt afterwards
+        updated.pop('search_text')
+    updated['updated_at'] = datetime.utcnow()
+    return statement.on_conflict_do_update(index_elements=['national_id'], set_=updated)
+
+
+def _refresh_search_text(national_ids):
+    """Rebuild search_text of updated patients whose phone was not in the file"""
+    rows = db.session.execute(
+        select(Patient.id, Patient.name, Patient.phone, Patient.national_id)
+        .where(Patient.national_id.in_(national_ids))
+    ).all()
+    if rows:
+        db.session.execute(
+            update(Patient.__table__).where(Patient.id == bindparam('patient_id'))
+            .values(search_text=bindparam('search_text')),
+            [{'patient_id': row.id, 'search_text': patient_search_text(row.name, row.phone, row.national_id)}
+             for row in rows]
+        )
+
+
+def _write_batch(batch):
+    """Insert or update one batch of (line_number, values) pairs in a single transaction"""
+    keyed = {}
+    anonymous = []
+    for line_number, values in batch:
+        if values.get('national_id'):
+            keyed[values['national_id']] = values
+        else:
+            anonymous.append(values)
+
+    existing = set()
+    if keyed:
+        existing = set(db.session.scalars(
+            select(Patient.national_id).where(Patient.national_id.in_(list(keyed)))
+        ))
+        for rows in _by_columns(keyed.values()):
+            db.session.execute(_upsert_statement(rows))
+            if 'phone' not in rows[0]:
+                _refresh_search_text([values['national_id'] for values in rows
+                                      if values['national_id'] in existing])
+    for rows in _by_columns(anonymous):
+        db.session.execute(insert(Patient), rows)
+
+    return len(keyed) - len(existing) + len(anonymous), len(existing)
+
+
+def import_patients(records, batch_size=BATCH_SIZE):
+    """Load patients from (line_number, record) pairs in batched transactions.
+
+    Rows sharing a national_id with an existing patient update the
+    columns the file has. A national_id repeated within a batch keeps its
+    last row and reports the others. A batch that fails as a whole is
+    retried row by row so that one bad row only costs its own error entry.
+    """
+    summary = {'inserted': 0, 'updated': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        batch[:], duplicates = drop_duplicates(batch)
+        summary['errors'].extend(duplicates)
+        try:
+            inserted, updated = _write_batch(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            inserted = updated = 0
+            for line_number, values in batch:
+                try:
+                    row_inserted, row_updated = _write_batch([(line_number, values)])
+                    db.session.commit()
+                    inserted += row_inserted
+                    updated += row_updated
+                except Exception as e:
+                    db.session.rollback()
+                    summary['errors'].append({'line': line_number, 'error': str(e.__cause__ or e)})
+        summary['inserted'] += inserted
+        summary['updated'] += updated
+        batch.clear()
+
+    for line_number, record in records:
+        if isinstance(record, Exception):
+            summary['errors'].append({'line': line_number, 'error': str(record)})
+            continue
+        try:
+            batch.append((line_number, clean_record(record)))
+        except ValueError as e:
+            summary['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    return summary
+
+
+def export_patients(file_format):
+    """Yield the patients table as NDJSON or CSV in ~64 KB chunks.
+
+    Rows are read with yield_per() (a server-side cursor on PostgreSQL),
+    so memory use does not depend on the size of the table.
+    """
+    query = select_rows(Patient.query.order_by(Patient.id), Patient, list(EXPORT_FIELDS))
+    buffer = io.StringIO()
+
+    if file_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        write_row = writer.writerow
+    else:
+        def write_row(values):
+            buffer.write(json.dumps(values, ensure_ascii=False))
+            buffer.write('\n')
+
+    for row in query.yield_per(EXPORT_CHUNK_SIZE):
+        write_row(serialize_row(row))
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
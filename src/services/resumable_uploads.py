@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from src.database import db
+from src.models.auth import User
+from src.models.medical_files import MedicalFile, UploadSession
+from src.services.file_storage import CHUNK_SIZE, INCOMING_FOLDER, FileTooLargeError, hash_file, store_file
+
+# Resumable uploads are written in place, so they can safely be much larger than MAX_FILE_SIZE
+RESUMABLE_MAX_FILE_SIZE = int(os.environ.get('RESUMABLE_MAX_FILE_SIZE', 2 * 1024 * 1024 * 1024))
+RECOMMENDED_CHUNK_SIZE = 5 * 1024 * 1024
+# Unfinished uploads untouched for this long are removed by `flask cleanup-uploads`
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+# Disk one user may hold reserved in unfinished uploads at a time
+UPLOAD_RESERVED_BYTES_PER_USER = int(os.environ.get('UPLOAD_RESERVED_BYTES_PER_USER', 4 * 1024 * 1024 * 1024))
+
+
+def part_path(upload_id):
+    return os.path.join(INCOMING_FOLDER, f'{upload_id}.part')
+
+
+def merge_range(ranges, start, end):
+    """Add [start, end) to a sorted list of disjoint ranges, joining neighbours"""
+    merged = []
+    for low, high in sorted(ranges + [[start, end]]):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def missing_ranges(ranges, total):
+    missing = []
+    position = 0
+    for low, high in ranges:
+        if low > position:
+            missing.append([position, low])
+        position = max(position, high)
+    if position < total:
+        missing.append([position, total])
+    return missing
+
+
+def progress(upload):
+    ranges = json.loads(upload.received_ranges or '[]')
+    received = sum(high - low for low, high in ranges)
+    return {
+        'upload_id': upload.id,
+        'file_name': upload.file_name,
+        'total_size': upload.total_size,
+        'received_bytes': received,
+        # Where a client uploading sequentially should continue
+        'next_offset': ranges[0][1] if ranges and ranges[0][0] == 0 else 0,
+        'missing_ranges': missing_ranges(ranges, upload.total_size),
+        'complete': received == upload.total_size,
+        'chunk_size': RECOMMENDED_CHUNK_SIZE,
+        'updated_at': upload.updated_at.isoformat() if upload.updated_at else None
+    }
+
+
+def _preallocate(path, size):
+    with open(path, 'wb') as f:
+        if hasattr(os, 'posix_fallocate') and size:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass
+        f.truncate(size)
+
+
+def create_upload(**fields):
+    """Register a new upload and reserve its full size on disk.
+
+    A user's unfinished uploads may reserve at most
+    UPLOAD_RESERVED_BYTES_PER_USER between them.
+    """
+    total_size = fields['total_size']
+    if total_size < 0:
+        raise ValueError('حجم الملف غير صالح')
+    if total_size > RESUMABLE_MAX_FILE_SIZE:
+        raise FileTooLargeError('حجم الملف يتجاوز الحد المسموح')
+
+    # Lock the user row so two concurrent creates can't both fit under the limit
+    db.session.get(User, fields['uploaded_by'], with_for_update=True)
+    reserved = db.session.query(func.coalesce(func.sum(UploadSession.total_size), 0)) \
+        .filter(UploadSession.uploaded_by == fields['uploaded_by']).scalar()
+    if reserved + total_size > UPLOAD_RESERVED_BYTES_PER_USER:
+        raise FileTooLargeError('تجاوزت المساحة المحجوزة لعمليات الرفع غير المكتملة، أكمل أو ألغِ بعضها أولاً')
+
+    upload = UploadSession(id=uuid.uuid4().hex, received_ranges='[]', **fields)
+    _preallocate(part_path(upload.id), total_size)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """Copy ``length`` bytes from the request stream into the upload at ``offset``.
+
+    The data goes straight to its final position in the preallocated
+    file; chunks may arrive in any order and be retried, since writing
+    the same bytes again is harmless.
+    """
+    if offset < 0 or length is None or offset + length > upload.total_size:
+        raise ValueError('الجزء خارج حدود الملف')
+
+    written = 0
+    with open(part_path(upload.id), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            chunk = stream.read(min(CHUNK_SIZE, length - written))
+            if not chunk:
+                break
+            f.write(chunk)
+            written += len(chunk)
+
+    if written:
+        # Lock the session row so concurrent chunks don't lose each other's ranges
+        locked = db.session.get(UploadSession, upload.id, with_for_update=True, populate_existing=True)
+        ranges = merge_range(json.loads(locked.received_ranges or '[]'), offset, offset + written)
+        locked.received_ranges = json.dumps(ranges)
+        locked.updated_at = datetime.utcnow()
+        db.session.commit()
+        upload = locked
+    if written < length:
+        raise ValueError('انقطع الاتصال قبل اكتمال الجزء، أعد إرساله من next_offset')
+    return upload
+
+
+def _stage(path):
+    """A second name for the part file, which store_file may move away"""
+    staged = path + '.finishing'
+    if os.path.exists(staged):
+        os.remove(staged)
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+def finish_upload(upload, expected_sha256=None):
+    """Move a fully received upload into the blob store and create its MedicalFile.
+
+    The blob store gets a hard link of the part file, which is only
+    removed once the commit succeeded: if it fails, the session and its
+    part are still there and the client can call finish again.
+    """
+    # Serialize with a concurrent finish of the same upload
+    upload = db.session.get(UploadSession, upload.id, with_for_update=True, populate_existing=True)
+    if upload is None or not os.path.exists(part_path(upload.id)):
+        raise ValueError('عملية الرفع غير موجودة أو انتهت صلاحيتها')
+    if not progress(upload)['complete']:
+        raise ValueError('لم تكتمل أجزاء الملف بعد')
+
+    path = part_path(upload.id)
+    sha256 = hash_file(path)
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        raise ValueError('بصمة الملف (SHA-256) لا تطابق المحتوى المرفوع')
+
+    staged = _stage(path)
+    try:
+        stored_path = store_file(staged, sha256, upload.total_size)
+        medical_file = MedicalFile(
+            patient_id=upload.patient_id,
+            uploaded_by=upload.uploaded_by,
+            file_name=upload.file_name,
+            file_path=stored_path,
+            file_type=upload.file_type,
+            file_size=upload.total_size,
+            mime_type=upload.mime_type,
+            content_hash=sha256,
+            category=upload.category,
+            description=upload.description,
+            date_taken=upload.date_taken
+        )
+        db.session.add(medical_file)
+        db.session.delete(upload)
+        db.session.commit()
+    except Exception:
+        if os.path.exists(staged):
+            os.remove(staged)
+        raise
+    os.remove(path)
+    return medical_file
+
+
+def abort_upload(upload):
+    db.session.delete(upload)
+    db.session.commit()
+    # The staged copy is only left behind by a worker that died while finishing
+    for path in (part_path(upload.id), part_path(upload.id) + '.finishing'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def cleanup_stale_uploads(now=None):
+    """Remove uploads nobody has touched for UPLOAD_SESSION_TTL_HOURS"""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        abort_upload(upload)
+    return len(stale)
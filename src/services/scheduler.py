@@ -0,0 +1,229 @@
+import bisect
+import os
+import re
+import zlib
+from datetime import datetime, timedelta, time
+from sqlalchemy import or_, text
+from src.database import db, lock_sqlite_writes
+from src.models.patient import Surgery
+
+# Used when a surgery has no duration or it cannot be parsed
+DEFAULT_SURGERY_MINUTES = int(os.environ.get('DEFAULT_SURGERY_MINUTES', 60))
+# Longest booking accepted; conflict checks look back this far for surgeries still running
+MAX_SURGERY_MINUTES = int(os.environ.get('MAX_SURGERY_MINUTES', 24 * 60))
+LOOKBACK_DAYS = -(-MAX_SURGERY_MINUTES // (24 * 60))
+# Surgeries with these statuses do not occupy the room
+INACTIVE_STATUSES = ('ملغاة',)
+
+DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
+NUMBER = r'(\d+(?:[.,]\d+)?)'
+
+
+def parse_duration(value):
+    """Parse a free-text duration into minutes, or None when it can't be understood.
+
+    Understands "90", "1:30", "90 min", "90 دقيقة", "2 ساعة", "2.5h", "1h30m",
+    "ساعة", "ساعتين", "ساعة ونصف", "نصف ساعة" and "ساعة و 30 دقيقة".
+    A bare number up to 12 is read as hours, anything larger as minutes.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    text_value = str(value).translate(DIGITS).strip().lower()
+    if not text_value:
+        return None
+
+    match = re.fullmatch(r'(\d+):(\d{1,2})', text_value)
+    if match:
+        return int(match.group(1)) * 60 + int(match.group(2))
+
+    match = re.fullmatch(NUMBER, text_value)
+    if match:
+        number = float(match.group(1).replace(',', '.'))
+        return int(number * 60) if number <= 12 else int(number)
+
+    minutes = 0.0
+    found = False
+
+    hours = re.search(NUMBER + r'\s*(?:h|hr|hrs|hour|hours|ساعة|ساعات|س)(?![^\W\d])', text_value)
+    if hours:
+        minutes += float(hours.group(1).replace(',', '.')) * 60
+        found = True
+    elif 'ساعتين' in text_value or 'ساعتان' in text_value:
+        minutes += 120
+        found = True
+    elif 'نصف ساعة' in text_value:
+        minutes += 30
+        found = True
+    elif 'ساعة' in text_value or 'hour' in text_value:
+        minutes += 60
+        found = True
+
+    mins = re.search(NUMBER + r'\s*(?:m|min|mins|minute|minutes|دقيقة|دقائق|د)(?![^\W\d])', text_value)
+    if mins:
+        minutes += float(mins.group(1).replace(',', '.'))
+        found = True
+    elif 'ونصف' in text_value or 'و نصف' in text_value:
+        minutes += 30
+    elif 'وربع' in text_value or 'و ربع' in text_value:
+        minutes += 15
+
+    return int(minutes) if found else None
+
+
+def surgery_interval(surgery_date, surgery_time, duration):
+    """Return the (start, end) datetimes a surgery occupies its room.
+
+    Durations above MAX_SURGERY_MINUTES (rows stored before the limit)
+    are cut to it, so the lookback of load_room_schedule always covers them.
+    """
+    start = datetime.combine(surgery_date, surgery_time or time.min)
+    minutes = min(parse_duration(duration) or DEFAULT_SURGERY_MINUTES, MAX_SURGERY_MINUTES)
+    return start, start + timedelta(minutes=minutes)
+
+
+class RoomSchedule:
+    """Bookings of one operating room kept sorted by start time.
+
+    It is built from the database for each check and only holds the few
+    days around it. ``max_ends[i]`` is the latest end among the first
+    i + 1 bookings (used by next_free_slot). Adding in start order is an
+    append; adding out of order shifts the lists. Overlap queries descend
+    a max-tree over the ends, built on the first query, skipping every
+    subtree that ends before the query starts, so one long booking
+    spanning many short ones does not make them scan every booking.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []
+        self._tree = None
+        self._leaves = 0
+
+    def add(self, start, end, surgery_id=None):
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.ids.insert(index, surgery_id)
+        self.max_ends.insert(index, end)
+        for i in range(index, len(self.starts)):
+            previous = self.max_ends[i - 1] if i else None
+            self.max_ends[i] = max(self.ends[i], previous) if previous else self.ends[i]
+        self._tree = None
+
+    def _build_tree(self):
+        leaves = 1
+        while leaves < len(self.ends):
+            leaves *= 2
+        tree = [None] * (2 * leaves)
+        tree[leaves:leaves + len(self.ends)] = self.ends
+        for node in range(leaves - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if right is None else max(left, right)
+        self._tree, self._leaves = tree, leaves
+
+    def overlapping(self, start, end, ignore_id=None):
+        """Ids of bookings that intersect [start, end), in start order"""
+        # Only the bookings starting before ``end`` can overlap
+        candidates = bisect.bisect_left(self.starts, end)
+        if not candidates:
+            return []
+        if self._tree is None:
+            self._build_tree()
+
+        found = []
+        stack = [(1, 0, self._leaves)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= candidates or self._tree[node] is None or self._tree[node] <= start:
+                continue
+            if node >= self._leaves:
+                if self.ids[low] != ignore_id:
+                    found.append(self.ids[low])
+                continue
+            middle = (low + high) // 2
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+        return found
+
+    def next_free_slot(self, minutes, not_before, not_after=None):
+        """Earliest start >= not_before with ``minutes`` free, or None if past not_after"""
+        length = timedelta(minutes=minutes)
+        candidate = not_before
+        index = bisect.bisect_left(self.starts, candidate) - 1
+        if index >= 0 and self.max_ends[index] > candidate:
+            candidate = self.max_ends[index]
+        index += 1
+
+        while index < len(self.starts):
+            if self.starts[index] >= candidate + length:
+                break
+            candidate = max(candidate, self.ends[index])
+            index += 1
+
+        if not_after and candidate + length > not_after:
+            return None
+        return candidate
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def lock_room_days(room, start, end):
+    """Serialize bookings of one room across workers for every day [start, end) touches.
+
+    Two overlapping bookings always share a day, so locking each day of
+    the interval (both days for a surgery running past midnight) is
+    enough. PostgreSQL takes one advisory lock per room/day, in date
+    order so two bookings never wait for each other crosswise; SQLite
+    takes the database write lock.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        lock_sqlite_writes(db.session)
+        return
+    day = start.date()
+    last_day = max((end - timedelta(microseconds=1)).date(), day)
+    while day <= last_day:
+        key = zlib.crc32(f'{room}|{day.isoformat()}'.encode())
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': key})
+        day += timedelta(days=1)
+
+
+def load_room_schedule(room, day, last_day=None, exclude_id=None):
+    """Build the schedule of a room for the days [day, last_day] from the database.
+
+    Surgeries starting up to LOOKBACK_DAYS before (the longest allowed
+    duration) and the day after are included, so that bookings running
+    past midnight are taken into account on both sides. ``exclude_id``
+    leaves out a surgery that is being moved.
+    """
+    schedule = RoomSchedule()
+    query = db.session.query(
+        Surgery.id, Surgery.surgery_date, Surgery.surgery_time, Surgery.duration
+    ).filter(
+        Surgery.operating_room == room,
+        Surgery.surgery_date.between(day - timedelta(days=LOOKBACK_DAYS), (last_day or day) + timedelta(days=1)),
+        or_(Surgery.status.is_(None), Surgery.status.notin_(INACTIVE_STATUSES))
+    )
+    if exclude_id is not None:
+        query = query.filter(Surgery.id != exclude_id)
+
+    intervals = sorted(
+        surgery_interval(row.surgery_date, row.surgery_time, row.duration) + (row.id,) for row in query.all()
+    )
+    for start, end, surgery_id in intervals:
+        schedule.add(start, end, surgery_id)
+    return schedule
+
+
+def find_conflicts(room, surgery_date, surgery_time, duration, ignore_id=None):
+    """Return the ids of active surgeries overlapping a proposed booking"""
+    if not room:
+        return []
+    start, end = surgery_interval(surgery_date, surgery_time, duration)
+    lock_room_days(room, start, end)
+    return load_room_schedule(room, surgery_date, end.date(), exclude_id=ignore_id).overlapping(start, end)
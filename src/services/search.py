@@ -0,0 +1,248 @@
+import os
+import threading
+from sqlalchemy import bindparam, event, text, update
+from src.database import db
+from src.models.patient import Patient
+from src.utils.arabic import normalize_arabic, patient_search_text
+
+# fts5 (SQLite), trigram (PostgreSQL pg_trgm) or memory; chosen from the database when unset
+PATIENT_SEARCH_BACKEND = os.environ.get('PATIENT_SEARCH_BACKEND')
+BACKFILL_BATCH_SIZE = 1000
+MIN_TRIGRAM_LENGTH = 3
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class InMemoryPatientIndex:
+    """Pure-Python trigram index over patient search text, for tests and small setups.
+
+    It follows ORM writes only; rows written with Core statements (the
+    bulk import) show up after the next restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts = {}
+        self._postings = {}
+
+    def add(self, patient_id, search_text):
+        with self._lock:
+            self._remove(patient_id)
+            search_text = search_text or ''
+            self._texts[patient_id] = search_text
+            for gram in trigrams(search_text):
+                self._postings.setdefault(gram, set()).add(patient_id)
+
+    def remove(self, patient_id):
+        with self._lock:
+            self._remove(patient_id)
+
+    def _remove(self, patient_id):
+        old = self._texts.pop(patient_id, None)
+        if old is None:
+            return
+        for gram in trigrams(old):
+            ids = self._postings.get(gram)
+            if ids:
+                ids.discard(patient_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, query, limit=20):
+        tokens = normalize_arabic(query).split()
+        if not tokens:
+            return []
+
+        with self._lock:
+            candidates = None
+            for token in tokens:
+                if len(token) < MIN_TRIGRAM_LENGTH:
+                    continue
+                ids = set.intersection(*[self._postings.get(gram, set()) for gram in trigrams(token)])
+                candidates = ids if candidates is None else candidates & ids
+            if candidates is None:
+                candidates = set(self._texts)
+
+            matches = []
+            for patient_id in candidates:
+                search_text = self._texts[patient_id]
+                if all(token in search_text for token in tokens):
+                    words = search_text.split()
+                    # Prefer matches at the start of a word, then shorter (more specific) texts
+                    prefix_hits = sum(any(word.startswith(token) for word in words) for token in tokens)
+                    matches.append((-prefix_hits, len(search_text), patient_id))
+
+        matches.sort()
+        return [patient_id for _, _, patient_id in matches[:limit]]
+
+    def __len__(self):
+        return len(self._texts)
+
+
+memory_index = InMemoryPatientIndex()
+
+
+def search_backend(engine):
+    if PATIENT_SEARCH_BACKEND:
+        return PATIENT_SEARCH_BACKEND
+    if engine.dialect.name == 'postgresql':
+        return 'trigram'
+    if engine.dialect.name == 'sqlite':
+        return 'fts5'
+    return 'memory'
+
+
+def backfill_search_text(engine):
+    """Fill search_text for patients created before the column existed"""
+    statement = update(Patient).where(Patient.id == bindparam('patient_id')).values(
+        search_text=bindparam('search_text')
+    ).execution_options(synchronize_session=False)
+    filled = 0
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                db.select(Patient.id, Patient.name, Patient.phone, Patient.national_id)
+                .where(Patient.search_text.is_(None))
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                return filled
+            conn.execute(statement, [
+                {'patient_id': row.id, 'search_text': patient_search_text(row.name, row.phone, row.national_id)}
+                for row in rows
+            ])
+            filled += len(rows)
+
+
+def _setup_fts5(engine):
+    # Before the triggers exist: updating rows the new index has not seen would corrupt it
+    backfill_search_text(engine)
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+        )).first()
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5("
+            "search_text, content='patients', content_rowid='id', tokenize='trigram')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN "
+            "INSERT INTO patients_fts(rowid, search_text) VALUES (new.id, new.search_text); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN "
+            "INSERT INTO patients_fts(patients_fts, rowid, search_text) "
+            "VALUES ('delete', old.id, old.search_text); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF search_text ON patients BEGIN "
+            "INSERT INTO patients_fts(patients_fts, rowid, search_text) "
+            "VALUES ('delete', old.id, old.search_text); "
+            "INSERT INTO patients_fts(rowid, search_text) VALUES (new.id, new.search_text); END"
+        ))
+
+    if not exists:
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')"))
+
+
+def _setup_trigram(engine):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_patients_search_text_trgm '
+            'ON patients USING gin (search_text gin_trgm_ops)'
+        ))
+    backfill_search_text(engine)
+
+
+def _setup_memory(engine):
+    backfill_search_text(engine)
+    with engine.connect() as conn:
+        for row in conn.execute(db.select(Patient.id, Patient.search_text)):
+            memory_index.add(row.id, row.search_text)
+
+    # Keep the in-memory index in step with ORM writes
+    if not event.contains(Patient, 'after_insert', _index_patient):
+        event.listen(Patient, 'after_insert', _index_patient)
+        event.listen(Patient, 'after_update', _index_patient)
+        event.listen(Patient, 'after_delete', _unindex_patient)
+
+
+def _index_patient(mapper, connection, target):
+    memory_index.add(target.id, target.search_text)
+
+
+def _unindex_patient(mapper, connection, target):
+    memory_index.remove(target.id)
+
+
+def setup_search(engine):
+    """Create the search index for the configured backend and backfill missing rows"""
+    backend = search_backend(engine)
+    if backend == 'fts5':
+        _setup_fts5(engine)
+    elif backend == 'trigram':
+        _setup_trigram(engine)
+    else:
+        _setup_memory(engine)
+    return backend
+
+
+def _like_pattern(token):
+    escaped = token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _search_fts5(tokens, limit):
+    long_tokens = [token for token in tokens if len(token) >= MIN_TRIGRAM_LENGTH]
+    short_tokens = [token for token in tokens if len(token) < MIN_TRIGRAM_LENGTH]
+    params = {'limit': limit}
+    conditions = []
+
+    for i, token in enumerate(short_tokens):
+        conditions.append(f"patients.search_text LIKE :short_{i} ESCAPE '\\'")
+        params[f'short_{i}'] = _like_pattern(token)
+
+    if long_tokens:
+        params['match'] = ' AND '.join('"' + token.replace('"', '""') + '"' for token in long_tokens)
+        sql = 'SELECT patients.id FROM patients_fts JOIN patients ON patients.id = patients_fts.rowid ' \
+              'WHERE patients_fts MATCH :match'
+        for condition in conditions:
+            sql += f' AND {condition}'
+        sql += ' ORDER BY patients_fts.rank LIMIT :limit'
+    else:
+        # Queries shorter than a trigram cannot use the index
+        sql = 'SELECT patients.id FROM patients WHERE ' + ' AND '.join(conditions) + \
+              ' ORDER BY length(patients.search_text) LIMIT :limit'
+
+    return list(db.session.execute(text(sql), params).scalars())
+
+
+def _search_trigram(tokens, limit):
+    params = {'limit': limit, 'query': ' '.join(tokens)}
+    conditions = []
+    for i, token in enumerate(tokens):
+        conditions.append(f'search_text ILIKE :token_{i}')
+        params[f'token_{i}'] = _like_pattern(token)
+
+    sql = 'SELECT id FROM patients WHERE ' + ' AND '.join(conditions) + \
+          ' ORDER BY similarity(search_text, :query) DESC, id LIMIT :limit'
+    return list(db.session.execute(text(sql), params).scalars())
+
+
+def search_patient_ids(query, limit=20):
+    """Return the ids of patients matching a name, phone or national ID fragment, best first"""
+    tokens = normalize_arabic(query).split()
+    if not tokens:
+        return []
+
+    backend = search_backend(db.engine)
+    if backend == 'fts5':
+        return _search_fts5(tokens, limit)
+    if backend == 'trigram':
+        return _search_trigram(tokens, limit)
+    return memory_index.search(query, limit)
@@ -0,0 +1,322 @@
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, urlencode
+
+try:
+    import boto3
+except ImportError:  # Only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+# local: files on this server's disk; object: S3-like store in a directory (for tests and
+# single-host setups); s3: any S3-compatible service (AWS, MinIO, Ceph...)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+STORAGE_OBJECT_ROOT = os.environ.get('STORAGE_OBJECT_ROOT', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'objects'))
+S3_BUCKET = os.environ.get('S3_BUCKET')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://minio:9000
+S3_REGION = os.environ.get('S3_REGION')
+# Lifetime of presigned download URLs (seconds)
+STORAGE_URL_TTL = int(os.environ.get('STORAGE_URL_TTL', 300))
+# Send downloads to presigned URLs instead of streaming them through the worker
+STORAGE_REDIRECT_DOWNLOADS = os.environ.get('STORAGE_REDIRECT_DOWNLOADS', '1') == '1'
+READ_SIZE = 1024 * 1024
+
+
+def content_disposition(file_name, as_attachment):
+    kind = 'attachment' if as_attachment else 'inline'
+    ascii_name = file_name.encode('ascii', 'ignore').decode() or 'file'
+    return f"{kind}; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(file_name)}"
+
+
+class LocalStorage:
+    """Files under a directory of this server; keys are paths relative to it"""
+
+    name = 'local'
+
+    def __init__(self, root=UPLOAD_FOLDER):
+        self.root = root
+
+    def _safe_key(self, key):
+        """Reject keys that would reach outside the root (absolute paths, '..')"""
+        if os.path.isabs(key):
+            # Rows from before relative keys (not yet relativized by db-upgrade) hold absolute paths under the root
+            key = os.path.relpath(key, self.root)
+        if os.path.isabs(key) or '..' in key.replace(os.sep, '/').split('/'):
+            raise ValueError('مفتاح التخزين غير صالح')
+        return key
+
+    def _path(self, key):
+        return os.path.join(self.root, self._safe_key(key))
+
+    def local_path(self, key):
+        """Path the worker or web server can send directly, None for remote stores"""
+        return self._path(key)
+
+    def put_file(self, key, source_path):
+        """Move a finished local file into the store"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source_path, path)
+
+    def put_stream(self, key, stream):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            shutil.copyfileobj(stream, f, READ_SIZE)
+        os.replace(f.name, path)
+
+    def open(self, key, start=0):
+        f = open(self._path(key), 'rb')
+        f.seek(start)
+        return f
+
+    def size(self, key):
+        """Size in bytes, or None if there is no such object"""
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix=''):
+        top = os.path.join(self.root, prefix)
+        for root, _, files in os.walk(top):
+            for name in files:
+                yield os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, '/')
+
+    def presigned_url(self, key, file_name, mime_type, as_attachment, expires_in=STORAGE_URL_TTL):
+        """Local files are sent by the worker or the web server, never redirected"""
+        return None
+
+
+class LocalObjectStorage(LocalStorage):
+    """A stand-in for an S3-compatible service, kept in a directory.
+
+    It behaves like a remote object store towards the rest of the app:
+    there is no local path to hand to the web server, reads are ranged
+    streams, writes are atomic, and downloads go through expiring signed
+    URLs served by /api/storage/<key>. Useful to run the remote code
+    paths without MinIO, and for single-host deployments.
+    """
+
+    name = 'object'
+
+    def __init__(self, root=STORAGE_OBJECT_ROOT, secret=None):
+        super().__init__(root)
+        self.secret = secret
+
+    def _safe_key(self, key):
+        # Objects only ever had relative keys
+        if os.path.isabs(key):
+            raise ValueError('مفتاح التخزين غير صالح')
+        return super()._safe_key(key)
+
+    def local_path(self, key):
+        return None
+
+    def put_file(self, key, source_path):
+        with open(source_path, 'rb') as f:
+            self.put_stream(key, f)
+        os.remove(source_path)
+
+    def presigned_url(self, key, file_name, mime_type, as_attachment, expires_in=STORAGE_URL_TTL):
+        params = {
+            'expires': int(time.time()) + expires_in,
+            'name': file_name,
+            'type': mime_type or '',
+            'attachment': int(bool(as_attachment))
+        }
+        params['signature'] = self.sign(key, params)
+        return f'/api/storage/{quote(key)}?{urlencode(params)}'
+
+    def sign(self, key, params):
+        from flask import current_app
+        secret = (self.secret or current_app.secret_key).encode()
+        message = '\n'.join([key, str(params['expires']), params['name'], params['type'], str(params['attachment'])])
+        return hmac.new(secret, message.encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, key, params):
+        """Check a presigned URL's query string; returns False when it was altered or has expired"""
+        try:
+            fields = {
+                'expires': int(params['expires']), 'name': params['name'],
+                'type': params.get('type', ''), 'attachment': int(params.get('attachment', 0))
+            }
+        except (KeyError, ValueError):
+            return False
+        if fields['expires'] < time.time():
+            return False
+        return hmac.compare_digest(self.sign(key, fields), params.get('signature', ''))
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, streamed with boto3"""
+
+    name = 's3'
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION):
+        if boto3 is None:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires boto3 (pip install boto3)')
+        if not bucket:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires S3_BUCKET')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """boto3 clients are thread-safe but must not cross a fork, so one per gunicorn worker"""
+        with self._lock:
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = boto3.session.Session().client(
+                    's3', endpoint_url=self.endpoint_url, region_name=self.region
+                )
+                self._client_pid = os.getpid()
+            return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None
+
+    def put_file(self, key, source_path):
+        # upload_file switches to parallel multipart uploads for large files
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def put_stream(self, key, stream):
+        self.client.upload_fileobj(stream, self.bucket, self._key(key))
+
+    def open(self, key, start=0):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=f'bytes={start}-')
+        return response['Body']
+
+    def size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def keys(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):]
+
+    def presigned_url(self, key, file_name, mime_type, as_attachment, expires_in=STORAGE_URL_TTL):
+        params = {
+            'Bucket': self.bucket,
+            'Key': self._key(key),
+            'ResponseContentDisposition': content_disposition(file_name, as_attachment)
+        }
+        if mime_type:
+            params['ResponseContentType'] = mime_type
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+class ObjectReader:
+    """Seekable, read-only file object over a remote object.
+
+    werkzeug answers Range requests by seeking the response file, so a
+    ranged download only fetches the bytes it needs from the store.
+    """
+
+    def __init__(self, backend, key, size):
+        self.backend = backend
+        self.key = key
+        self.size = size
+        self._position = 0
+        self._stream = None
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset != self._position:
+            self._close_stream()
+            self._position = offset
+        return self._position
+
+    def read(self, size=-1):
+        if self._position >= self.size:
+            return b''
+        if self._stream is None:
+            self._stream = self.backend.open(self.key, self._position)
+        data = self._stream.read(None if size is None or size < 0 else size)
+        self._position += len(data)
+        return data
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def close(self):
+        self._close_stream()
+
+
+@contextmanager
+def local_copy(backend, key, workdir=None):
+    """A local path with the object's content, downloaded to a temp file when the store is remote"""
+    path = backend.local_path(key)
+    if path:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(dir=workdir, delete=False) as f:
+        stream = backend.open(key)
+        try:
+            shutil.copyfileobj(stream, f, READ_SIZE)
+        finally:
+            stream.close()
+    try:
+        yield f.name
+    finally:
+        os.remove(f.name)
+
+
+def create_storage(name=STORAGE_BACKEND):
+    if name == 's3':
+        return S3Storage()
+    if name == 'object':
+        return LocalObjectStorage()
+    if name == 'local':
+        return LocalStorage()
+    raise ValueError(f'Unknown storage backend: {name}')
+
+
+storage = create_storage()
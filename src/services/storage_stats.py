@@ -0,0 +1,182 @@
+from datetime import date, timedelta
+from sqlalchemy import delete, event, func, inspect, select
+from src.database import db
+from src.models.auth import User
+from src.models.medical_files import FileBlob, MedicalFile, StorageCounter
+from src.models.patient import Patient
+
+ALL = 'all'
+
+
+def patient_file_stats(patient_id):
+    """Count and size a patient's files by category and type with one grouped query"""
+    rows = db.session.query(
+        MedicalFile.category, MedicalFile.file_type,
+        func.count(MedicalFile.id), func.coalesce(func.sum(MedicalFile.file_size), 0)
+    ).filter(MedicalFile.patient_id == patient_id).group_by(MedicalFile.category, MedicalFile.file_type).all()
+
+    stats = {'total': 0, 'by_category': {}, 'by_type': {}, 'total_size': 0}
+    for category, file_type, count, size in rows:
+        stats['by_category'][category] = stats['by_category'].get(category, 0) + count
+        stats['by_type'][file_type] = stats['by_type'].get(file_type, 0) + count
+        stats['total'] += count
+        stats['total_size'] += int(size)
+    return stats
+
+
+# ==================== Counters ====================
+
+def _upsert_counter(connection, dimension, key, files, size):
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(StorageCounter).values(
+        dimension=dimension, key=str(key), file_count=files, total_bytes=size
+    )
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['dimension', 'key'],
+        set_={
+            'file_count': StorageCounter.file_count + files,
+            'total_bytes': StorageCounter.total_bytes + size
+        }
+    ))
+
+
+def _file_keys(medical_file, category=None):
+    uploaded_at = medical_file.uploaded_at
+    return [
+        ('total', ALL),
+        ('patient', medical_file.patient_id),
+        ('category', category or medical_file.category),
+        ('uploader', medical_file.uploaded_by),
+        ('day', (uploaded_at.date() if uploaded_at else date.today()).isoformat()),
+    ]
+
+
+def count_file(connection, medical_file, sign):
+    size = (medical_file.file_size or 0) * sign
+    for dimension, key in _file_keys(medical_file):
+        _upsert_counter(connection, dimension, key, sign, size)
+
+
+def count_blob(connection, sign, size):
+    """Track the bytes actually on disk (shared content counted once)"""
+    _upsert_counter(connection, 'blobs', ALL, sign, size * sign)
+
+
+def count_stored_bytes(connection, delta):
+    """Bytes freed (negative) when a blob is compressed; the blob count stays the same"""
+    _upsert_counter(connection, 'blobs', ALL, 0, delta)
+
+
+@event.listens_for(MedicalFile, 'after_insert')
+def _file_inserted(mapper, connection, target):
+    count_file(connection, target, 1)
+
+
+@event.listens_for(MedicalFile, 'after_delete')
+def _file_deleted(mapper, connection, target):
+    count_file(connection, target, -1)
+
+
+@event.listens_for(MedicalFile, 'after_update')
+def _file_updated(mapper, connection, target):
+    history = inspect(target).attrs.category.history
+    if history.deleted and history.added:
+        size = target.file_size or 0
+        _upsert_counter(connection, 'category', history.deleted[0], -1, -size)
+        _upsert_counter(connection, 'category', history.added[0], 1, size)
+
+
+def rebuild_storage_counters(engine):
+    """Recompute every counter from medical_files and file_blobs"""
+    groupings = {
+        'total': None,
+        'patient': MedicalFile.patient_id,
+        'category': MedicalFile.category,
+        'uploader': MedicalFile.uploaded_by,
+        'day': func.date(MedicalFile.uploaded_at),
+    }
+    with engine.begin() as conn:
+        conn.execute(delete(StorageCounter))
+        rows = []
+        for dimension, column in groupings.items():
+            aggregates = [func.count(MedicalFile.id), func.coalesce(func.sum(MedicalFile.file_size), 0)]
+            if column is None:
+                result = [(ALL, *conn.execute(select(*aggregates)).one())]
+            else:
+                result = conn.execute(select(column, *aggregates).group_by(column)).all()
+            rows.extend(
+                {'dimension': dimension, 'key': str(key), 'file_count': count, 'total_bytes': int(size)}
+                for key, count, size in result if count
+            )
+        count, size = conn.execute(select(
+            func.count(FileBlob.sha256), func.coalesce(func.sum(func.coalesce(FileBlob.stored_size, FileBlob.size)), 0)
+        )).one()
+        if count:
+            rows.append({'dimension': 'blobs', 'key': ALL, 'file_count': count, 'total_bytes': int(size)})
+        if rows:
+            conn.execute(StorageCounter.__table__.insert(), rows)
+    return len(rows)
+
+
+def ensure_storage_counters(engine):
+    """Build the counters once for databases that had files before they existed"""
+    with engine.connect() as conn:
+        has_counters = conn.execute(select(StorageCounter.key).limit(1)).first()
+        has_files = conn.execute(select(MedicalFile.id).limit(1)).first()
+    if has_files and not has_counters:
+        return rebuild_storage_counters(engine)
+    return 0
+
+
+# ==================== Report ====================
+
+def _counter_dict(counter):
+    return {
+        'files': counter.file_count if counter else 0,
+        'bytes': counter.total_bytes if counter else 0
+    }
+
+
+def storage_report(top=20, days=30):
+    """Disk usage overall and by category, patient, uploader and day, read from the counters"""
+    def counters(dimension):
+        return StorageCounter.query.filter_by(dimension=dimension)
+
+    def largest(dimension):
+        return counters(dimension).filter(StorageCounter.file_count > 0) \
+            .order_by(StorageCounter.total_bytes.desc()).limit(top).all()
+
+    top_patients = largest('patient')
+    top_uploaders = largest('uploader')
+    patient_names = dict(db.session.query(Patient.id, Patient.name).filter(
+        Patient.id.in_([int(counter.key) for counter in top_patients])
+    ).all()) if top_patients else {}
+    uploader_names = dict(db.session.query(User.id, User.full_name).filter(
+        User.id.in_([int(counter.key) for counter in top_uploaders])
+    ).all()) if top_uploaders else {}
+
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    by_day = counters('day').filter(StorageCounter.key >= since).order_by(StorageCounter.key).all()
+
+    return {
+        'total': _counter_dict(db.session.get(StorageCounter, ('total', ALL))),
+        # Bytes on disk: identical uploads share one blob
+        'stored': _counter_dict(db.session.get(StorageCounter, ('blobs', ALL))),
+        'by_category': {
+            counter.key: _counter_dict(counter)
+            for counter in counters('category').filter(StorageCounter.file_count > 0)
+        },
+        'top_patients': [
+            dict(_counter_dict(counter), patient_id=int(counter.key), patient_name=patient_names.get(int(counter.key)))
+            for counter in top_patients
+        ],
+        'top_uploaders': [
+            dict(_counter_dict(counter), user_id=int(counter.key), full_name=uploader_names.get(int(counter.key)))
+            for counter in top_uploaders
+        ],
+        'by_day': [dict(_counter_dict(counter), date=counter.key) for counter in by_day]
+    }
@@ -0,0 +1,161 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import partial
+from threading import Lock
+from src.services.compression import local_content
+from src.services.file_storage import INCOMING_FOLDER
+from src.services.storage_backends import UPLOAD_FOLDER
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Thumbnails are disabled without Pillow
+    Image = None
+
+# Longest side in pixels
+THUMBNAIL_SIZES = {'small': 128, 'medium': 320, 'large': 800}
+DEFAULT_THUMBNAIL_SIZE = 'medium'
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+# How long a thumbnail request waits for a missing thumbnail before answering 202
+THUMBNAIL_WAIT_SECONDS = float(os.environ.get('THUMBNAIL_WAIT_SECONDS', 5))
+THUMBNAIL_QUALITY = 80
+PDF_RENDERER = shutil.which('pdftoppm')
+# Image formats Pillow is asked to open; DICOM and documents get no thumbnail
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = Lock()
+_pending = {}
+_pending_lock = Lock()
+
+
+def get_executor():
+    """Return the thumbnail pool, creating it lazily in each gunicorn worker"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def thumbnail_dir(patient_id):
+    return os.path.join(UPLOAD_FOLDER, f'patient_{patient_id}', 'thumbnails')
+
+
+def thumbnail_path(patient_id, file_id, size):
+    return os.path.join(thumbnail_dir(patient_id), f'{file_id}_{size}.jpg')
+
+
+def source_kind(file_name):
+    """'image', 'pdf' or None when no thumbnail can be made for the file"""
+    if Image is None or '.' not in file_name:
+        return None
+    ext = file_name.rsplit('.', 1)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext == 'pdf' and PDF_RENDERER:
+        return 'pdf'
+    return None
+
+
+def _open_pdf_page(path, workdir):
+    """Render the first page of a PDF with poppler's pdftoppm"""
+    output = os.path.join(workdir, 'page')
+    subprocess.run(
+        [PDF_RENDERER, '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+         '-scale-to', str(max(THUMBNAIL_SIZES.values())), path, output],
+        check=True, capture_output=True, timeout=60
+    )
+    return Image.open(output + '.jpg')
+
+
+def generate_thumbnails(source, kind, patient_id, file_id):
+    """Write every thumbnail size of one file, largest first, each file atomically.
+
+    ``source`` is the storage key; content in a remote store or in the
+    compressed tier is fetched to a temp file first. Thumbnails are a
+    cache kept on local disk. Work files are staged in INCOMING_FOLDER,
+    outside the served thumbnails directory but on the same disk, so the
+    finished thumbnails are still moved in atomically.
+    """
+    os.makedirs(thumbnail_dir(patient_id), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=INCOMING_FOLDER, prefix='thumbnail-') as workdir, \
+            local_content(source, workdir) as path:
+        image = _open_pdf_page(path, workdir) if kind == 'pdf' else Image.open(path)
+        with image:
+            largest = max(THUMBNAIL_SIZES.values())
+            # Lets the JPEG decoder skip most of the pixels of a large photo
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for size, pixels in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+                image.thumbnail((pixels, pixels))
+                temp_path = os.path.join(workdir, f'{size}.jpg')
+                image.save(temp_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+                os.replace(temp_path, thumbnail_path(patient_id, file_id, size))
+
+
+def _run(key, source, kind, patient_id, file_id):
+    try:
+        generate_thumbnails(source, kind, patient_id, file_id)
+    finally:
+        with _pending_lock:
+            _pending.pop(key, None)
+
+
+def _log_failure(file_id, future):
+    """Failures of jobs nobody waits for would otherwise go unnoticed"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Thumbnail generation failed for file %s', file_id, exc_info=future.exception())
+
+
+def schedule_thumbnails(source, file_name, patient_id, file_id):
+    """Queue thumbnail generation in the background; returns the future or None"""
+    kind = source_kind(file_name)
+    if kind is None:
+        return None
+    key = (patient_id, file_id)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = get_executor().submit(_run, key, source, kind, patient_id, file_id)
+            future.add_done_callback(partial(_log_failure, file_id))
+            _pending[key] = future
+        return future
+
+
+def get_thumbnail(source, file_name, patient_id, file_id, size):
+    """Path of the thumbnail, generating it if needed.
+
+    Returns None when it is still being generated after
+    THUMBNAIL_WAIT_SECONDS. Raises ValueError for files that have no
+    thumbnail and for generation failures.
+    """
+    path = thumbnail_path(patient_id, file_id, size)
+    if os.path.exists(path):
+        return path
+
+    future = schedule_thumbnails(source, file_name, patient_id, file_id)
+    if future is None:
+        raise ValueError('لا توجد صورة مصغرة لهذا الملف')
+    try:
+        future.result(timeout=THUMBNAIL_WAIT_SECONDS)
+    except TimeoutError:
+        return None
+    except Exception:
+        raise ValueError('تعذر إنشاء الصورة المصغرة')
+    return path
+
+
+def remove_thumbnails(patient_id, file_id):
+    for size in THUMBNAIL_SIZES:
+        try:
+            os.remove(thumbnail_path(patient_id, file_id, size))
+        except FileNotFoundError:
+            pass
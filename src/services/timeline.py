@@ -0,0 +1,123 @@
+import heapq
+from datetime import datetime, time
+from sqlalchemy import and_, false, or_, true
+from src.models.patient import ClinicVisit, WardAdmission, Surgery, EmergencyCase
+from src.models.medical_files import MedicalFile
+from src.utils.serializers import MODEL_FIELDS, select_rows, serialize_row
+
+
+class TimelineSource:
+    """One encounter table merged into the patient timeline"""
+
+    def __init__(self, kind, model, date_column, time_column=None):
+        self.kind = kind
+        self.model = model
+        self.date_column = date_column
+        self.time_column = time_column
+
+    def occurred_at(self, row):
+        value = getattr(row, self.date_column.key)
+        if self.time_column is not None:
+            value = datetime.combine(value, getattr(row, self.time_column.key) or time.min)
+        return value
+
+    def window_clause(self, start, end):
+        """Restrict to [start, end] on the indexed date column"""
+        is_date = self.time_column is not None
+        criteria = []
+        if start:
+            criteria.append(self.date_column >= (start.date() if is_date else start))
+        if end:
+            criteria.append(self.date_column <= (end.date() if is_date else end))
+        return criteria
+
+    def before_clause(self, cursor):
+        """Rows strictly after the cursor in (occurred_at, kind, id) descending order"""
+        at, kind, row_id = cursor
+        if kind == self.kind:
+            same_instant = self.model.id < row_id
+        else:
+            # Rows of different kinds at the same instant are ordered by kind
+            same_instant = true() if self.kind < kind else false()
+
+        if self.time_column is None:
+            return or_(self.date_column < at, and_(self.date_column == at, same_instant))
+
+        day, moment = at.date(), at.time()
+        return or_(
+            self.date_column < day,
+            and_(self.date_column == day, or_(
+                self.time_column < moment,
+                and_(self.time_column == moment, same_instant)
+            ))
+        )
+
+    def order_by(self):
+        columns = [self.date_column.desc()]
+        if self.time_column is not None:
+            columns.append(self.time_column.desc())
+        columns.append(self.model.id.desc())
+        return columns
+
+    def fetch(self, patient_id, start, end, cursor, limit):
+        """Read at most ``limit`` rows with one index range scan on (patient_id, date)"""
+        query = self.model.query.filter(self.model.patient_id == patient_id)
+        query = query.filter(*self.window_clause(start, end))
+        if cursor:
+            query = query.filter(self.before_clause(cursor))
+        query = query.order_by(*self.order_by()).limit(limit)
+
+        for row in select_rows(query, self.model, list(MODEL_FIELDS[self.model])).all():
+            yield self.occurred_at(row), self.kind, row
+
+
+SOURCES = [
+    TimelineSource('clinic_visit', ClinicVisit, ClinicVisit.visit_date, ClinicVisit.visit_time),
+    TimelineSource('emergency_case', EmergencyCase, EmergencyCase.arrival_time),
+    TimelineSource('medical_file', MedicalFile, MedicalFile.uploaded_at),
+    TimelineSource('surgery', Surgery, Surgery.surgery_date, Surgery.surgery_time),
+    TimelineSource('ward_admission', WardAdmission, WardAdmission.admission_date),
+]
+KINDS = [source.kind for source in SOURCES]
+
+
+def encode_cursor(at, kind, row_id):
+    return f'{at.isoformat()}|{kind}|{row_id}'
+
+
+def decode_cursor(value):
+    try:
+        at, kind, row_id = value.split('|')
+        if kind not in KINDS:
+            raise ValueError
+        return datetime.fromisoformat(at), kind, int(row_id)
+    except ValueError:
+        raise ValueError('قيمة before غير صالحة')
+
+
+def patient_timeline(patient_id, start=None, end=None, cursor=None, limit=50, kinds=None):
+    """Merge every encounter type of one patient into a single newest-first page.
+
+    Each table is read with its own (patient_id, date) index seek limited
+    to ``limit + 1`` rows past the cursor, and the already sorted streams
+    are merged in Python, so the cost depends on the page size and not on
+    how many encounters the patient has.
+    """
+    sources = [source for source in SOURCES if not kinds or source.kind in kinds]
+    streams = [source.fetch(patient_id, start, end, cursor, limit + 1) for source in sources]
+
+    items = []
+    last = None
+    merged = heapq.merge(*streams, key=lambda entry: (entry[0], entry[1], entry[2].id), reverse=True)
+    for at, kind, row in merged:
+        if len(items) == limit:
+            return items, encode_cursor(*last)
+        items.append({
+            'type': kind,
+            'id': row.id,
+            'at': at.isoformat(),
+            'data': serialize_row(row)
+        })
+        last = (at, kind, row.id)
+
+    return items, None
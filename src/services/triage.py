@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from datetime import datetime
+from src.database import db
+from src.models.patient import EmergencyCase
+from src.services.events import broker
+from src.utils.triage import severity_for, target_minutes
+
+EMERGENCY_CHANNEL = 'emergency_cases'
+WAITING = 'في الانتظار'
+IN_ASSESSMENT = 'قيد التقييم'
+# Backstop for events missed from other workers
+TRIAGE_QUEUE_TTL = float(os.environ.get('TRIAGE_QUEUE_TTL', 60))
+CLAIM_ATTEMPTS = 5
+
+
+def triage_order():
+    """ORDER BY for the queue: most severe first, then longest waiting"""
+    return EmergencyCase.severity, EmergencyCase.arrival_time, EmergencyCase.id
+
+
+class TriageQueue:
+    """Indexed binary min-heap of waiting emergency cases.
+
+    Entries are (severity, arrival_time, case_id) tuples and ``_position``
+    maps each case id to its slot in the heap, so a case whose priority
+    or status changes is moved or removed in O(log n) instead of
+    re-sorting the queue. The heap is loaded from the database at
+    startup, kept current by the create/update events published on
+    EMERGENCY_CHANNEL (from every worker with the socket broker) and
+    reloaded when older than TRIAGE_QUEUE_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._position = {}
+        self._built_at = None
+
+    def rebuild(self):
+        rows = db.session.query(
+            EmergencyCase.severity, EmergencyCase.arrival_time, EmergencyCase.id
+        ).filter(EmergencyCase.status == WAITING).order_by(*triage_order()).all()
+
+        with self._lock:
+            # Rows come back sorted, and a sorted list is already a valid heap
+            self._heap = [(severity, arrival_time, case_id) for severity, arrival_time, case_id in rows]
+            self._position = {entry[2]: index for index, entry in enumerate(self._heap)}
+            self._built_at = time.monotonic()
+
+    def refresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > TRIAGE_QUEUE_TTL:
+            self.rebuild()
+
+    def push(self, case_id, severity, arrival_time):
+        """Add a case, or move it if it is already queued"""
+        with self._lock:
+            entry = (severity, arrival_time, case_id)
+            index = self._position.get(case_id)
+            if index is None:
+                self._heap.append(entry)
+                self._position[case_id] = len(self._heap) - 1
+                self._sift_up(len(self._heap) - 1)
+            else:
+                self._heap[index] = entry
+                self._sift_up(index)
+                self._sift_down(self._position[case_id])
+
+    def remove(self, case_id):
+        with self._lock:
+            self._remove(case_id)
+
+    def peek(self):
+        with self._lock:
+            return self._heap[0] if self._heap else None
+
+    def pop(self):
+        """Remove and return the most urgent entry"""
+        with self._lock:
+            if not self._heap:
+                return None
+            top = self._heap[0]
+            self._remove(top[2])
+            return top
+
+    def ordered(self, limit=None):
+        """Queued entries in triage order"""
+        with self._lock:
+            entries = sorted(self._heap)
+        return entries[:limit] if limit else entries
+
+    def apply_event(self, event):
+        """Follow a created/updated event published for an emergency case"""
+        case = event.get('data') or {}
+        if 'id' not in case:
+            return
+        if case.get('status') == WAITING and case.get('arrival_time'):
+            severity = case.get('severity') or severity_for(case.get('priority'))
+            self.push(case['id'], severity, datetime.fromisoformat(case['arrival_time']))
+        else:
+            self.remove(case['id'])
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _remove(self, case_id):
+        index = self._position.pop(case_id, None)
+        if index is None:
+            return
+        last = self._heap.pop()
+        if index < len(self._heap):
+            self._heap[index] = last
+            self._position[last[2]] = index
+            self._sift_up(index)
+            self._sift_down(self._position[last[2]])
+
+    def _swap(self, i, j):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._position[heap[i][2]] = i
+        self._position[heap[j][2]] = j
+
+    def _sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self._heap[index] >= self._heap[parent]:
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index):
+        size = len(self._heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self._heap[child] < self._heap[smallest]:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
+
+
+triage = TriageQueue()
+broker.add_listener(EMERGENCY_CHANNEL, triage.apply_event)
+
+
+def backfill_severity(engine):
+    """Set severity on cases created before the column existed"""
+    filled = 0
+    with engine.begin() as conn:
+        priorities = conn.execute(
+            db.select(EmergencyCase.priority).where(EmergencyCase.severity.is_(None)).distinct()
+        ).scalars().all()
+        for priority in priorities:
+            result = conn.execute(
+                db.update(EmergencyCase)
+                .where(EmergencyCase.severity.is_(None), EmergencyCase.priority == priority)
+                .values(severity=severity_for(priority))
+            )
+            filled += result.rowcount
+    return filled
+
+
+def claim_next_case(status=IN_ASSESSMENT):
+    """Move the most urgent waiting case to ``status`` and return it, or None.
+
+    The candidate is read in triage order from the (status, severity,
+    arrival_time) index and claimed with a conditional UPDATE, so two
+    staff members pressing "next patient" at once never get the same
+    case. PostgreSQL also skips rows another transaction has locked.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        query = db.session.query(EmergencyCase.id).filter(
+            EmergencyCase.status == WAITING
+        ).order_by(*triage_order()).limit(1)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        case_id = query.scalar()
+        if case_id is None:
+            db.session.rollback()
+            return None
+
+        claimed = db.session.query(EmergencyCase).filter(
+            EmergencyCase.id == case_id, EmergencyCase.status == WAITING
+        ).update({'status': status}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            triage.remove(case_id)
+            return db.session.get(EmergencyCase, case_id)
+    return None
+
+
+def waiting_entry(entry, now, position):
+    severity, arrival_time, case_id = entry
+    waited = (now - arrival_time).total_seconds() / 60
+    target = target_minutes(severity)
+    return {
+        'id': case_id,
+        'position': position,
+        'severity': severity,
+        'arrival_time': arrival_time.isoformat(),
+        'waiting_minutes': int(waited),
+        'target_minutes': target,
+        'breached': waited > target,
+    }
+
+
+def waiting_queue(limit=None, now=None):
+    """The waiting queue in triage order with wait times against the targets"""
+    triage.refresh()
+    now = now or datetime.utcnow()
+    return [waiting_entry(entry, now, position) for position, entry in enumerate(triage.ordered(limit), start=1)]
+
+
+def breaches(now=None):
+    """Waiting cases past their target wait, most overdue first"""
+    late = [entry for entry in waiting_queue(now=now) if entry['breached']]
+    for entry in late:
+        entry['overdue_minutes'] = entry['waiting_minutes'] - entry['target_minutes']
+    late.sort(key=lambda entry: (-entry['overdue_minutes'], entry['severity']))
+    return late
@@ -0,0 +1,41 @@
+import re
+
+# Harakat, tanween, shadda, sukun and superscript alef
+DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+TATWEEL = '\u0640'
+
+LETTER_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ی': 'ي',
+    'ة': 'ه',
+    'ؤ': 'و',
+    'ک': 'ك',
+    # Arabic-Indic and Persian digits
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+})
+
+NON_WORD = re.compile(r'[^\w\s]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_arabic(text):
+    """Fold spelling variants so that searches match regardless of how a name was typed"""
+    if not text:
+        return ''
+    text = DIACRITICS.sub('', str(text)).replace(TATWEEL, '')
+    text = text.translate(LETTER_VARIANTS).lower()
+    text = NON_WORD.sub(' ', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def patient_search_text(name, phone=None, national_id=None):
+    """Build the normalized text indexed for patient search"""
+    parts = [normalize_arabic(name)]
+    if phone:
+        parts.append(re.sub(r'\D', '', normalize_arabic(phone)))
+    if national_id:
+        parts.append(normalize_arabic(national_id))
+    return ' '.join(part for part in parts if part)
@@ -0,0 +1,345 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import current_app, g, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.utils import profiling
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Statements slower than this are logged with the endpoint that ran them
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+# With several gunicorn workers, a directory they share: each worker writes its numbers
+# there every METRICS_FLUSH_SECONDS and a scrape adds up all of them. Empty it on restart.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 10))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+logger = logging.getLogger(__name__)
+slow_query_log = logging.getLogger('src.sql.slow')
+
+# Statistics of the request being handled in this thread (None outside requests)
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label set"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._series.items()]
+
+    def merge(self, snapshots):
+        """Add up the snapshots of several workers"""
+        series = {}
+        for snapshot in snapshots:
+            for key, counts, total, count in snapshot:
+                merged = series.setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return series
+
+    def render(self, series=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        if series is None:
+            series = self.merge([self.snapshot()])
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, value=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, snapshots):
+        values = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        if values is None:
+            values = self.merge([self.snapshot()])
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+REQUESTS = Counter('http_requests_total', 'Requests handled', ('method', 'endpoint', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Time to build the response', ('method', 'endpoint'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size (streamed bodies without Content-Length are not counted)',
+                          ('endpoint',), SIZE_BUCKETS)
+SERIALIZATION = Histogram('http_serialization_seconds', 'Time spent encoding JSON per request',
+                          ('endpoint',), LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram('db_statements_per_request', 'SQL statements executed per request',
+                           ('endpoint',), STATEMENT_BUCKETS)
+SQL_TIME = Histogram('db_time_per_request_seconds', 'Time spent in SQL statements per request',
+                     ('endpoint',), LATENCY_BUCKETS)
+SLOW_QUERIES = Counter('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS', ('endpoint',))
+METRICS = (REQUESTS, LATENCY, RESPONSE_SIZE, SERIALIZATION, SQL_STATEMENTS, SQL_TIME, SLOW_QUERIES)
+
+
+# ==================== SQL ====================
+
+# The start time lives on the statement's execution context, which is dropped with
+# it: a statement that raises never reaches after_cursor_execute and leaves nothing behind
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    endpoint = stats['endpoint'] if stats else 'background'
+    if stats:
+        stats['statements'] += 1
+        stats['sql_seconds'] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(endpoint)
+        slow_query_log.warning('%.1f ms [%s] %s', elapsed * 1000, endpoint, ' '.join(statement.split())[:1000])
+
+
+# ==================== JSON ====================
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, adding the encoding time to the current request"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            stats = _current.get()
+            if stats:
+                stats['serialize_seconds'] += time.perf_counter() - started
+
+
+# ==================== Middleware ====================
+
+def _start_request():
+    stats = {
+        'started': time.perf_counter(),
+        'endpoint': request.endpoint or 'unmatched',
+        'statements': 0,
+        'sql_seconds': 0.0,
+        'serialize_seconds': 0.0
+    }
+    g.metrics_token = _current.set(stats)
+    profiling.start_request()
+
+
+def _finish_request(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats['started']
+    endpoint = stats['endpoint']
+
+    REQUESTS.inc(request.method, endpoint, response.status_code)
+    LATENCY.observe(elapsed, request.method, endpoint)
+    SQL_STATEMENTS.observe(stats['statements'], endpoint)
+    SQL_TIME.observe(stats['sql_seconds'], endpoint)
+    SERIALIZATION.observe(stats['serialize_seconds'], endpoint)
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, endpoint)
+    profiling.finish_request(elapsed, request.method, endpoint)
+    _ensure_flushing(current_app._get_current_object())
+    return response
+
+
+def _teardown_request(exception=None):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        # after_request does not run for unhandled exceptions, so sampling may still be on
+        profiling.stop_request()
+        _current.reset(token)
+
+
+def init_metrics(app):
+    """Register the request timing middleware on the app"""
+    if not METRICS_ENABLED:
+        return
+    app.json = TimedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+
+# ==================== Workers ====================
+
+# Callables returning (name, 'counter' or 'gauge', value) samples of this worker
+_collectors = []
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_snapshot_path = None
+
+
+def add_collector(collector):
+    """Report extra samples (e.g. the connection pool) with the metrics"""
+    _collectors.append(collector)
+
+
+def _samples():
+    return [sample for collector in _collectors for sample in collector()]
+
+
+def write_snapshot():
+    """Write this worker's numbers to METRICS_DIR, replacing its previous file"""
+    global _snapshot_path
+    pid = os.getpid()
+    if _snapshot_path is None or not os.path.basename(_snapshot_path).startswith(f'{pid}-'):
+        # The start time keeps a recycled pid from overwriting a dead worker's counters
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _snapshot_path = os.path.join(METRICS_DIR, f'{pid}-{time.time_ns()}.json')
+    data = {
+        'pid': pid,
+        'metrics': {metric.name: metric.snapshot() for metric in METRICS},
+        'samples': _samples()
+    }
+    temporary = f'{_snapshot_path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, _snapshot_path)
+
+
+def _ensure_flushing(app):
+    """Start this worker's snapshot thread (once per process, also after a fork)"""
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+        def flush():
+            while True:
+                time.sleep(METRICS_FLUSH_SECONDS)
+                try:
+                    with app.app_context():
+                        write_snapshot()
+                except Exception:
+                    logger.exception('Failed to write metrics to %s', METRICS_DIR)
+        threading.Thread(target=flush, name='metrics-flush', daemon=True).start()
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots():
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # Removed or replaced while reading; it is complete again at the next scrape
+            continue
+    return snapshots
+
+
+def _render_samples(samples):
+    lines = []
+    totals = {}
+    for name, kind, value in samples:
+        totals.setdefault((name, kind), 0)
+        totals[(name, kind)] += value
+    for (name, kind), value in sorted(totals.items()):
+        lines += [f'# TYPE {name} {kind}', f'{name} {round(value, 6)}']
+    return lines
+
+
+def render_metrics():
+    """Every metric in the Prometheus text format.
+
+    Without METRICS_DIR these are this process's numbers. With it, the
+    files of every worker are added up: counters and histograms of
+    workers that exited are kept so that totals never go down, gauges
+    only count running workers.
+    """
+    lines = []
+    if not METRICS_DIR:
+        for metric in METRICS:
+            lines.extend(metric.render())
+        lines.extend(_render_samples(_samples()))
+        return '\n'.join(lines) + '\n'
+
+    write_snapshot()
+    snapshots = _read_snapshots()
+    for metric in METRICS:
+        lines.extend(metric.render(metric.merge(snapshot['metrics'].get(metric.name, []) for snapshot in snapshots)))
+    samples = [
+        sample
+        for snapshot in snapshots
+        for sample in snapshot['samples']
+        if sample[1] == 'counter' or _is_alive(snapshot['pid'])
+    ]
+    lines.extend(_render_samples(samples))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,102 @@
+from datetime import date, datetime, time
+from src.utils.serializers import list_fields, select_rows, serialize_row
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+PAGINATION_ARGS = ('after', 'limit', 'fields')
+
+
+def is_paginated(args):
+    """Check if the request asks for a paginated (cursor based) listing"""
+    return any(key in args for key in PAGINATION_ARGS)
+
+
+def parse_date_arg(value, name):
+    """Parse a YYYY-MM-DD or ISO datetime query argument"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'قيمة غير صالحة للمعامل {name}: {value}')
+
+
+def apply_filters(query, args, date_column=None, status_column=None):
+    """Apply ?from=, ?to= and ?status= filters to a list query"""
+    if date_column is not None:
+        is_date = date_column.type.python_type is date
+        date_from = args.get('from')
+        date_to = args.get('to')
+        if date_from:
+            value = parse_date_arg(date_from, 'from')
+            query = query.filter(date_column >= (value.date() if is_date else value))
+        if date_to:
+            value = parse_date_arg(date_to, 'to')
+            if is_date:
+                query = query.filter(date_column <= value.date())
+            elif len(date_to) == 10:
+                # A bare date means "until the end of that day"
+                query = query.filter(date_column < datetime.combine(value.date(), time.max))
+            else:
+                query = query.filter(date_column <= value)
+
+    status = args.get('status')
+    if status_column is not None and status:
+        query = query.filter(status_column.in_(status.split(',')))
+
+    return query
+
+
+def parse_fields(model, args):
+    """Return the list of field names requested with ?fields=, or None for all"""
+    raw = args.get('fields')
+    if not raw:
+        return None
+
+    available = list_fields(model)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError(f"حقول غير معروفة: {', '.join(unknown)}")
+
+    # The cursor is built from the id, so it is always selected
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def parse_limit(args, default=DEFAULT_LIMIT):
+    """Parse ?limit= and clamp it to MAX_LIMIT"""
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise ValueError('قيمة limit غير صالحة')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(query, model, args):
+    """Return one keyset page of a list query, newest records first.
+
+    Pages are addressed by ?after=<id> (the last id of the previous page)
+    so every page is a single index range scan on the primary key, no
+    matter how deep the client has scrolled.
+    """
+    limit = parse_limit(args)
+    fields = parse_fields(model, args)
+
+    after = args.get('after')
+    if after:
+        try:
+            query = query.filter(model.id < int(after))
+        except ValueError:
+            raise ValueError('قيمة after غير صالحة')
+
+    query = select_rows(query.order_by(model.id.desc()), model, fields)
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    items = [serialize_row(row) for row in rows[:limit]]
+
+    return {
+        'items': items,
+        'next_cursor': items[-1]['id'] if has_more and items else None,
+        'limit': limit
+    }
@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Off unless set: requests slower than this many ms get their sampled stacks written out
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'surgery-profiles'))
+# Oldest profiles are removed beyond this many
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+
+def _frame_name(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{os.path.basename(code.co_filename)}:{name}'.replace(' ', '_').replace(';', ':')
+
+
+def collapse(frame):
+    """One stack in the folded format of flamegraph.pl / speedscope: root;...;leaf"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads that are handling a request.
+
+    A single background thread wakes up every ``interval`` seconds and
+    records where each registered request thread is, so profiled code
+    runs unmodified (no tracing hooks) and the overhead does not depend
+    on how many functions a request calls.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # The sampler does not survive a fork, so each gunicorn worker starts its own
+        if self._thread is None or self._pid != os.getpid():
+            self._samples = {}
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._ensure_thread()
+            self._samples[thread_id] = {}
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return {stack: count}, or None if it was not sampled"""
+        with self._lock:
+            return self._samples.pop(thread_id, None)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != me:
+                        stack = collapse(frame)
+                        samples[stack] = samples.get(stack, 0) + 1
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+
+
+def start_request():
+    if PROFILE_SLOW_REQUEST_MS:
+        profiler.start(threading.get_ident())
+
+
+def stop_request():
+    if PROFILE_SLOW_REQUEST_MS:
+        return profiler.stop(threading.get_ident())
+    return None
+
+
+def finish_request(elapsed, method, endpoint):
+    """Write the request's stacks to PROFILE_DIR when it was slower than the threshold"""
+    samples = stop_request()
+    if not samples or elapsed * 1000 < PROFILE_SLOW_REQUEST_MS:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^\w.-]', '_', f'{endpoint}-{method}')
+    path = os.path.join(
+        PROFILE_DIR, f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}-{name}-{int(elapsed * 1000)}ms.folded"
+    )
+    with open(path, 'w') as f:
+        for stack, count in sorted(samples.items()):
+            f.write(f'{stack} {count}\n')
+    _prune()
+    return path
+
+
+def _prune():
+    try:
+        profiles = sorted(entry.path for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.folded'))
+    except FileNotFoundError:
+        return
+    for path in profiles[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,83 @@
+from datetime import date, datetime, time
+from src.models.patient import Patient, ClinicVisit, WardAdmission, Surgery, EmergencyCase
+from src.models.medical_files import MedicalFile
+
+# Columns returned by each model's to_dict(), in the same order (the timeline and
+# list pages select these); values taken from related rows, such as patient_name, are not columns
+MODEL_FIELDS = {
+    Patient: (
+        'id', 'name', 'age', 'phone', 'national_id', 'gender', 'blood_type',
+        'allergies', 'chronic_diseases', 'created_at', 'updated_at'
+    ),
+    ClinicVisit: (
+        'id', 'patient_id', 'visit_date', 'visit_time', 'visit_type', 'status',
+        'complaint', 'diagnosis', 'treatment', 'notes', 'created_at'
+    ),
+    WardAdmission: (
+        'id', 'patient_id', 'admission_date', 'discharge_date', 'room_number',
+        'bed_number', 'diagnosis', 'condition', 'medications', 'daily_notes',
+        'status', 'created_at'
+    ),
+    Surgery: (
+        'id', 'patient_id', 'surgery_type', 'surgery_date', 'surgery_time',
+        'duration', 'operating_room', 'anesthesia_type', 'status',
+        'pre_op_notes', 'post_op_notes', 'complications', 'created_at'
+    ),
+    EmergencyCase: (
+        'id', 'patient_id', 'arrival_time', 'complaint', 'priority', 'severity', 'status',
+        'vital_signs', 'initial_assessment', 'decision', 'notes', 'created_at'
+    ),
+    MedicalFile: (
+        'id', 'patient_id', 'uploaded_by', 'file_name', 'file_path', 'file_type',
+        'file_size', 'mime_type', 'content_hash', 'category', 'description', 'date_taken', 'uploaded_at'
+    ),
+}
+
+# Patient columns embedded in each encounter's to_dict()
+PATIENT_FIELDS = {
+    ClinicVisit: {'patient_name': Patient.name, 'patient_age': Patient.age, 'patient_phone': Patient.phone},
+    WardAdmission: {'patient_name': Patient.name, 'patient_age': Patient.age},
+    Surgery: {'patient_name': Patient.name, 'patient_age': Patient.age},
+    EmergencyCase: {'patient_name': Patient.name, 'patient_age': Patient.age, 'patient_phone': Patient.phone},
+}
+
+
+def serialize_value(value):
+    """Convert a column value into something jsonify can handle"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def list_fields(model):
+    """Map every serializable field name of a model to its column"""
+    fields = {name: getattr(model, name) for name in MODEL_FIELDS[model]}
+    fields.update(PATIENT_FIELDS.get(model, {}))
+    return fields
+
+
+def select_rows(query, model, names=None):
+    """Turn an ORM query into a plain column query with the patient joined in.
+
+    The patient's name/age/phone come from a single outer join instead of
+    the lazy ``patient`` backref, so serializing N rows costs one SELECT
+    rather than N + 1.
+    """
+    fields = list_fields(model)
+    names = names or list(fields)
+    query = query.with_entities(*[fields[name].label(name) for name in names])
+
+    patient_fields = PATIENT_FIELDS.get(model, {})
+    if any(name in patient_fields for name in names):
+        query = query.outerjoin(Patient, Patient.id == model.patient_id)
+    return query
+
+
+def serialize_row(row):
+    """Build a response dict from a row produced by select_rows()"""
+    return {name: serialize_value(value) for name, value in row._mapping.items()}
+
+
+def serialize_all(query, model):
+    """Run a list query and serialize every row without lazy loads"""
+    return [serialize_row(row) for row in select_rows(query, model).all()]
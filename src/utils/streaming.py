@@ -0,0 +1,46 @@
+from flask import Response, current_app, stream_with_context
+from src.utils.serializers import select_rows, serialize_row
+
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def wants_stream(args):
+    """Check if the client asked for a streamed response with ?stream=1"""
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_json_array(items):
+    """Encode an iterable of dicts as a JSON array, yielding ~64 KB chunks"""
+    dumps = current_app.json.dumps
+    parts = ['[']
+    size = 1
+    first = True
+
+    for item in items:
+        encoded = dumps(item) if first else ',' + dumps(item)
+        first = False
+        parts.append(encoded)
+        size += len(encoded)
+        if size >= CHUNK_SIZE:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+
+    parts.append(']')
+    yield ''.join(parts)
+
+
+def iter_rows(query, model):
+    """Serialize a list query row by row from a server-side cursor"""
+    for row in select_rows(query, model).yield_per(YIELD_PER):
+        yield serialize_row(row)
+
+
+def stream_json(items):
+    """Build a streamed JSON array response from an iterable of dicts.
+
+    Rows are encoded as they are fetched, so the full list never exists
+    in memory, neither as Python objects nor as a JSON string.
+    """
+    return Response(stream_with_context(iter_json_array(items)), mimetype='application/json')
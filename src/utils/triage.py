@@ -0,0 +1,39 @@
+import os
+from src.utils.arabic import normalize_arabic
+
+# Lower severity is seen first
+PRIORITY_SEVERITY = {
+    'حرج': 1,
+    'عاجل': 2,
+    'متوسط': 3,
+    'غير عاجل': 4,
+}
+# Priorities that are missing or not in the list above queue after everything else
+UNKNOWN_SEVERITY = 5
+
+# Longest acceptable wait per severity, in minutes (TRIAGE_TARGET_MINUTES="0,15,60,120,240")
+DEFAULT_TARGET_MINUTES = (0, 15, 60, 120, 240)
+
+_NORMALIZED = {normalize_arabic(name): severity for name, severity in PRIORITY_SEVERITY.items()}
+
+
+def severity_for(priority):
+    """Map a free-text Arabic priority to its integer severity"""
+    if priority in PRIORITY_SEVERITY:
+        return PRIORITY_SEVERITY[priority]
+    return _NORMALIZED.get(normalize_arabic(priority), UNKNOWN_SEVERITY)
+
+
+def _target_minutes():
+    value = os.environ.get('TRIAGE_TARGET_MINUTES')
+    if not value:
+        return dict(enumerate(DEFAULT_TARGET_MINUTES, start=1))
+    minutes = [int(part) for part in value.split(',')]
+    return dict(enumerate(minutes, start=1))
+
+
+TARGET_MINUTES = _target_minutes()
+
+
+def target_minutes(severity):
+    return TARGET_MINUTES.get(severity, TARGET_MINUTES[max(TARGET_MINUTES)])
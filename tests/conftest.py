@@ -0,0 +1,99 @@
+import os
+import sys
+
+# Configure the app before src.main is imported: in-memory database, no event sockets
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['EVENTS_BACKEND'] = 'local'
+os.environ.setdefault('METRICS_ENABLED', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+from src.main import app as flask_app, upgrade_database
+from src.database import db
+from src.models.auth import User
+from src.services.beds import occupancy
+from src.services.triage import triage
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        upgrade_database()
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def clean_database(app):
+    """Each test starts with only the default admin and empty in-process caches"""
+    yield
+    with app.app_context():
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name != 'users':
+                db.session.execute(table.delete())
+        db.session.execute(User.__table__.delete().where(User.username != 'admin'))
+        db.session.execute(User.__table__.update().values(role='admin', is_active=True))
+        db.session.commit()
+    occupancy._built_at = None
+    triage._built_at = None
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app, client):
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+    with client.session_transaction() as session:
+        session['user_id'] = admin.id
+        session['username'] = admin.username
+        session['role'] = admin.role
+    return client
+
+
+@pytest.fixture
+def count_statements(app):
+    """count_statements(callable) -> (result, number of SQL statements it executed)"""
+    def run(function):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = function()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return result, len(statements)
+    return run
+
+
+@pytest.fixture
+def seed_patients(app):
+    """seed_patients(n) adds n patients, each with a visit, an admission, a surgery and an emergency case"""
+    from datetime import date, time
+    from src.models.patient import ClinicVisit, EmergencyCase, Patient, Surgery, WardAdmission
+
+    def seed(n, start=0):
+        with app.app_context():
+            for i in range(start, start + n):
+                patient = Patient(name=f'مريض {i}', age=30 + i % 50, phone=f'0550{i:06d}', national_id=f'N{i}')
+                db.session.add(patient)
+                db.session.flush()
+                db.session.add_all([
+                    ClinicVisit(patient_id=patient.id, visit_date=date(2025, 1, 1 + i % 28), visit_time=time(9, 0)),
+                    WardAdmission(patient_id=patient.id, room_number=str(100 + i), bed_number='1'),
+                    Surgery(patient_id=patient.id, surgery_type='استئصال الزائدة', surgery_date=date(2025, 2, 1 + i % 28),
+                            surgery_time=time(8, 0), operating_room=f'OR{i}', duration='1 ساعة'),
+                    EmergencyCase(patient_id=patient.id, complaint='ألم بطني', priority='عاجل'),
+                ])
+            db.session.commit()
+    return seed
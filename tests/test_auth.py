@@ -0,0 +1,29 @@
+from src.database import db
+from src.models.auth import User
+
+
+def set_admin(app, **values):
+    """Change the admin row directly, as another worker would"""
+    with app.app_context():
+        db.session.execute(User.__table__.update().where(User.username == 'admin').values(**values))
+        db.session.commit()
+
+
+def test_demoted_admin_loses_access_at_once(app, admin_client):
+    assert admin_client.get('/api/auth/users').status_code == 200
+    set_admin(app, role='doctor')
+    assert admin_client.get('/api/auth/users').status_code == 403
+    assert admin_client.get('/api/auth/me').get_json()['role'] == 'doctor'
+
+
+def test_deactivated_admin_is_refused(app, admin_client):
+    assert admin_client.get('/api/auth/users').status_code == 200
+    set_admin(app, is_active=False)
+    assert admin_client.get('/api/auth/users').status_code == 403
+
+
+def test_user_is_loaded_once_per_request(app, admin_client, count_statements):
+    response, statements = count_statements(lambda: admin_client.get('/api/auth/users'))
+    assert response.status_code == 200
+    # The admin check and the listing; the user row is not read twice
+    assert statements == 2
@@ -0,0 +1,61 @@
+from sqlalchemy import inspect
+from src.database import db
+from src.migrations import ensure_indexes
+from src.models.patient import WardAdmission
+from src.routes import patient as patient_routes
+
+
+def admit(client, room, bed):
+    return client.post('/api/ward-admissions', json={'patient_id': 1, 'room_number': room, 'bed_number': bed})
+
+
+def test_second_admission_to_a_bed_is_refused(admin_client, seed_patients):
+    seed_patients(1)
+    assert admit(admin_client, '7', '1').status_code == 201
+    assert admit(admin_client, '7', '1').status_code == 409
+
+
+def test_unique_index_catches_a_race_past_the_check(admin_client, seed_patients, monkeypatch):
+    seed_patients(1)
+    assert admit(admin_client, '7', '2').status_code == 201
+    # Both requests passed check_bed before either committed
+    monkeypatch.setattr(patient_routes, 'bed_is_taken', lambda *args, **kwargs: False)
+    response = admit(admin_client, '7', '2')
+    assert response.status_code == 409
+    assert 'error' in response.get_json()
+
+
+def test_readmitting_into_an_occupied_bed_is_refused(admin_client, seed_patients):
+    seed_patients(1)
+    first = admit(admin_client, '7', '3').get_json()
+    admin_client.put(f"/api/ward-admissions/{first['id']}", json={'status': 'خرج'})
+    assert admit(admin_client, '7', '3').status_code == 201
+
+    response = admin_client.put(f"/api/ward-admissions/{first['id']}", json={'status': 'منوم'})
+    assert response.status_code == 409
+
+
+def test_discharged_admissions_may_share_a_bed(app, admin_client, seed_patients):
+    seed_patients(1)
+    for _ in range(2):
+        admission = admit(admin_client, '7', '4').get_json()
+        admin_client.put(f"/api/ward-admissions/{admission['id']}", json={'status': 'خرج'})
+    with app.app_context():
+        assert WardAdmission.query.filter_by(room_number='7', bed_number='4').count() == 2
+
+
+def test_upgrade_skips_the_unique_index_while_duplicates_exist(app, seed_patients):
+    seed_patients(1)
+    with app.app_context():
+        index = next(i for i in WardAdmission.__table__.indexes if i.name == 'uq_ward_admissions_admitted_bed')
+        index.drop(db.engine)
+        db.session.add_all([WardAdmission(patient_id=1, room_number='9', bed_number='9') for _ in range(2)])
+        db.session.commit()
+        try:
+            assert 'uq_ward_admissions_admitted_bed' not in ensure_indexes(db.engine)
+        finally:
+            WardAdmission.query.filter_by(room_number='9').delete()
+            db.session.commit()
+            assert ensure_indexes(db.engine) == ['uq_ward_admissions_admitted_bed']
+        names = {i['name'] for i in inspect(db.engine).get_indexes('ward_admissions')}
+        assert 'uq_ward_admissions_admitted_bed' in names
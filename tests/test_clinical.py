@@ -0,0 +1,40 @@
+import pytest
+from src.models.clinical import VitalSign
+from src.routes import clinical as clinical_routes
+from src.services.clinical import parse_legacy_vitals
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('SpO2 95%', {'spo2': 95}),
+    ('spo2: 91', {'spo2': 91}),
+    ('O2 sat 92', {'spo2': 92}),
+    ('BP 120/80, HR 90, SpO2 95%', {'systolic_bp': 120, 'diastolic_bp': 80, 'heart_rate': 90, 'spo2': 95}),
+    ('HR90', {'heart_rate': 90}),
+    ('النبض: ٩٠، الحرارة 37.5', {'heart_rate': 90, 'temperature': 37.5}),
+])
+def test_free_text_keys_may_contain_digits(text, expected):
+    assert parse_legacy_vitals(text) == [(None, expected)]
+
+
+def test_editing_the_text_records_only_the_changed_value(app, admin_client, seed_patients):
+    seed_patients(1)
+    admin_client.put('/api/emergency-cases/1', json={'vital_signs': 'HR 90, SpO2 88'})
+    admin_client.put('/api/emergency-cases/1', json={'vital_signs': 'HR 95, SpO2 88'})
+
+    with app.app_context():
+        assert VitalSign.query.filter_by(metric='heart_rate').count() == 2
+        assert VitalSign.query.filter_by(metric='spo2').count() == 1
+    low = admin_client.get('/api/vitals?metric=spo2&below=90&minutes=60').get_json()
+    assert len(low) == 1
+
+
+def test_recording_vitals_publishes_the_case(app, admin_client, seed_patients, monkeypatch):
+    seed_patients(1)
+    published = []
+    monkeypatch.setattr(clinical_routes, 'publish', lambda *args: published.append(args))
+
+    response = admin_client.post('/api/emergency-cases/1/vitals', json={'spo2': 94})
+    assert response.status_code == 201
+    [(channel, event_type, data)] = published
+    assert (channel, event_type) == (clinical_routes.EMERGENCY_CHANNEL, 'updated')
+    assert data['id'] == 1 and '"spo2": 94' in data['vital_signs']
@@ -0,0 +1,53 @@
+from sqlalchemy import insert
+from src.database import db
+from src.models.clinical import MedicationOrder, VitalSign
+from src.models.patient import EmergencyCase, WardAdmission
+from src.services import clinical
+
+
+def legacy_rows(cases, admissions):
+    """Rows from before the clinical tables, which get legacy_synced = false when the column is added"""
+    db.session.execute(insert(EmergencyCase), [
+        {'patient_id': 1, 'complaint': 'c', 'priority': 'عاجل', 'vital_signs': vital_signs, 'legacy_synced': False}
+        for vital_signs in cases
+    ])
+    db.session.execute(insert(WardAdmission), [
+        {'patient_id': 1, 'room_number': str(i), 'bed_number': '1', 'medications': medications, 'status': 'خرج',
+         'legacy_synced': False}
+        for i, medications in enumerate(admissions)
+    ])
+    db.session.commit()
+
+
+def test_backfill_runs_in_batches_and_parses_each_row_once(app, seed_patients, monkeypatch):
+    seed_patients(1)
+    with app.app_context():
+        legacy_rows(
+            ['{"hr": 90, "temp": 37.5}', 'مستقر', '', None, 'BP 120/80'],
+            ['["باراسيتامول"]', '', None]
+        )
+
+        calls = []
+        original = clinical.sync_case_vitals
+        monkeypatch.setattr(clinical, 'sync_case_vitals', lambda case: calls.append(case.id) or original(case))
+
+        assert clinical.backfill_clinical_data(batch_size=2) == (3, 1)
+        assert VitalSign.query.count() == 4
+        assert MedicationOrder.query.count() == 1
+        assert EmergencyCase.query.filter(EmergencyCase.legacy_synced.is_(False)).count() == 0
+
+        # The free-text case without readings is not parsed again
+        parsed = len(calls)
+        assert clinical.backfill_clinical_data(batch_size=2) == (0, 0)
+        assert len(calls) == parsed
+        assert VitalSign.query.count() == 4
+
+
+def test_rows_created_through_the_api_are_already_synced(app, admin_client, seed_patients):
+    seed_patients(1)
+    admin_client.post('/api/emergency-cases', json={
+        'patient_id': 1, 'complaint': 'c', 'priority': 'عاجل', 'vital_signs': '{"hr": 80}'
+    })
+    with app.app_context():
+        assert EmergencyCase.query.filter(EmergencyCase.legacy_synced.is_(False)).count() == 0
+        assert clinical.backfill_clinical_data() == (0, 0)
@@ -0,0 +1,82 @@
+import hashlib
+import pytest
+from src.database import db
+from src.models.medical_files import FileBlob, MedicalFile
+from src.services import compression, file_storage
+from src.services.storage_backends import LocalStorage
+
+CONTENT = b'Hb 13.5 g/dL; WBC 7.2; PLT 250\n' * 8192
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path / 'store'))
+    monkeypatch.setattr(file_storage, 'storage', backend)
+    monkeypatch.setattr(compression, 'storage', backend)
+    return backend
+
+
+def add_file(tmp_path, content=CONTENT):
+    """Store content with its MedicalFile row, as an upload does; returns (sha256, key)"""
+    source = tmp_path / 'upload'
+    source.write_bytes(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    key = file_storage.store_file(str(source), sha256, len(content))
+    db.session.add(MedicalFile(patient_id=1, uploaded_by=1, file_name='labs.txt', file_path=key,
+                               file_type='document', category='lab', file_size=len(content), content_hash=sha256))
+    db.session.commit()
+    return sha256, key
+
+
+def test_compressing_moves_rows_and_deletes_the_original(app, store, tmp_path, seed_patients):
+    seed_patients(1)
+    with app.app_context():
+        sha256, key = add_file(tmp_path)
+        status, saved = compression.compress_blob(db.engine, sha256, len(CONTENT), key, 'labs.txt')
+        assert status == 'compressed' and saved > 0
+
+        blob = db.session.get(FileBlob, sha256)
+        assert blob.storage_path == key + '.gz'
+        assert blob.decompress_seconds > 0
+        assert MedicalFile.query.one().file_path == key + '.gz'
+        assert not store.exists(key)
+        assert b''.join(compression.iter_content(blob.storage_path, 'gzip')) == CONTENT
+
+
+def test_upload_after_compression_dedupes_against_the_new_key(app, store, tmp_path, seed_patients):
+    seed_patients(1)
+    with app.app_context():
+        sha256, key = add_file(tmp_path)
+        compression.compress_blob(db.engine, sha256, len(CONTENT), key, 'labs.txt')
+        assert add_file(tmp_path)[1] == key + '.gz'
+        assert not store.exists(key)
+
+
+def test_original_is_kept_while_a_row_still_refers_to_it(app, store, tmp_path, seed_patients):
+    seed_patients(1)
+    with app.app_context():
+        sha256, key = add_file(tmp_path)
+        # A legacy row (no content hash) pointing at the same key is not moved by the switch
+        db.session.add(MedicalFile(patient_id=1, uploaded_by=1, file_name='old.txt', file_path=key,
+                                   file_type='document', category='lab', file_size=len(CONTENT)))
+        db.session.commit()
+        assert compression.compress_blob(db.engine, sha256, len(CONTENT), key, 'labs.txt')[0] == 'compressed'
+        assert store.exists(key)
+
+
+def test_report_reads_only_the_database(app, admin_client, store, tmp_path, seed_patients, monkeypatch):
+    seed_patients(1)
+    with app.app_context():
+        sha256, key = add_file(tmp_path)
+        compression.compress_blob(db.engine, sha256, len(CONTENT), key, 'labs.txt')
+
+    def no_reads(key, start=0):
+        raise AssertionError('the report must not read stored files')
+    monkeypatch.setattr(store, 'open', no_reads)
+
+    response = admin_client.get('/api/files/tiering-report')
+    assert response.status_code == 200
+    gzip = response.get_json()['codecs']['gzip']
+    assert gzip['blobs'] == 1
+    assert gzip['measured_bytes'] == len(CONTENT)
+    assert gzip['added_ms_per_mb'] > 0
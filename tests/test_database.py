@@ -0,0 +1,19 @@
+from sqlalchemy import create_engine, event, text
+from src.database import configure_engine, configure_sqlite_connection, db
+
+
+def test_sqlite_settings_only_apply_to_the_app_engine(app, tmp_path):
+    with app.app_context():
+        assert event.contains(db.engine, 'connect', configure_sqlite_connection)
+
+    other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    with other.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+
+    other.dispose()
+    configure_engine(other)
+    with other.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        # synchronous is left at SQLite's default (FULL) so a commit survives a power loss
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 2
+    other.dispose()
@@ -0,0 +1,46 @@
+import hashlib
+import io
+import pytest
+from src.routes import medical_files
+from src.services import file_storage
+from src.services.storage_backends import LocalStorage
+
+CONTENT = bytes(range(256)) * 400
+
+
+@pytest.fixture
+def stored_file(tmp_path, monkeypatch, admin_client, seed_patients):
+    backend = LocalStorage(str(tmp_path / 'store'))
+    monkeypatch.setattr(file_storage, 'storage', backend)
+    monkeypatch.setattr(medical_files, 'storage', backend)
+    monkeypatch.setattr(medical_files, 'UPLOAD_FOLDER', backend.root)
+    seed_patients(1)
+    response = admin_client.post('/api/patients/1/files/upload', content_type='multipart/form-data',
+                                 data={'file': (io.BytesIO(CONTENT), 'report.pdf'), 'category': 'lab'})
+    assert response.status_code == 201
+    return response.get_json()['file']['id']
+
+
+def test_strong_etag_and_revalidation(admin_client, stored_file):
+    url = f'/api/files/{stored_file}/download'
+    response = admin_client.get(url)
+    assert response.get_data() == CONTENT
+    assert response.headers['ETag'] == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+    assert 'private' in response.headers['Cache-Control']
+
+    assert admin_client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_range_requests_return_only_the_requested_bytes(admin_client, stored_file):
+    response = admin_client.get(f'/api/files/{stored_file}/download', headers={'Range': 'bytes=1000-1999'})
+    assert response.status_code == 206
+    assert response.get_data() == CONTENT[1000:2000]
+    assert response.headers['Content-Range'] == f'bytes 1000-1999/{len(CONTENT)}'
+
+
+def test_x_accel_hands_the_file_to_nginx(admin_client, stored_file, monkeypatch):
+    monkeypatch.setattr(medical_files, 'FILE_SEND_MODE', 'x-accel')
+    response = admin_client.get(f'/api/files/{stored_file}/download')
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    assert response.headers['X-Accel-Redirect'] == f'{medical_files.FILE_ACCEL_PREFIX}blobs/{sha256[:2]}/{sha256}'
+    assert response.get_data() == b''
@@ -0,0 +1,97 @@
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from src.routes import patient as patient_routes
+from src.services.events import LocalBroker, SocketBroker
+
+
+def test_streams_above_the_cap_get_503(admin_client, monkeypatch):
+    monkeypatch.setattr(patient_routes, 'stream_slots', threading.BoundedSemaphore(1))
+
+    first = admin_client.get('/api/emergency-cases/stream', buffered=False)
+    assert first.status_code == 200
+    refused = admin_client.get('/api/emergency-cases/stream', buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == str(patient_routes.SSE_RETRY_AFTER_SECONDS)
+
+    # Closing a stream, even one never read, frees its slot
+    first.close()
+    again = admin_client.get('/api/emergency-cases/stream', buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_listener_errors_are_logged_and_do_not_stop_delivery(caplog):
+    broker = LocalBroker()
+    received = []
+    broker.add_listener('channel', lambda event: 1 / 0)
+    broker.add_listener('channel', received.append)
+
+    with caplog.at_level(logging.ERROR, logger='src.services.events'):
+        broker.publish('channel', {'type': 'created'})
+
+    assert received == [{'type': 'created'}]
+    assert 'ZeroDivisionError' in caplog.text
+
+
+def test_socket_broker_receives_before_its_first_publish(tmp_path):
+    broker = SocketBroker(str(tmp_path))
+    received = []
+    broker.add_listener('channel', received.append)
+    broker.start()
+
+    sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sender.sendto(json.dumps({'channel': 'channel', 'event': {'type': 'created'}}).encode(), broker._path)
+    sender.close()
+
+    deadline = time.monotonic() + 2
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert received == [{'type': 'created'}]
+
+
+class FailingSocket:
+    def __init__(self, error):
+        self.error = error
+        self.sent = 0
+
+    def sendto(self, payload, path):
+        self.sent += 1
+        raise OSError(self.error, os.strerror(self.error))
+
+
+def test_send_errors_are_logged_with_the_channel_and_errno(tmp_path, caplog):
+    broker = SocketBroker(str(tmp_path))
+    broker.start()
+    for pid in ('1', '2'):
+        (tmp_path / f'{pid}.sock').touch()
+
+    broker._socket = FailingSocket(errno.ENOBUFS)
+    with caplog.at_level(logging.WARNING, logger='src.services.events'):
+        broker.publish('emergency', {'type': 'updated'})
+    assert broker._socket.sent == 2
+    assert 'emergency' in caplog.text and 'ENOBUFS' in caplog.text
+    # Only dead sockets are removed
+    assert (tmp_path / '1.sock').exists() and (tmp_path / '2.sock').exists()
+
+    caplog.clear()
+    broker._socket = FailingSocket(errno.EMSGSIZE)
+    with caplog.at_level(logging.WARNING, logger='src.services.events'):
+        broker.publish('emergency', {'type': 'updated'})
+    assert broker._socket.sent == 1
+    assert 'datagram limit' in caplog.text
+
+
+def test_dead_worker_sockets_are_removed(tmp_path):
+    broker = SocketBroker(str(tmp_path))
+    broker.start()
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / '1.sock'))
+    dead.close()
+
+    broker.publish('emergency', {'type': 'updated'})
+    assert not (tmp_path / '1.sock').exists()
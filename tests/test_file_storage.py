@@ -0,0 +1,64 @@
+import hashlib
+import pytest
+from src.database import db
+from src.models.medical_files import FileBlob, StorageCounter
+from src.services import file_storage
+from src.services.storage_backends import LocalStorage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path / 'store'))
+    monkeypatch.setattr(file_storage, 'storage', backend)
+    return backend
+
+
+def upload(tmp_path, content, name='upload'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path), hashlib.sha256(content).hexdigest(), len(content)
+
+
+def blob_counter():
+    counter = db.session.get(StorageCounter, ('blobs', 'all'))
+    return (counter.file_count, counter.total_bytes) if counter else (0, 0)
+
+
+def test_duplicate_content_is_stored_and_counted_once(app, store, tmp_path):
+    with app.app_context():
+        first = upload(tmp_path, b'scan', 'a')
+        key = file_storage.store_file(*first)
+        db.session.commit()
+        second = upload(tmp_path, b'scan', 'b')
+        assert file_storage.store_file(*second) == key
+        db.session.commit()
+
+        assert store.open(key).read() == b'scan'
+        assert not (tmp_path / 'b').exists()
+        assert db.session.get(FileBlob, first[1]).ref_count == 2
+        assert blob_counter() == (1, 4)
+
+
+def test_orphan_file_at_the_key_is_overwritten(app, store, tmp_path):
+    with app.app_context():
+        source, sha256, size = upload(tmp_path, b'report')
+        # Left behind by an upload that died after writing the file
+        with open(upload(tmp_path, b'garbage', 'old')[0], 'rb') as stale:
+            store.put_stream(file_storage.blob_key(sha256), stale)
+        key = file_storage.store_file(source, sha256, size)
+        db.session.commit()
+        assert store.open(key).read() == b'report'
+
+
+def test_rollback_removes_only_the_file_it_wrote(app, store, tmp_path):
+    with app.app_context():
+        kept = file_storage.store_file(*upload(tmp_path, b'kept', 'a'))
+        db.session.commit()
+
+        new = file_storage.store_file(*upload(tmp_path, b'new', 'b'))
+        assert file_storage.store_file(*upload(tmp_path, b'kept', 'c')) == kept
+        db.session.rollback()
+
+        assert not store.exists(new)
+        assert store.exists(kept)
+        assert blob_counter() == (1, 4)
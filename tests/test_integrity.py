@@ -0,0 +1,69 @@
+import functools
+import hashlib
+import os
+import time
+import pytest
+from src.database import db
+from src.models.medical_files import FileBlob
+from src.services import integrity
+
+CONTENT = b'DICM' * 1024
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(integrity, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(integrity, 'Checkpoint',
+                        functools.partial(integrity.Checkpoint, path=str(tmp_path / 'checkpoint.json')))
+    return tmp_path
+
+
+@pytest.fixture
+def blob(app, uploads):
+    """One stored blob, written long enough ago to be past the orphan grace period"""
+    path = uploads / 'blobs' / SHA256[:2] / SHA256
+    path.parent.mkdir(parents=True)
+    path.write_bytes(CONTENT)
+    past = time.time() - 2 * integrity.ORPHAN_GRACE_SECONDS
+    os.utime(path, (past, past))
+    os.utime(path.parent, (past, past))
+    with app.app_context():
+        db.session.add(FileBlob(sha256=SHA256, size=len(CONTENT), storage_path=f'blobs/{SHA256[:2]}/{SHA256}', ref_count=0))
+        db.session.commit()
+    return path
+
+
+def scan(app, **options):
+    with app.app_context():
+        return integrity.UploadScanner(db.engine, **options).run()
+
+
+def test_unchanged_directories_are_skipped_on_the_next_run(app, blob):
+    first = scan(app)
+    assert first['bytes_hashed'] == len(CONTENT)
+    assert first['units_skipped'] == 0
+
+    second = scan(app)
+    assert second['bytes_hashed'] == 0
+    assert second['units_scanned'] == 1  # incoming
+
+
+def test_a_directory_that_changed_is_scanned_again(app, blob):
+    scan(app)
+    blob.unlink()
+    report = scan(app)
+    assert report['missing'] == 1
+
+
+def test_directories_are_rescanned_after_the_interval(app, blob, monkeypatch):
+    scan(app)
+    monkeypatch.setattr(integrity, 'FULL_SCAN_INTERVAL_DAYS', 0)
+    report = scan(app)
+    assert report['units_skipped'] == 0
+    assert report['bytes_hashed'] == len(CONTENT)
+
+
+def test_no_verify_pass_does_not_count_as_a_scan(app, blob):
+    scan(app, verify_hashes=False)
+    assert scan(app)['bytes_hashed'] == len(CONTENT)
@@ -0,0 +1,62 @@
+import json
+import os
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from src.database import db
+from src.utils import metrics
+
+
+def test_failed_statements_leave_nothing_on_the_connection(app):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM no_such_table'))
+            assert conn.execute(text('SELECT 1')).scalar() == 1
+            assert not any(isinstance(value, list) for value in conn.info.values())
+
+
+def test_slow_statements_are_timed_after_a_failure(app, monkeypatch):
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_MS', 0)
+    before = dict(metrics.SLOW_QUERIES._values)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+            conn.execute(text('SELECT 1'))
+    assert metrics.SLOW_QUERIES._values[('background',)] == before.get(('background',), 0) + 1
+
+
+def scrape(client):
+    body = client.get('/internal/metrics').get_data(as_text=True)
+    return dict(line.rsplit(' ', 1) for line in body.splitlines() if line and not line.startswith('#'))
+
+
+def test_series_are_the_same_from_scrape_to_scrape(admin_client):
+    admin_client.get('/api/auth/me')
+    first = scrape(admin_client)
+    assert not any('pid=' in name for name in first)
+    assert set(first) <= set(scrape(admin_client))
+
+
+def test_metrics_dir_adds_up_every_worker(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, '_snapshot_path', None)
+    # No background flush thread; the scrape writes this worker's file itself
+    monkeypatch.setattr(metrics, '_flusher_pid', os.getpid())
+    admin_client.get('/api/auth/me')
+    series = 'http_requests_total{method="GET",endpoint="auth.get_current_user",status="200"}'
+    own = int(scrape(admin_client)[series])
+
+    # A worker that has exited: its counters still count, its gauges no longer do
+    (tmp_path / '999999999-1.json').write_text(json.dumps({
+        'pid': 999999999,
+        'metrics': {'http_requests_total': [[['GET', 'auth.get_current_user', 200], 5]]},
+        'samples': [['db_pool_waits_total', 'counter', 3], ['db_pool_checked_out', 'gauge', 7]]
+    }))
+    merged = scrape(admin_client)
+    assert int(merged[series]) == own + 5
+    assert int(merged.get('db_pool_waits_total', 0)) >= 3
+    assert int(merged.get('db_pool_checked_out', 0)) < 7
+    assert len(list(tmp_path.glob('*.json'))) == 2
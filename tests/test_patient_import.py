@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+from src.models.patient import Patient
+
+
+def import_csv(client, text):
+    return client.post('/api/patients/bulk?format=csv', data=text.encode(), content_type='text/csv')
+
+
+def test_repeated_national_id_in_a_batch_is_reported(app, admin_client):
+    body = '\n'.join(json.dumps(row, ensure_ascii=False) for row in [
+        {'name': 'أحمد', 'age': 30, 'national_id': '111'},
+        {'name': 'سارة', 'age': 25, 'national_id': '222'},
+        {'name': 'أحمد علي', 'age': 31, 'national_id': '111'},
+    ])
+    response = admin_client.post('/api/patients/bulk', data=body.encode(), content_type='application/x-ndjson')
+
+    assert response.status_code == 207
+    summary = response.get_json()
+    assert (summary['inserted'], summary['updated']) == (2, 0)
+    assert [error['line'] for error in summary['errors']] == [1]
+    with app.app_context():
+        assert Patient.query.filter_by(national_id='111').one().name == 'أحمد علي'
+
+
+def test_csv_update_keeps_columns_missing_from_the_file(app, admin_client):
+    import_csv(admin_client, 'name,age,phone,national_id,blood_type\nأحمد,30,0501234567,111,A+\n')
+    response = import_csv(admin_client, 'name,age,national_id\nأحمد,31,111\n')
+
+    assert response.get_json() == {'inserted': 0, 'updated': 1, 'errors': []}
+    with app.app_context():
+        patient = Patient.query.one()
+        assert (patient.age, patient.phone, patient.blood_type) == (31, '0501234567', 'A+')
+        assert '0501234567' in patient.search_text
+
+
+def test_export_round_trips_through_import(app, admin_client):
+    import_csv(admin_client, 'name,age,phone,national_id\nأحمد,30,0501,111\nسارة,25,,222\n')
+
+    exported = admin_client.get('/api/patients/export?format=csv').get_data(as_text=True)
+    rows = list(csv.DictReader(io.StringIO(exported)))
+    assert [(row['name'], row['national_id']) for row in rows] == [('أحمد', '111'), ('سارة', '222')]
+
+    lines = admin_client.get('/api/patients/export?format=ndjson').get_data(as_text=True).splitlines()
+    assert [json.loads(line)['phone'] for line in lines] == ['0501', None]
+
+    assert import_csv(admin_client, exported).get_json() == {'inserted': 0, 'updated': 2, 'errors': []}
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import pytest
+from src.database import db
+from src.services import file_storage, resumable_uploads
+from src.services.resumable_uploads import merge_range, missing_ranges, part_path
+from src.services.storage_backends import LocalStorage
+
+CONTENT = os.urandom(300 * 1024)
+CHUNK = 100 * 1024
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path / 'store'))
+    monkeypatch.setattr(file_storage, 'storage', backend)
+    return backend
+
+
+def start(client):
+    response = client.post('/api/patients/1/uploads', json={'file_name': 'ct.pdf', 'file_size': len(CONTENT),
+                                                             'category': 'radiology'})
+    assert response.status_code == 201
+    return response.get_json()['upload_id']
+
+
+def send(client, upload_id, offset):
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}', data=CONTENT[offset:offset + CHUNK])
+
+
+def test_ranges_merge_and_report_gaps():
+    ranges = merge_range(merge_range([], 200, 300), 0, 100)
+    assert ranges == [[0, 100], [200, 300]]
+    assert missing_ranges(ranges, 400) == [[100, 200], [300, 400]]
+    assert merge_range(ranges, 100, 200) == [[0, 300]]
+
+
+def test_chunks_in_any_order_with_a_retry(admin_client, seed_patients, store):
+    seed_patients(1)
+    upload_id = start(admin_client)
+    send(admin_client, upload_id, 2 * CHUNK)
+    progress = send(admin_client, upload_id, 0).get_json()
+    assert progress['missing_ranges'] == [[CHUNK, 2 * CHUNK]]
+    assert progress['next_offset'] == CHUNK
+    send(admin_client, upload_id, 0)
+    assert send(admin_client, upload_id, CHUNK).get_json()['complete']
+
+    response = admin_client.post(f'/api/uploads/{upload_id}/complete',
+                                 json={'sha256': hashlib.sha256(CONTENT).hexdigest()})
+    assert response.status_code == 201
+    stored = response.get_json()['file']
+    assert stored['file_size'] == len(CONTENT)
+    with store.open(file_storage.blob_key(hashlib.sha256(CONTENT).hexdigest())) as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(part_path(upload_id))
+
+
+def test_incomplete_or_mismatched_uploads_are_refused(admin_client, seed_patients, store):
+    seed_patients(1)
+    upload_id = start(admin_client)
+    send(admin_client, upload_id, 0)
+    assert admin_client.post(f'/api/uploads/{upload_id}/complete').status_code == 400
+
+    send(admin_client, upload_id, CHUNK)
+    send(admin_client, upload_id, 2 * CHUNK)
+    response = admin_client.post(f'/api/uploads/{upload_id}/complete', json={'sha256': '0' * 64})
+    assert response.status_code == 400
+
+    assert admin_client.delete(f'/api/uploads/{upload_id}').status_code == 200
+    assert not os.path.exists(part_path(upload_id))
+
+
+def test_chunks_outside_the_file_are_rejected(admin_client, seed_patients, store):
+    seed_patients(1)
+    upload_id = start(admin_client)
+    response = admin_client.put(f'/api/uploads/{upload_id}?offset={len(CONTENT) - 10}', data=CONTENT[:CHUNK])
+    assert response.status_code == 400
+    admin_client.delete(f'/api/uploads/{upload_id}')
+
+
+def test_failed_commit_keeps_the_session_and_its_part(admin_client, seed_patients, store, monkeypatch):
+    seed_patients(1)
+    upload_id = start(admin_client)
+    for offset in range(0, len(CONTENT), CHUNK):
+        send(admin_client, upload_id, offset)
+
+    def failing_commit():
+        raise RuntimeError('database went away')
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', failing_commit)
+        assert admin_client.post(f'/api/uploads/{upload_id}/complete').status_code == 500
+
+    key = file_storage.blob_key(hashlib.sha256(CONTENT).hexdigest())
+    assert not store.exists(key)
+    assert os.path.exists(part_path(upload_id))
+    assert admin_client.post(f'/api/uploads/{upload_id}/complete').status_code == 201
+    assert store.exists(key)
+    assert not os.path.exists(part_path(upload_id))
+
+
+def test_reserved_bytes_are_capped_per_user(admin_client, seed_patients, store, monkeypatch):
+    seed_patients(1)
+    monkeypatch.setattr(resumable_uploads, 'UPLOAD_RESERVED_BYTES_PER_USER', 2 * len(CONTENT))
+    first, second = start(admin_client), start(admin_client)
+
+    response = admin_client.post('/api/patients/1/uploads', json={'file_name': 'ct.pdf', 'file_size': len(CONTENT)})
+    assert response.status_code == 413
+    admin_client.delete(f'/api/uploads/{first}')
+    for upload_id in (second, start(admin_client)):
+        admin_client.delete(f'/api/uploads/{upload_id}')
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime, timedelta
+from src.routes import patient as patient_routes
+from src.services import scheduler
+from src.services.scheduler import RoomSchedule, parse_duration
+
+
+def book(client, room, day, at, duration='1 ساعة', **extra):
+    return client.post('/api/surgeries', json=dict({
+        'patient_id': 1, 'surgery_type': 'x', 'surgery_date': day, 'surgery_time': at,
+        'duration': duration, 'operating_room': room
+    }, **extra))
+
+
+def test_compact_and_arabic_durations():
+    assert parse_duration('1h30m') == 90
+    assert parse_duration('2 hours 15 min') == 135
+    assert parse_duration('2hrs') == 120
+    assert parse_duration('ساعة و 30 دقيقة') == 90
+
+
+def test_overlapping_matches_brute_force():
+    random.seed(7)
+    base = datetime(2025, 1, 1)
+    schedule = RoomSchedule()
+    bookings = []
+    for surgery_id in range(300):
+        start = base + timedelta(minutes=random.randrange(0, 3 * 24 * 60))
+        # A few very long bookings spanning many short ones
+        end = start + timedelta(minutes=random.choice([30, 60, 90, 24 * 60]))
+        schedule.add(start, end, surgery_id)
+        bookings.append((start, end, surgery_id))
+
+    for _ in range(200):
+        start = base + timedelta(minutes=random.randrange(0, 3 * 24 * 60))
+        end = start + timedelta(minutes=random.randrange(1, 240))
+        expected = {surgery_id for s, e, surgery_id in bookings if s < end and e > start}
+        assert set(schedule.overlapping(start, end)) == expected
+
+
+def test_conflict_across_midnight(admin_client, seed_patients):
+    seed_patients(1)
+    assert book(admin_client, 'OR-A', '2025-03-01', '23:00', '3 ساعات').status_code == 201
+    response = book(admin_client, 'OR-A', '2025-03-02', '01:00')
+    assert response.status_code == 409
+
+
+def test_next_free_slot_ignores_the_surgery_being_moved(admin_client, seed_patients):
+    seed_patients(1)
+    book(admin_client, 'OR-B', '2025-03-01', '09:00')
+    moved = book(admin_client, 'OR-B', '2025-03-01', '10:00').get_json()
+
+    response = admin_client.put(f"/api/surgeries/{moved['id']}", json={'surgery_time': '09:30'})
+    assert response.status_code == 409
+    # 10:00 is free once the moved surgery no longer counts at its old time
+    assert response.get_json()['next_free_slot'] == '2025-03-01T10:00:00'
+
+
+def test_durations_above_the_limit_are_refused(admin_client, seed_patients):
+    seed_patients(1)
+    response = book(admin_client, 'OR-C', '2025-03-01', '08:00', '30 ساعة')
+    assert response.status_code == 400
+
+
+def test_lookback_covers_the_longest_allowed_surgery(admin_client, seed_patients, monkeypatch):
+    seed_patients(1)
+    monkeypatch.setattr(scheduler, 'MAX_SURGERY_MINUTES', 3 * 24 * 60)
+    monkeypatch.setattr(scheduler, 'LOOKBACK_DAYS', 3)
+    monkeypatch.setattr(patient_routes, 'MAX_SURGERY_MINUTES', 3 * 24 * 60)
+
+    assert book(admin_client, 'OR-D', '2025-03-01', '08:00', '48 ساعة').status_code == 201
+    assert book(admin_client, 'OR-D', '2025-03-03', '07:00').status_code == 409
+    assert book(admin_client, 'OR-D', '2025-03-03', '08:00').status_code == 201
@@ -0,0 +1,63 @@
+import pytest
+from src.database import db
+from src.models.patient import Patient
+from src.services.search import InMemoryPatientIndex
+from src.utils.arabic import normalize_arabic, patient_search_text
+
+
+@pytest.mark.parametrize('typed, stored', [
+    ('أحمد', 'احمد'),
+    ('إبراهيم', 'ابراهيم'),
+    ('آمنة', 'امنه'),
+    ('مصطفى', 'مصطفي'),
+    ('فاطمة', 'فاطمه'),
+    ('مُحَمَّد', 'محمد'),
+    ('محـــمد', 'محمد'),
+    ('مؤمن', 'مومن'),
+    ('  علي،  حسن ', 'علي حسن'),
+    ('٠٥٠١٢٣', '050123'),
+])
+def test_normalization_folds_spelling_variants(typed, stored):
+    assert normalize_arabic(typed) == stored
+
+
+def test_search_text_keeps_only_phone_digits():
+    assert patient_search_text('فاطمة', '+966 50-123', 'A1') == 'فاطمه 96650123 a1'
+
+
+def add_patients(app, *names):
+    with app.app_context():
+        db.session.add_all([Patient(name=name, age=30) for name in names])
+        db.session.commit()
+
+
+def search(client, query):
+    response = client.get('/api/patients/search', query_string={'q': query})
+    assert response.status_code == 200
+    return [patient['name'] for patient in response.get_json()]
+
+
+def test_variants_find_each_other(app, admin_client):
+    add_patients(app, 'فاطمة الزهراء', 'فاطمه حسن', 'مُصْطَفَى إبراهيم', 'خالد')
+
+    assert sorted(search(admin_client, 'فاطمه')) == ['فاطمة الزهراء', 'فاطمه حسن']
+    assert search(admin_client, 'فاطمة حسن') == ['فاطمه حسن']
+    assert search(admin_client, 'مصطفي ابراهيم') == ['مُصْطَفَى إبراهيم']
+    assert search(admin_client, 'خا') == ['خالد']
+
+
+def test_exact_name_ranks_first(app, admin_client):
+    add_patients(app, 'محمد أحمدي', 'أحمد علي حسن', 'أحمد')
+    results = search(admin_client, 'احمد')
+    assert results[0] == 'أحمد'
+    assert sorted(results) == sorted(['محمد أحمدي', 'أحمد علي حسن', 'أحمد'])
+
+
+def test_memory_index_prefers_word_starts_then_shorter_texts():
+    index = InMemoryPatientIndex()
+    index.add(1, 'محمد احمدي')
+    index.add(2, 'احمد')
+    index.add(3, 'الاحمد')
+    assert index.search('أحمد') == [2, 1, 3]
+    index.remove(2)
+    assert index.search('أحمد') == [1, 3]
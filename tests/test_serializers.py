@@ -0,0 +1,51 @@
+import json
+import pytest
+from src.database import db
+from src.models.medical_files import MedicalFile
+from src.utils.serializers import MODEL_FIELDS
+
+LIST_ENDPOINTS = [
+    '/api/patients',
+    '/api/clinic-visits',
+    '/api/ward-admissions',
+    '/api/surgeries',
+    '/api/emergency-cases',
+]
+
+
+@pytest.mark.parametrize('url', LIST_ENDPOINTS)
+@pytest.mark.parametrize('query', ['', '?limit=50', '?stream=1'])
+def test_list_statement_count_does_not_grow_with_rows(admin_client, seed_patients, count_statements, url, query):
+    """Serializing a list must not issue one query per row (no lazy loads in to_dict)"""
+    def fetch():
+        response = admin_client.get(url + query)
+        assert response.status_code == 200
+        return json.loads(response.get_data())
+
+    seed_patients(3)
+    _, few = count_statements(fetch)
+    seed_patients(20, start=3)
+    body, many = count_statements(fetch)
+
+    assert many == few
+    assert many <= 5
+    rows = body['items'] if isinstance(body, dict) else body
+    assert len(rows) == 23
+
+
+@pytest.mark.parametrize('url', LIST_ENDPOINTS)
+def test_list_returns_every_row(admin_client, seed_patients, url):
+    seed_patients(7)
+    rows = admin_client.get(url).get_json()
+    assert len(rows) == 7
+
+
+def test_model_fields_are_the_columns_of_to_dict_in_order(app, seed_patients):
+    seed_patients(1)
+    with app.app_context():
+        db.session.add(MedicalFile(patient_id=1, uploaded_by=1, file_name='a.pdf', file_path='a',
+                                   file_type='pdf', category='report'))
+        db.session.commit()
+        for model, fields in MODEL_FIELDS.items():
+            columns = set(model.__table__.columns.keys())
+            assert [key for key in model.query.first().to_dict() if key in columns] == list(fields), model
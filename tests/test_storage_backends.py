@@ -0,0 +1,37 @@
+import os
+import pytest
+from src.services.storage_backends import LocalObjectStorage, LocalStorage
+
+
+@pytest.fixture
+def local(tmp_path):
+    backend = LocalStorage(str(tmp_path / 'uploads'))
+    os.makedirs(os.path.join(backend.root, 'patient_1'))
+    with open(os.path.join(backend.root, 'patient_1', 'scan.pdf'), 'wb') as f:
+        f.write(b'%PDF')
+    return backend
+
+
+def test_relative_keys_resolve_under_the_root(local):
+    assert local.local_path('patient_1/scan.pdf') == os.path.join(local.root, 'patient_1', 'scan.pdf')
+    assert local.open('patient_1/scan.pdf').read() == b'%PDF'
+
+
+def test_legacy_absolute_paths_under_the_root_still_work(local):
+    legacy = os.path.join(local.root, 'patient_1', 'scan.pdf')
+    assert local.local_path(legacy) == legacy
+    assert local.size(legacy) == 4
+
+
+@pytest.mark.parametrize('key', ['/etc/passwd', '../secrets.env', 'patient_1/../../secrets.env'])
+def test_keys_outside_the_root_are_rejected(local, key):
+    with pytest.raises(ValueError):
+        local.local_path(key)
+    with pytest.raises(ValueError):
+        local.delete(key)
+
+
+def test_object_store_rejects_absolute_keys(tmp_path):
+    backend = LocalObjectStorage(str(tmp_path), secret='test')
+    with pytest.raises(ValueError):
+        backend.size(os.path.join(str(tmp_path), 'blobs', 'ab'))
@@ -0,0 +1,51 @@
+import os
+import time
+from contextlib import contextmanager
+import pytest
+from src.services import thumbnails
+
+pytest.importorskip('PIL')
+from PIL import Image  # noqa: E402
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(thumbnails, 'INCOMING_FOLDER', str(tmp_path / 'incoming'))
+    os.makedirs(thumbnails.INCOMING_FOLDER)
+    return tmp_path
+
+
+def test_work_files_stay_out_of_the_served_directory(folders, monkeypatch):
+    image = folders / 'photo.png'
+    Image.new('RGB', (1200, 900), 'white').save(image)
+    workdirs = []
+
+    @contextmanager
+    def content(key, workdir=None):
+        workdirs.append(workdir)
+        yield str(image)
+    monkeypatch.setattr(thumbnails, 'local_content', content)
+
+    thumbnails.generate_thumbnails('blobs/ab/abc', 'image', 7, 3)
+    assert os.path.dirname(workdirs[0]) == thumbnails.INCOMING_FOLDER
+    assert sorted(os.listdir(thumbnails.thumbnail_dir(7))) == ['3_large.jpg', '3_medium.jpg', '3_small.jpg']
+
+
+def test_failures_of_background_jobs_are_logged(folders, monkeypatch, caplog):
+    @contextmanager
+    def missing(key, workdir=None):
+        raise FileNotFoundError(key)
+        yield
+    monkeypatch.setattr(thumbnails, 'local_content', missing)
+
+    future = thumbnails.schedule_thumbnails('blobs/ab/abc', 'photo.png', 7, 4)
+    with pytest.raises(FileNotFoundError):
+        future.result(timeout=5)
+    # Callbacks run right after the waiters are woken up
+    for _ in range(50):
+        if caplog.records:
+            break
+        time.sleep(0.01)
+    assert 'file 4' in caplog.records[0].getMessage()
+    assert caplog.records[0].exc_info[0] is FileNotFoundError
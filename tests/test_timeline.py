@@ -0,0 +1,36 @@
+from datetime import date, datetime, time
+from src.database import db
+from src.models.patient import ClinicVisit, EmergencyCase, Patient, Surgery
+
+
+def test_timeline_pages_cover_every_encounter_once_newest_first(app, admin_client):
+    with app.app_context():
+        patient = Patient(name='مريض', age=40)
+        db.session.add(patient)
+        db.session.flush()
+        for day in range(1, 11):
+            db.session.add_all([
+                ClinicVisit(patient_id=patient.id, visit_date=date(2025, 1, day), visit_time=time(9)),
+                # Same instant as the visit: ties are broken by kind, then id
+                Surgery(patient_id=patient.id, surgery_type='x', surgery_date=date(2025, 1, day),
+                        surgery_time=time(9), operating_room=f'OR{day}'),
+                EmergencyCase(patient_id=patient.id, complaint='c', priority='عادي',
+                              arrival_time=datetime(2025, 1, day, 22)),
+            ])
+        db.session.commit()
+        patient_id = patient.id
+
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/patients/{patient_id}/timeline?limit=4' + (f'&before={cursor}' if cursor else '')
+        page = admin_client.get(url).get_json()
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert len(seen) == 30
+    assert len({(item['type'], item['id']) for item in seen}) == 30
+    assert seen[0]['type'] == 'emergency_case'
+    assert [item['at'] for item in seen] == sorted((item['at'] for item in seen), reverse=True)
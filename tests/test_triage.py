@@ -0,0 +1,43 @@
+import random
+from datetime import datetime, timedelta
+from src.services.triage import TriageQueue
+
+
+def test_heap_stays_in_triage_order_through_updates_and_removals():
+    random.seed(3)
+    queue = TriageQueue()
+    start = datetime(2025, 1, 1)
+    expected = {}
+    for case_id in range(200):
+        entry = (random.randint(1, 5), start + timedelta(minutes=random.randrange(600)), case_id)
+        queue.push(case_id, *entry[:2])
+        expected[case_id] = entry
+    for case_id in random.sample(range(200), 60):
+        entry = (random.randint(1, 5), expected[case_id][1], case_id)
+        queue.push(case_id, *entry[:2])
+        expected[case_id] = entry
+    for case_id in random.sample(range(200), 40):
+        queue.remove(case_id)
+        expected.pop(case_id, None)
+
+    assert queue.ordered() == sorted(expected.values())
+    popped = [queue.pop() for _ in range(len(expected))]
+    assert popped == sorted(expected.values())
+    assert queue.pop() is None
+
+
+def test_queue_and_next_patient_follow_severity(admin_client, seed_patients):
+    seed_patients(1)
+    for priority in ('غير عاجل', 'حرج', 'متوسط'):
+        response = admin_client.post('/api/emergency-cases', json={'patient_id': 1, 'complaint': 'ألم', 'priority': priority})
+        assert response.status_code == 201
+
+    # seed_patients already queued one 'عاجل' case
+    queue = admin_client.get('/api/emergency-cases/queue').get_json()
+    assert [entry['severity'] for entry in queue] == [1, 2, 3, 4]
+    assert queue[0]['case']['priority'] == 'حرج'
+
+    claimed = admin_client.post('/api/emergency-cases/next').get_json()
+    assert claimed['priority'] == 'حرج'
+    assert claimed['status'] == 'قيد التقييم'
+    assert [entry['severity'] for entry in admin_client.get('/api/emergency-cases/queue').get_json()] == [2, 3, 4]